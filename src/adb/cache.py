@@ -0,0 +1,156 @@
+"""
+Per-device cache for probed device details.
+
+Each probe section has a freshness class: build properties and screen size
+never change while a device stays connected, WiFi state changes rarely,
+battery and screen state change all the time. Only stale sections are
+re-probed (still in one adb shell round trip), concurrent viewers of the
+same device share a single probe, and a device's entries are dropped when
+the tracker reports it disconnected or changing state. Callers that need
+only some fields ask for their sections, so reading the screen size never
+waits on a battery probe. A section that came back without all of its
+fields is only trusted for the short TTL, so a failed `getprop` or
+`wm size` is retried instead of staying empty until the device reconnects.
+"""
+import os
+import threading
+import time
+
+from src.adb.client import ADB_COMMAND_TIMEOUT
+from src.adb.probe import PROBE_SECTIONS, probe_device
+from src.adb.tracker import device_registry
+
+# Freshness class -> seconds a cached value stays valid (None = until reconnect)
+FRESHNESS_TTL = {
+    'static': None,
+    'minutes': float(os.environ.get('DEVICE_CACHE_SLOW_TTL', '300')),
+    'seconds': float(os.environ.get('DEVICE_CACHE_FAST_TTL', '15')),
+}
+
+SECTION_FRESHNESS = {
+    'props': 'static',
+    'resolution': 'static',
+    'wifi': 'minutes',
+    'battery': 'seconds',
+    'screen': 'seconds',
+}
+
+
+class DeviceInfoCache:
+    """Probe results per device and section, with single-flight refresh"""
+
+    def __init__(self):
+        self._entries = {}  # device_id -> {section: (values, fetched_at, complete)}
+        self._locks = {}  # device_id -> lock held while probing
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'probes': 0, 'shared': 0}
+
+    def _device_lock(self, device_id):
+        with self._lock:
+            return self._locks.setdefault(device_id, threading.Lock())
+
+    def _stale_sections(self, device_id, sections, now):
+        entries = self._entries.get(device_id, {})
+        stale = []
+        for section in sections:
+            entry = entries.get(section)
+            ttl = FRESHNESS_TTL[SECTION_FRESHNESS.get(section, 'seconds')]
+            if entry is not None and not entry[2]:
+                # Partial result: retry soon, whatever its freshness class
+                ttl = FRESHNESS_TTL['seconds'] if ttl is None else min(ttl, FRESHNESS_TTL['seconds'])
+            if entry is None or (ttl is not None and now - entry[1] > ttl):
+                stale.append(section)
+        return stale
+
+    def get(self, device_id, refresh=False, timeout=ADB_COMMAND_TIMEOUT, sections=None):
+        """Return (values, field_age, error) for a device
+
+        Fresh sections are served from memory; stale ones are probed in one
+        round trip. While one request probes a device, others wait for it
+        instead of starting their own probe. sections limits both the probe
+        and the returned fields to those sections (default: all).
+        """
+        sections = list(PROBE_SECTIONS) if sections is None else [name for name in PROBE_SECTIONS if name in sections]
+        with self._lock:
+            stale = list(sections) if refresh else self._stale_sections(device_id, sections, time.time())
+        error = None
+
+        if stale:
+            lock = self._device_lock(device_id)
+            waited = not lock.acquire(blocking=False)
+            if waited:
+                lock.acquire()
+            try:
+                with self._lock:
+                    # Another request may have probed while we were waiting
+                    if waited:
+                        stale = self._stale_sections(device_id, sections, time.time())
+                        self.stats['shared'] += 1
+                if stale:
+                    values, error = probe_device(device_id, stale, timeout)
+                    fetched_at = time.time()
+                    with self._lock:
+                        self.stats['probes'] += 1
+                        if error is None:
+                            entries = self._entries.setdefault(device_id, {})
+                            for section in stale:
+                                fields = PROBE_SECTIONS[section][2]
+                                section_values = {field: values[field] for field in fields if field in values}
+                                if not section_values:
+                                    # Nothing parsed: keep what we had, probe again next time
+                                    print(f"[DEBUG] Probe section {section} of {device_id} came back empty")
+                                    continue
+                                entries[section] = (section_values, fetched_at, len(section_values) == len(fields))
+            finally:
+                lock.release()
+        else:
+            with self._lock:
+                self.stats['hits'] += 1
+
+        values, field_age = {}, {}
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(device_id, {})
+            for section in sections:
+                if section not in entries:
+                    continue
+                section_values, fetched_at, _ = entries[section]
+                for field, value in section_values.items():
+                    values[field] = value
+                    field_age[field] = round(now - fetched_at, 1)
+        return values, field_age, error
+
+    def resolution(self, device_id, timeout=ADB_COMMAND_TIMEOUT, probe=True):
+        """The device's screen size ("1080x2400"), or None; probes only `wm size`, and only once
+
+        probe=False only looks at the cache and never runs adb.
+        """
+        if not probe:
+            with self._lock:
+                entry = self._entries.get(device_id, {}).get('resolution')
+                return entry[0].get('resolution') if entry else None
+        values, _, _ = self.get(device_id, timeout=timeout, sections=('resolution',))
+        return values.get('resolution')
+
+    def invalidate(self, device_id):
+        with self._lock:
+            self._entries.pop(device_id, None)
+
+    def forget(self, device_id):
+        """Drop everything kept for a device that went away, its probe lock included"""
+        with self._lock:
+            self._entries.pop(device_id, None)
+            self._locks.pop(device_id, None)
+
+
+device_info_cache = DeviceInfoCache()
+
+
+def _invalidate_on_device_event(event, serial, status):
+    if event == 'removed':
+        device_info_cache.forget(serial)
+    else:
+        device_info_cache.invalidate(serial)
+
+
+device_registry.add_listener(_invalidate_on_device_event)
@@ -0,0 +1,741 @@
+"""
+In-process client for the adb server's TCP host protocol.
+
+The `adb` binary is itself only a thin client: it connects to the adb server
+(port 5037 by default), sends a length-prefixed text request and relays the
+reply. Speaking that protocol directly lets the routes run device commands
+without forking /bin/sh and a fresh adb client for every tap or getprop.
+
+Anything the native client does not understand (pipes, redirects, `install`,
+`connect`, ...) still falls back to the adb binary, so run_adb_command() can
+be used as a drop-in replacement for the old subprocess version.
+
+Shell commands go through one long-lived shell per device (ShellSession)
+when the device supports shell v2, so a tap does not pay for opening a new
+shell service every time.
+"""
+import itertools
+import os
+import random
+import select
+import shlex
+import socket
+import stat
+import struct
+import subprocess
+import threading
+import time
+
+ADB_SERVER_HOST = os.environ.get('ADB_SERVER_HOST', '127.0.0.1')
+ADB_SERVER_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', '5037'))
+# Set ADB_NATIVE_CLIENT=0 to always shell out to the adb binary
+ADB_NATIVE_CLIENT = os.environ.get('ADB_NATIVE_CLIENT', '1') != '0'
+ADB_POOL_SIZE = int(os.environ.get('ADB_POOL_SIZE', '4'))
+ADB_COMMAND_TIMEOUT = 30
+# Set ADB_SHELL_SESSIONS=0 to open a new shell for every command
+ADB_SHELL_SESSIONS = os.environ.get('ADB_SHELL_SESSIONS', '1') != '0'
+
+# adb subcommands the native client can serve without the adb binary
+NATIVE_COMMANDS = {'version', 'devices', 'get-state', 'get-serialno', 'shell', 'exec-out', 'pull', 'push'}
+
+# shell v2 packet ids (see adb's shell_protocol.h)
+SHELL_ID_STDIN = 0
+SHELL_ID_STDOUT = 1
+SHELL_ID_STDERR = 2
+SHELL_ID_EXIT = 3
+SHELL_ID_CLOSE_STDIN = 4
+
+SYNC_DATA_MAX = 64 * 1024
+SHELL_STDIN_MAX = 4000  # stdin packet payload that fits adbd's smallest shell buffer
+EXIT_MARKER = ':ADB_EXIT_CODE:'
+SESSION_MARKER = ':ADB_SESSION_DONE'
+
+
+class AdbError(Exception):
+    """The adb server rejected a request (FAIL reply) or broke the protocol"""
+
+
+class AdbConnectionError(AdbError):
+    """The adb server could not be reached"""
+
+
+class AdbTimeoutError(AdbError):
+    """A request did not complete before its deadline"""
+
+
+class AdbConnectionPool:
+    """Keeps a few sockets to the adb server connected ahead of time.
+
+    The adb server binds every socket to exactly one service and closes it
+    when that service ends, so a connection can never be reused. What can be
+    saved is the connect itself: acquire() hands out an already connected
+    socket and a background thread tops the pool back up.
+    """
+
+    def __init__(self, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT, size=ADB_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._refill = threading.Event()
+        self._refill_thread = None
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+    def _connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=5)
+        except OSError as e:
+            raise AdbConnectionError(f'Cannot connect to adb server at {self.host}:{self.port}: {e}')
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _is_alive(sock):
+        """An idle socket that is readable has been closed by the server"""
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def acquire(self):
+        """Return a connected socket, preferring a pre-connected one"""
+        with self._lock:
+            while self._idle:
+                sock = self._idle.pop()
+                if self._is_alive(sock):
+                    self.stats['hits'] += 1
+                    self._wake_refill()
+                    return sock
+                self.stats['stale'] += 1
+                sock.close()
+            self.stats['misses'] += 1
+        sock = self._connect()
+        with self._lock:
+            self._wake_refill()
+        return sock
+
+    def _wake_refill(self):
+        if self.size <= 0:
+            return
+        if self._refill_thread is None or not self._refill_thread.is_alive():
+            self._refill_thread = threading.Thread(target=self._refill_loop, daemon=True)
+            self._refill_thread.start()
+        self._refill.set()
+
+    def _refill_loop(self):
+        while True:
+            self._refill.wait()
+            self._refill.clear()
+            while True:
+                with self._lock:
+                    if len(self._idle) >= self.size:
+                        break
+                try:
+                    sock = self._connect()
+                except AdbConnectionError:
+                    break
+                with self._lock:
+                    self._idle.append(sock)
+
+    def close(self):
+        with self._lock:
+            for sock in self._idle:
+                sock.close()
+            self._idle = []
+
+
+class AdbClient:
+    """Client for the adb server host protocol (host:, shell:, exec:, sync:)"""
+
+    def __init__(self, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT, pool_size=ADB_POOL_SIZE):
+        self.pool = AdbConnectionPool(host, port, pool_size)
+        self.sessions = ShellSessionPool(self)
+        self._features = {}
+
+    # Low level framing
+
+    @staticmethod
+    def _deadline(timeout):
+        return time.monotonic() + timeout if timeout else None
+
+    @staticmethod
+    def _recv(sock, size, deadline=None):
+        """Read up to size bytes, honouring an absolute deadline"""
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AdbTimeoutError('Timed out waiting for adb')
+            sock.settimeout(remaining)
+        else:
+            sock.settimeout(None)
+        try:
+            return sock.recv(size)
+        except socket.timeout:
+            raise AdbTimeoutError('Timed out waiting for adb')
+
+    def _recv_exact(self, sock, size, deadline=None):
+        chunks = []
+        while size > 0:
+            chunk = self._recv(sock, min(size, 65536), deadline)
+            if not chunk:
+                raise AdbError('Connection closed by adb server')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def _recv_all(self, sock, deadline=None):
+        chunks = []
+        while True:
+            chunk = self._recv(sock, 65536, deadline)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def _read_hex_block(self, sock, deadline=None):
+        length = int(self._recv_exact(sock, 4, deadline), 16)
+        return self._recv_exact(sock, length, deadline)
+
+    def _send_request(self, sock, payload, deadline=None):
+        data = payload.encode('utf-8')
+        sock.sendall(b'%04x' % len(data) + data)
+        status = self._recv_exact(sock, 4, deadline)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbError(self._read_hex_block(sock, deadline).decode('utf-8', 'replace'))
+        raise AdbError(f'Unexpected adb reply {status!r}')
+
+    # Host services
+
+    def host_request(self, payload, timeout=ADB_COMMAND_TIMEOUT):
+        """Send a host request that answers with a single length-prefixed string"""
+        deadline = self._deadline(timeout)
+        sock = self.pool.acquire()
+        try:
+            self._send_request(sock, payload, deadline)
+            return self._read_hex_block(sock, deadline).decode('utf-8', 'replace')
+        finally:
+            sock.close()
+
+    @staticmethod
+    def _host_prefix(serial):
+        return f'host-serial:{serial}' if serial else 'host'
+
+    def version(self):
+        return int(self.host_request('host:version'), 16)
+
+    def devices(self):
+        """Return a list of (serial, state) tuples"""
+        return parse_device_list(self.host_request('host:devices'))
+
+    def get_state(self, serial=None):
+        return self.host_request(f'{self._host_prefix(serial)}:get-state')
+
+    def get_serialno(self, serial=None):
+        return self.host_request(f'{self._host_prefix(serial)}:get-serialno')
+
+    def features(self, serial):
+        """Device feature list, cached per serial"""
+        features = self._features.get(serial)
+        if features is None:
+            features = set(self.host_request(f'{self._host_prefix(serial)}:features').split(','))
+            self._features[serial] = features
+        return features
+
+    def track_devices(self):
+        """Yield the full (serial, state) list every time it changes.
+
+        Holds one host:track-devices connection open; the adb server pushes
+        a new list on every connect, disconnect or state change.
+        """
+        sock = self.pool.acquire()
+        try:
+            self._send_request(sock, 'host:track-devices', self._deadline(ADB_COMMAND_TIMEOUT))
+            while True:
+                yield parse_device_list(self._read_hex_block(sock).decode('utf-8', 'replace'))
+        finally:
+            sock.close()
+
+    def forget_device(self, serial):
+        """Drop cached per-device state, e.g. after the device reconnected"""
+        self._features.pop(serial, None)
+        self.sessions.close(serial)
+
+    # Device services
+
+    def open_service(self, serial, service, timeout=ADB_COMMAND_TIMEOUT):
+        """Switch a connection to the device and open a service on it.
+
+        Returns the raw socket; the caller owns it and must close it.
+        """
+        deadline = self._deadline(timeout)
+        sock = self.pool.acquire()
+        try:
+            self._send_request(sock, f'host:transport:{serial}' if serial else 'host:transport-any', deadline)
+            self._send_request(sock, service, deadline)
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        return sock
+
+    def _read_shell_packet(self, sock, deadline=None):
+        """Read one shell v2 packet as (packet_id, payload), or None at EOF"""
+        header = self._recv(sock, 5, deadline)
+        if not header:
+            return None
+        if len(header) < 5:
+            header += self._recv_exact(sock, 5 - len(header), deadline)
+        packet_id, length = struct.unpack('<BI', header)
+        return packet_id, (self._recv_exact(sock, length, deadline) if length else b'')
+
+    def shell(self, serial, command, timeout=ADB_COMMAND_TIMEOUT):
+        """Run a shell command, returning (returncode, stdout, stderr) as bytes"""
+        deadline = self._deadline(timeout)
+        use_v2 = serial is not None and 'shell_v2' in self.features(serial)
+        if not use_v2:
+            return self._shell_legacy(serial, command, deadline, timeout)
+
+        sock = self.open_service(serial, f'shell,v2,raw:{command}', timeout)
+        try:
+            sock.sendall(struct.pack('<BI', SHELL_ID_CLOSE_STDIN, 0))
+            stdout, stderr = [], []
+            returncode = None
+            while returncode is None:
+                packet = self._read_shell_packet(sock, deadline)
+                if packet is None:
+                    break
+                packet_id, payload = packet
+                if packet_id == SHELL_ID_STDOUT:
+                    stdout.append(payload)
+                elif packet_id == SHELL_ID_STDERR:
+                    stderr.append(payload)
+                elif packet_id == SHELL_ID_EXIT:
+                    returncode = payload[0] if payload else 0
+            return (returncode if returncode is not None else 255), b''.join(stdout), b''.join(stderr)
+        finally:
+            sock.close()
+
+    def _shell_legacy(self, serial, command, deadline, timeout):
+        """Old adbd: no exit status in the protocol, so echo it after a marker"""
+        sock = self.open_service(serial, f'shell:{command};echo {EXIT_MARKER}$?', timeout)
+        try:
+            output = self._recv_all(sock, deadline).replace(b'\r\n', b'\n')
+        finally:
+            sock.close()
+        marker = EXIT_MARKER.encode()
+        index = output.rfind(marker)
+        if index < 0:
+            return 255, output, b''
+        status = output[index + len(marker):].strip()
+        output = output[:index]
+        if output.endswith(b'\n'):
+            output = output[:-1]
+        return (int(status) if status.isdigit() else 255), output, b''
+
+    def exec_out(self, serial, command, timeout=ADB_COMMAND_TIMEOUT):
+        """Run a command with a raw, binary-safe stdout (adb exec-out)"""
+        deadline = self._deadline(timeout)
+        sock = self.open_service(serial, f'exec:{command}', timeout)
+        try:
+            return self._recv_all(sock, deadline)
+        finally:
+            sock.close()
+
+    # Sync service
+
+    def _sync_request(self, sock, command, path):
+        data = path.encode('utf-8')
+        sock.sendall(command + struct.pack('<I', len(data)) + data)
+
+    def _sync_fail(self, sock, length, deadline):
+        return AdbError(self._recv_exact(sock, length, deadline).decode('utf-8', 'replace'))
+
+    def stat(self, serial, remote_path, timeout=ADB_COMMAND_TIMEOUT):
+        """Return (mode, size, mtime); mode 0 means the path does not exist"""
+        deadline = self._deadline(timeout)
+        sock = self.open_service(serial, 'sync:', timeout)
+        try:
+            self._sync_request(sock, b'STAT', remote_path)
+            reply = self._recv_exact(sock, 16, deadline)
+            if reply[:4] != b'STAT':
+                raise AdbError(f'Unexpected sync reply {reply[:4]!r}')
+            return struct.unpack('<III', reply[4:])
+        finally:
+            sock.close()
+
+    def pull_bytes(self, serial, remote_path, timeout=ADB_COMMAND_TIMEOUT):
+        """Read a remote file into memory"""
+        deadline = self._deadline(timeout)
+        sock = self.open_service(serial, 'sync:', timeout)
+        try:
+            self._sync_request(sock, b'RECV', remote_path)
+            chunks = []
+            while True:
+                header = self._recv_exact(sock, 8, deadline)
+                packet_id, length = header[:4], struct.unpack('<I', header[4:])[0]
+                if packet_id == b'DATA':
+                    chunks.append(self._recv_exact(sock, length, deadline))
+                elif packet_id == b'DONE':
+                    break
+                elif packet_id == b'FAIL':
+                    raise self._sync_fail(sock, length, deadline)
+                else:
+                    raise AdbError(f'Unexpected sync reply {packet_id!r}')
+            self._sync_request(sock, b'QUIT', '')
+            return b''.join(chunks)
+        finally:
+            sock.close()
+
+    def push_bytes(self, serial, data, remote_path, mode=0o644, mtime=None, timeout=ADB_COMMAND_TIMEOUT, progress=None):
+        """Write bytes to a remote file; progress(bytes_sent) is called after every chunk"""
+        deadline = self._deadline(timeout)
+        sock = self.open_service(serial, 'sync:', timeout)
+        try:
+            self._sync_request(sock, b'SEND', f'{remote_path},{0o100000 | mode}')
+            view = memoryview(data)
+            for offset in range(0, len(data), SYNC_DATA_MAX):
+                chunk = view[offset:offset + SYNC_DATA_MAX]
+                sock.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+                if progress is not None:
+                    progress(offset + len(chunk))
+            sock.sendall(b'DONE' + struct.pack('<I', int(mtime if mtime is not None else time.time())))
+            header = self._recv_exact(sock, 8, deadline)
+            packet_id, length = header[:4], struct.unpack('<I', header[4:])[0]
+            if packet_id == b'FAIL':
+                raise self._sync_fail(sock, length, deadline)
+            if packet_id != b'OKAY':
+                raise AdbError(f'Unexpected sync reply {packet_id!r}')
+            self._sync_request(sock, b'QUIT', '')
+        finally:
+            sock.close()
+
+    def pull(self, serial, remote_path, local_path, timeout=ADB_COMMAND_TIMEOUT):
+        data = self.pull_bytes(serial, remote_path, timeout)
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, os.path.basename(remote_path))
+        with open(local_path, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+    def push(self, serial, local_path, remote_path, timeout=ADB_COMMAND_TIMEOUT):
+        with open(local_path, 'rb') as f:
+            data = f.read()
+        if remote_path.endswith('/'):
+            remote_path += os.path.basename(local_path)
+        st = os.stat(local_path)
+        self.push_bytes(serial, data, remote_path, st.st_mode & 0o777, int(st.st_mtime), timeout)
+        return len(data)
+
+
+class ShellSession:
+    """One long-lived `sh` on a device that runs commands one at a time.
+
+    Each command is written to the shell's stdin followed by markers on
+    stdout (with the exit code) and stderr that show where its output
+    ends. Commands run in a subshell with stdin from /dev/null, so `exit`,
+    `cd` or a command reading stdin cannot disturb the session.
+    """
+
+    def __init__(self, client, serial):
+        self.client = client
+        self.serial = serial
+        self.lock = threading.Lock()  # held while a command runs
+        self.opened = 0
+        self._sock = None
+        self._markers = itertools.count(1)
+        self._salt = '%08x' % random.getrandbits(32)
+
+    @property
+    def alive(self):
+        return self._sock is not None and AdbConnectionPool._is_alive(self._sock)
+
+    def close(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            # close() alone does not wake a command blocked reading the socket in another thread
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def _open(self, timeout):
+        self.close()
+        self._sock = self.client.open_service(self.serial, 'shell,v2,raw:sh', timeout)
+        self.opened += 1
+
+    def run(self, command, timeout=ADB_COMMAND_TIMEOUT):
+        """Run a command, returning (returncode, stdout, stderr) like AdbClient.shell"""
+        deadline = self.client._deadline(timeout)
+        marker = f'{SESSION_MARKER}:{self._salt}:{next(self._markers)}'
+        script = (f'( eval {shlex.quote(command)} ) </dev/null; '
+                  f'echo "{marker} $?"; echo "{marker}" >&2\n').encode('utf-8')
+        packet = b''.join(
+            struct.pack('<BI', SHELL_ID_STDIN, len(script[offset:offset + SHELL_STDIN_MAX])) + script[offset:offset + SHELL_STDIN_MAX]
+            for offset in range(0, len(script), SHELL_STDIN_MAX)
+        )
+        token = marker.encode('utf-8')
+        if not self.alive:
+            # First use, or the shell died since the last command
+            self._open(timeout)
+        try:
+            try:
+                self._sock.sendall(packet)
+            except OSError:
+                # Went away just now; nothing ran yet, so it is safe to send again
+                self._open(timeout)
+                self._sock.sendall(packet)
+            buffers = {SHELL_ID_STDOUT: b'', SHELL_ID_STDERR: b''}
+            while True:
+                stdout, stderr = buffers[SHELL_ID_STDOUT], buffers[SHELL_ID_STDERR]
+                end = stdout.find(token)
+                if end >= 0 and stdout.find(b'\n', end) >= 0 and token in stderr:
+                    break
+                reply = self.client._read_shell_packet(self._sock, deadline)
+                if reply is None or reply[0] == SHELL_ID_EXIT:
+                    raise AdbError('Shell session ended unexpectedly')
+                if reply[0] in buffers:
+                    buffers[reply[0]] += reply[1]
+        except Exception:
+            # Timed out or broken: the shell's state is unknown, start over next time
+            self.close()
+            raise
+        status = stdout[end + len(token):stdout.find(b'\n', end)].strip()
+        return (int(status) if status.isdigit() else 255), stdout[:end], stderr[:stderr.find(token)]
+
+
+class ShellSessionPool:
+    """The ShellSession of every device, used whenever it is idle"""
+
+    def __init__(self, client):
+        self.client = client
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self.stats = {'commands': 0, 'busy': 0, 'opened': 0}
+
+    def run(self, serial, command, timeout=ADB_COMMAND_TIMEOUT):
+        """Run a command in the device's session
+
+        Returns None when the caller should open a shell of its own: the
+        device has no shell v2, or its session is busy with a long command
+        (queueing a tap behind it would defeat the purpose).
+        """
+        if serial is None or 'shell_v2' not in self.client.features(serial):
+            return None
+        with self._lock:
+            session = self.sessions.get(serial)
+            if session is None:
+                session = self.sessions[serial] = ShellSession(self.client, serial)
+        if not session.lock.acquire(blocking=False):
+            self.stats['busy'] += 1
+            return None
+        try:
+            opened = session.opened
+            result = session.run(command, timeout)
+            self.stats['commands'] += 1
+            self.stats['opened'] += session.opened - opened
+            return result
+        finally:
+            session.lock.release()
+
+    def close(self, serial):
+        with self._lock:
+            session = self.sessions.pop(serial, None)
+        if session is not None:
+            session.close()
+
+
+def parse_device_list(output):
+    """Parse `serial<TAB>state` lines as returned by host:devices"""
+    devices = []
+    for line in output.split('\n'):
+        if line.strip() and '\t' in line:
+            serial, state = line.split('\t', 1)
+            devices.append((serial, state.strip()))
+    return devices
+
+
+def split_adb_command(command):
+    """Split an adb command line the way /bin/sh would.
+
+    Returns None when the command relies on the local shell (pipes,
+    redirects, variables, ...), in which case it has to go through the
+    adb binary to keep its old meaning.
+    """
+    if '$' in command or '`' in command:
+        return None
+    try:
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        argv = list(lexer)
+    except ValueError:
+        return None
+    for arg in argv:
+        if arg and all(c in '();<>|&' for c in arg):
+            return None
+    return argv or None
+
+
+adb_client = AdbClient()
+
+
+def _result(success, output='', error='', returncode=0):
+    return {
+        'success': success,
+        'output': output,
+        'error': error,
+        'returncode': returncode
+    }
+
+
+def _decode(data):
+    return data.decode('utf-8', 'replace').replace('\r\n', '\n').strip()
+
+
+def _shell(device_id, command, timeout, persistent):
+    """adb_client.shell, through the device's ShellSession when allowed"""
+    if persistent:
+        result = adb_client.sessions.run(device_id, command, timeout)
+        if result is not None:
+            return result
+    return adb_client.shell(device_id, command, timeout)
+
+
+def _run_native(argv, device_id, timeout, persistent=ADB_SHELL_SESSIONS):
+    """Serve a parsed adb command through the host protocol"""
+    name, args = argv[0], argv[1:]
+    if name == 'version':
+        return _result(True, f'Android Debug Bridge version 1.0.{adb_client.version()}')
+    if name == 'devices':
+        if args:
+            return None
+        lines = ['List of devices attached'] + [f'{serial}\t{state}' for serial, state in adb_client.devices()]
+        return _result(True, '\n'.join(lines))
+    if name == 'get-state':
+        return _result(True, adb_client.get_state(device_id).strip())
+    if name == 'get-serialno':
+        return _result(True, adb_client.get_serialno(device_id).strip())
+    if name == 'shell':
+        if not args or args[0].startswith('-'):
+            return None  # interactive shell or shell options
+        returncode, stdout, stderr = _shell(device_id, ' '.join(args), timeout, persistent)
+        return _result(returncode == 0, _decode(stdout), _decode(stderr), returncode)
+    if name == 'exec-out':
+        # exec: has no exit status; a raw shell v2 stream is just as binary-safe and has one
+        if not args or not device_id or 'shell_v2' not in adb_client.features(device_id):
+            return None
+        returncode, stdout, stderr = adb_client.shell(device_id, ' '.join(args), timeout)
+        return _result(returncode == 0, _decode(stdout), _decode(stderr), returncode)
+    if name == 'pull' and len(args) == 2 and not args[0].startswith('-'):
+        # Directories, symlinks and missing files are left to the adb binary
+        if not stat.S_ISREG(adb_client.stat(device_id, args[0], timeout)[0]):
+            return None
+        start = time.monotonic()
+        size = adb_client.pull(device_id, args[0], args[1], timeout)
+        return _result(True, f'{args[0]}: 1 file pulled, 0 skipped. ({size} bytes in {time.monotonic() - start:.3f}s)')
+    if name == 'push' and len(args) == 2 and not args[0].startswith('-'):
+        if not os.path.isfile(args[0]):
+            return None
+        remote_path = args[1] + os.path.basename(args[0]) if args[1].endswith('/') else args[1]
+        # Only a new file or one replacing a regular file; pushing into a directory is left to the adb binary
+        mode = adb_client.stat(device_id, remote_path, timeout)[0]
+        if mode and not stat.S_ISREG(mode):
+            return None
+        start = time.monotonic()
+        size = adb_client.push(device_id, args[0], remote_path, timeout)
+        return _result(True, f'{args[0]}: 1 file pushed, 0 skipped. ({size} bytes in {time.monotonic() - start:.3f}s)')
+    return None
+
+
+def _run_adb_subprocess(cmd, timeout):
+    """Run a command line through the adb binary"""
+    try:
+        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=timeout)
+
+        success = result.returncode == 0
+        output = result.stdout.strip() if result.stdout else ''
+        error = result.stderr.strip() if result.stderr else ''
+
+        if not success:
+            print(f"[DEBUG] ADB command failed: {cmd}")
+            print(f"[DEBUG] Error output: {error}")
+
+        return _result(success, output, error, result.returncode)
+    except subprocess.TimeoutExpired:
+        print(f"[DEBUG] ADB command timed out: {cmd}")
+        return _result(False, error=f'Command timed out after {timeout} seconds', returncode=-1)
+    except FileNotFoundError:
+        print(f"[DEBUG] ADB not found in PATH")
+        return _result(False, error='ADB not found. Please ensure Android SDK is installed and ADB is in PATH.', returncode=-1)
+    except Exception as e:
+        print(f"[DEBUG] Unexpected error running ADB command: {e}")
+        return _result(False, error=f'Unexpected error: {str(e)}', returncode=-1)
+
+
+def run_adb_shell(script, device_id=None, timeout=ADB_COMMAND_TIMEOUT, persistent=ADB_SHELL_SESSIONS):
+    """Run a remote shell command line verbatim, without local shell parsing
+
+    Unlike run_adb_command('shell ...'), pipes, `;` and `$` in the script are
+    interpreted by the device's shell, not the local one. persistent=False
+    opens a shell of its own instead of using the device's ShellSession.
+    """
+    if ADB_NATIVE_CLIENT:
+        try:
+            returncode, stdout, stderr = _shell(device_id, script, timeout, persistent)
+            return _result(returncode == 0, _decode(stdout), _decode(stderr), returncode)
+        except AdbConnectionError as e:
+            print(f"[DEBUG] {e}, falling back to adb binary")
+        except AdbTimeoutError:
+            return _result(False, error=f'Command timed out after {timeout} seconds', returncode=-1)
+        except AdbError as e:
+            return _result(False, error=f'error: {e}', returncode=1)
+        except OSError as e:
+            return _result(False, error=f'Unexpected error: {str(e)}', returncode=-1)
+
+    prefix = f"adb -s {device_id}" if device_id else "adb"
+    return _run_adb_subprocess(f"{prefix} shell {shlex.quote(script)}", timeout)
+
+
+def run_adb_command(command, device_id=None, timeout=ADB_COMMAND_TIMEOUT, persistent=ADB_SHELL_SESSIONS):
+    """Execute ADB command and return result with enhanced error handling
+
+    Commands are served in-process over the adb server protocol when
+    possible; everything else goes through the adb binary as before.
+    `shell` commands run in the device's ShellSession unless persistent
+    is False.
+    """
+    if device_id:
+        cmd = f"adb -s {device_id} {command}"
+    else:
+        cmd = f"adb {command}"
+
+    print(f"[DEBUG] Executing ADB command: {cmd}")
+
+    if ADB_NATIVE_CLIENT:
+        argv = split_adb_command(command)
+        if argv and argv[0] in NATIVE_COMMANDS:
+            try:
+                result = _run_native(argv, device_id, timeout, persistent)
+                if result is not None:
+                    if not result['success']:
+                        print(f"[DEBUG] ADB command failed: {cmd}")
+                        print(f"[DEBUG] Error output: {result['error']}")
+                    return result
+            except AdbConnectionError as e:
+                # No server running yet; the adb binary will start one
+                print(f"[DEBUG] {e}, falling back to adb binary")
+            except AdbTimeoutError:
+                print(f"[DEBUG] ADB command timed out: {cmd}")
+                return _result(False, error=f'Command timed out after {timeout} seconds', returncode=-1)
+            except AdbError as e:
+                print(f"[DEBUG] ADB command failed: {cmd}")
+                print(f"[DEBUG] Error output: {e}")
+                return _result(False, error=f'error: {e}', returncode=1)
+            except OSError as e:
+                print(f"[DEBUG] Unexpected error running ADB command: {e}")
+                return _result(False, error=f'Unexpected error: {str(e)}', returncode=-1)
+
+    return _run_adb_subprocess(cmd, timeout)
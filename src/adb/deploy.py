@@ -0,0 +1,398 @@
+"""
+APK deployment to many devices.
+
+`adb install` per device, one after the other, re-reads and re-uploads
+the APK every time and reinstalls apps that are already up to date. A
+Deployment instead:
+
+- reads and hashes the APK (or the base and split APKs of an app) once,
+  and takes the package name and version from its binary manifest;
+- checks every device with `dumpsys package` and, when the installed
+  version matches, with the SHA-256 of the installed APK files, and skips
+  devices that already have exactly this build;
+- pushes the bytes over the adb sync protocol and installs them with
+  `pm install`, or for split APKs with an install session the way
+  `adb install-multiple` does, holding the device's package lease so
+  two deployments never install on one device at the same time;
+- works on at most `concurrency` devices at a time, so a USB hub is not
+  saturated, and reports every device's progress and the total throughput.
+"""
+import collections
+import hashlib
+import io
+import itertools
+import os
+import re
+import struct
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from src.adb.client import ADB_NATIVE_CLIENT, adb_client, run_adb_command, run_adb_shell
+from src.adb.locks import lock_manager
+
+DEPLOY_CONCURRENCY = 4
+DEPLOY_MAX_CONCURRENCY = 32
+DEPLOY_TIMEOUT = 300  # seconds for pushing and installing on one device
+DEPLOYMENTS_KEPT = 20
+DEPLOY_REMOTE_DIR = '/data/local/tmp'
+
+# Android resource ids of manifest attributes, for manifests with stripped attribute names
+MANIFEST_ATTRIBUTE_IDS = {0x0101021b: 'versionCode', 0x0101021c: 'versionName'}
+
+
+class ApkError(ValueError):
+    pass
+
+
+def _axml_string(data, pool, index):
+    """String number index of an AXML string pool"""
+    if index == 0xFFFFFFFF:
+        return None
+    start, count, strings_start, utf8 = pool
+    if index >= count:
+        return None
+    offset = start + strings_start + struct.unpack_from('<I', data, start + 28 + 4 * index)[0]
+    if utf8:
+        # UTF-16 length then UTF-8 length, each one or two bytes
+        offset += 2 if data[offset] & 0x80 else 1
+        length = data[offset]
+        if length & 0x80:
+            length = ((length & 0x7F) << 8) | data[offset + 1]
+            offset += 1
+        return data[offset + 1:offset + 1 + length].decode('utf-8', 'replace')
+    length = struct.unpack_from('<H', data, offset)[0]
+    if length & 0x8000:
+        length = ((length & 0x7FFF) << 16) | struct.unpack_from('<H', data, offset + 2)[0]
+        offset += 2
+    return data[offset + 2:offset + 2 + 2 * length].decode('utf-16-le', 'replace')
+
+
+def parse_manifest(data):
+    """Attributes of the <manifest> element of a binary AndroidManifest.xml"""
+    if len(data) < 8 or struct.unpack_from('<H', data, 0)[0] != 0x0003:
+        raise ApkError('Not a binary Android manifest')
+    pool, resource_ids = None, []
+    offset = struct.unpack_from('<H', data, 2)[0]
+    while offset + 8 <= len(data):
+        chunk_type, header_size, size = struct.unpack_from('<HHI', data, offset)
+        if size < 8:
+            break
+        if chunk_type == 0x0001:  # string pool
+            count, _, flags, strings_start = struct.unpack_from('<IIII', data, offset + 8)
+            pool = (offset, count, strings_start, bool(flags & 0x100))
+        elif chunk_type == 0x0180:  # resource ids of the first attribute names
+            resource_ids = struct.unpack_from(f'<{(size - header_size) // 4}I', data, offset + header_size)
+        elif chunk_type == 0x0102 and pool is not None:  # start element
+            ext = offset + header_size
+            name = _axml_string(data, pool, struct.unpack_from('<I', data, ext + 4)[0])
+            if name != 'manifest':
+                raise ApkError('Manifest does not start with <manifest>')
+            attribute_start, attribute_size, attribute_count = struct.unpack_from('<HHH', data, ext + 8)
+            attributes = {}
+            for index in range(attribute_count):
+                position = ext + attribute_start + index * attribute_size
+                name_index, raw_value, _, data_type, value = struct.unpack_from('<IIHxBI', data, position + 4)
+                name = _axml_string(data, pool, name_index)
+                if name_index < len(resource_ids) and resource_ids[name_index] in MANIFEST_ATTRIBUTE_IDS:
+                    name = MANIFEST_ATTRIBUTE_IDS[resource_ids[name_index]]
+                if raw_value != 0xFFFFFFFF:
+                    attributes[name] = _axml_string(data, pool, raw_value)
+                elif data_type == 0x03:
+                    attributes[name] = _axml_string(data, pool, value)
+                elif data_type in (0x10, 0x11):
+                    attributes[name] = str(value)
+            return attributes
+        offset += size
+    raise ApkError('No <manifest> element found')
+
+
+class Apk:
+    """One APK file held in memory, hashed once"""
+
+    def __init__(self, name, data, path=None):
+        self.name = name
+        self.data = data
+        self.path = path  # local copy, for pushing with the adb binary
+        self.size = len(data)
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        self.manifest = {}
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                self.manifest = parse_manifest(archive.read('AndroidManifest.xml'))
+        except (zipfile.BadZipFile, KeyError, ApkError, struct.error) as e:
+            print(f"[DEBUG] Could not read the manifest of {name}: {e}")
+
+    def release(self):
+        """Drop the bytes once nothing will push them again; name, size and hash stay for the status view"""
+        self.data = None
+        self.path = None
+
+    @classmethod
+    def from_file(cls, path, name=None):
+        with open(path, 'rb') as f:
+            return cls(name or os.path.basename(path), f.read(), path)
+
+    @property
+    def package(self):
+        return self.manifest.get('package')
+
+    @property
+    def version_code(self):
+        return self.manifest.get('versionCode')
+
+    @property
+    def split(self):
+        return self.manifest.get('split')
+
+
+def installed_version(device_id, package):
+    """(versionCode, versionName) installed on the device, or (None, None)"""
+    result = run_adb_shell(f"dumpsys package {package} | grep -E 'versionCode=|versionName='", device_id)
+    if not result['success'] and result['error']:
+        raise RuntimeError(result['error'])
+    code = re.search(r'versionCode=(\d+)', result['output'])
+    name = re.search(r'versionName=(\S+)', result['output'])
+    return (code.group(1) if code else None), (name.group(1) if name else None)
+
+
+def installed_hashes(device_id, package):
+    """SHA-256 of every installed APK file of the package, or None if unavailable"""
+    result = run_adb_shell(f'pm path {package}', device_id)
+    paths = [line[len('package:'):].strip() for line in result['output'].split('\n') if line.startswith('package:')]
+    if not paths:
+        return None
+    result = run_adb_shell('sha256sum ' + ' '.join(paths), device_id)
+    if not result['success']:
+        return None
+    return sorted(line.split()[0] for line in result['output'].split('\n') if line.strip())
+
+
+class DeviceDeployment:
+    """Progress of one device"""
+
+    def __init__(self, device_id, total_bytes):
+        self.device_id = device_id
+        self.state = 'queued'  # queued, checking, pushing, installing, installed, skipped, failed
+        self.reason = ''
+        self.error = ''
+        self.installed_version = None
+        self.bytes_sent = 0
+        self.bytes_total = total_bytes
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        finished = self.finished_at or time.time()
+        return {
+            'state': self.state,
+            'reason': self.reason,
+            'error': self.error,
+            'installed_version': self.installed_version,
+            'bytes_sent': self.bytes_sent,
+            'bytes_total': self.bytes_total,
+            'duration_ms': int((finished - self.started_at) * 1000) if self.started_at else None
+        }
+
+
+class Deployment:
+    """Install one app (one APK, or a base APK with splits) on many devices"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, apks, device_ids, concurrency=DEPLOY_CONCURRENCY, force=False, downgrade=False, temp_files=()):
+        if not apks:
+            raise ApkError('No APK given')
+        self.id = str(next(self._ids))
+        # The base APK goes first: it is the one without a split name
+        self.apks = sorted(apks, key=lambda apk: apk.split is not None)
+        packages = {apk.package for apk in self.apks if apk.package}
+        if len(packages) > 1:
+            raise ApkError(f'APKs belong to different packages: {", ".join(sorted(packages))}')
+        self.package = packages.pop() if packages else None
+        self.version_code = self.apks[0].version_code
+        self.version_name = self.apks[0].manifest.get('versionName')
+        self.sha256 = sorted(apk.sha256 for apk in self.apks)
+        self.size = sum(apk.size for apk in self.apks)
+        self.concurrency = max(1, min(int(concurrency), DEPLOY_MAX_CONCURRENCY))
+        self.force = force
+        self.downgrade = downgrade
+        self.devices = {device_id: DeviceDeployment(device_id, self.size) for device_id in dict.fromkeys(device_ids)}
+        self.status = 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self.temp_files = list(temp_files)  # uploaded copies, deleted once the deployment is done
+        self._done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name=f'deploy-{self.id}', daemon=True).start()
+
+    def run(self):
+        self.status = 'running'
+        self.started_at = time.time()
+        print(f"[DEBUG] Deploying {self.package or self.apks[0].name} to {len(self.devices)} devices, {self.concurrency} at a time")
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f'deploy-{self.id}') as executor:
+                list(executor.map(self._deploy_device, self.devices.values()))
+        finally:
+            remove_files(self.temp_files)
+            self.temp_files = []
+            # Finished deployments stay listed; they must not keep every APK in memory
+            for apk in self.apks:
+                apk.release()
+            self.finished_at = time.time()
+            self.status = 'completed'
+            self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _deploy_device(self, device):
+        device.started_at = time.time()
+        owner = f'deploy:{self.id}'
+        try:
+            if self.package and not self.force:
+                device.state = 'checking'
+                with lock_manager.lease(device.device_id, 'package', 'shared', owner, wait=DEPLOY_TIMEOUT):
+                    up_to_date = self._up_to_date(device)
+                if up_to_date:
+                    device.state = 'skipped'
+                    return
+            # One install at a time per device: temp files are named after the APK,
+            # and nothing should launch the app while it is being replaced
+            with lock_manager.lease(device.device_id, 'package', 'exclusive', owner, wait=DEPLOY_TIMEOUT,
+                                    lease=2 * DEPLOY_TIMEOUT):
+                device.state = 'pushing'
+                with lock_manager.lease(device.device_id, 'filesystem', 'shared', owner, wait=DEPLOY_TIMEOUT,
+                                        lease=DEPLOY_TIMEOUT):
+                    remote_paths = self._push(device)
+                device.state = 'installing'
+                try:
+                    self._install(device, remote_paths)
+                finally:
+                    run_adb_shell('rm -f ' + ' '.join(remote_paths), device.device_id)
+            device.state = 'installed'
+            device.installed_version = self.version_code
+        except Exception as e:
+            print(f"[DEBUG] Deployment to {device.device_id} failed: {e}")
+            device.state = 'failed'
+            device.error = str(e)
+        finally:
+            device.finished_at = time.time()
+
+    def _up_to_date(self, device):
+        version_code, version_name = installed_version(device.device_id, self.package)
+        device.installed_version = version_code
+        if version_code is None:
+            device.reason = 'not installed'
+            return False
+        if self.version_code is not None and version_code != self.version_code:
+            device.reason = f'installed version {version_code} ({version_name})'
+            return False
+        hashes = installed_hashes(device.device_id, self.package)
+        if hashes is None:
+            # No sha256sum on the device: trust the version code
+            device.reason = 'same version code'
+            return self.version_code is not None
+        if hashes != self.sha256:
+            device.reason = 'same version, different build'
+            return False
+        device.reason = 'identical APK already installed'
+        return True
+
+    def _push(self, device):
+        remote_paths = []
+        pushed = 0
+        for index, apk in enumerate(self.apks):
+            remote_path = f'{DEPLOY_REMOTE_DIR}/deploy-{apk.sha256[:12]}-{index}.apk'
+            if ADB_NATIVE_CLIENT:
+                progress = lambda sent, base=pushed: setattr(device, 'bytes_sent', base + sent)
+                adb_client.push_bytes(device.device_id, apk.data, remote_path, timeout=DEPLOY_TIMEOUT,
+                                      progress=progress)
+            else:
+                result = run_adb_command(f'push "{apk.path}" {remote_path}', device.device_id, DEPLOY_TIMEOUT)
+                if not result['success']:
+                    raise RuntimeError(result['error'] or 'push failed')
+            pushed += apk.size
+            device.bytes_sent = pushed
+            remote_paths.append(remote_path)
+        return remote_paths
+
+    def _install(self, device, remote_paths):
+        flags = '-r -t' + (' -d' if self.downgrade else '')
+        if len(remote_paths) == 1:
+            self._check(device, run_adb_shell(f'pm install {flags} {remote_paths[0]}', device.device_id, DEPLOY_TIMEOUT))
+            return
+        # Split APKs: one install session, as `adb install-multiple` does
+        result = self._check(device, run_adb_shell(f'pm install-create {flags} -S {self.size}', device.device_id))
+        session = re.search(r'\[(\d+)\]', result['output'])
+        if not session:
+            raise RuntimeError(f"Unexpected install-create output: {result['output']}")
+        session = session.group(1)
+        try:
+            for index, (apk, remote_path) in enumerate(zip(self.apks, remote_paths)):
+                self._check(device, run_adb_shell(
+                    f'pm install-write -S {apk.size} {session} {index}_{apk.split or "base"}.apk {remote_path}',
+                    device.device_id, DEPLOY_TIMEOUT))
+            self._check(device, run_adb_shell(f'pm install-commit {session}', device.device_id, DEPLOY_TIMEOUT))
+        except Exception:
+            run_adb_shell(f'pm install-abandon {session}', device.device_id)
+            raise
+
+    @staticmethod
+    def _check(device, result):
+        output = (result['output'] + '\n' + result['error']).strip()
+        if not result['success'] or 'Failure' in output:
+            raise RuntimeError(output or 'pm failed')
+        return result
+
+    def to_dict(self):
+        devices = {device_id: device.to_dict() for device_id, device in self.devices.items()}
+        states = collections.Counter(device['state'] for device in devices.values())
+        pushed = sum(device['bytes_sent'] for device in devices.values())
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0
+        return {
+            'deployment_id': self.id,
+            'status': self.status,
+            'package': self.package,
+            'version_code': self.version_code,
+            'version_name': self.version_name,
+            'apks': [{'name': apk.name, 'split': apk.split, 'size': apk.size, 'sha256': apk.sha256} for apk in self.apks],
+            'concurrency': self.concurrency,
+            'summary': dict(states, total=len(devices)),
+            'bytes_pushed': pushed,
+            'throughput_mb_s': round(pushed / elapsed / 1e6, 2) if elapsed > 0 else None,
+            'duration_ms': int(elapsed * 1000),
+            'devices': devices
+        }
+
+
+deployments = collections.OrderedDict()  # deployment id -> Deployment
+_deployments_lock = threading.Lock()
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"[DEBUG] Could not remove {path}: {e}")
+
+
+def start_deployment(apks, device_ids, concurrency=DEPLOY_CONCURRENCY, force=False, downgrade=False, wait=False,
+                     temp_files=()):
+    """Create, remember and run a Deployment; in the background unless wait is set
+
+    temp_files are deleted when the deployment finishes.
+    """
+    deployment = Deployment(apks, device_ids, concurrency, force, downgrade, temp_files)
+    with _deployments_lock:
+        deployments[deployment.id] = deployment
+        while len(deployments) > DEPLOYMENTS_KEPT and deployments[next(iter(deployments))].status == 'completed':
+            deployments.popitem(last=False)
+    if wait:
+        deployment.run()
+    else:
+        deployment.start()
+    return deployment
@@ -0,0 +1,669 @@
+"""
+A small fake adb server for development without real hardware.
+
+It speaks enough of the adb host protocol (host:, host-serial:, transport,
+shell:, shell,v2:, exec: and sync:) for the ADB Device Manager to run
+against it. Devices answer shell commands from a table of canned responses.
+
+Run it on the default adb port (stop the real adb server first) with:
+
+    python -m src.adb.fake_server --devices 3
+
+or on another port and point the app at it with ANDROID_ADB_SERVER_PORT.
+"""
+import argparse
+import hashlib
+import re
+import shlex
+import socketserver
+import struct
+import threading
+import time
+import zlib
+
+DEFAULT_FEATURES = ['shell_v2', 'cmd', 'stat_v2', 'ls_v2', 'fixed_push_mkdir', 'apex', 'abb', 'abb_exec']
+
+
+def make_png(width, height, color=(32, 96, 160)):
+    """Build a solid colour PNG without any imaging library"""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    row = b'\x00' + bytes(color) * width
+    raw = row * height
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw))
+            + chunk(b'IEND', b''))
+
+
+class FakeDevice:
+    """A device that answers shell commands from canned responses"""
+
+    def __init__(self, serial, state='device', props=None, width=1080, height=2400, features=None, apk_reader=None):
+        self.serial = serial
+        self.state = state
+        self.width = width
+        self.height = height
+        self.features = list(DEFAULT_FEATURES if features is None else features)
+        self.props = {
+            'ro.product.brand': 'FakeBrand',
+            'ro.product.model': f'Fake {serial}',
+            'ro.build.version.release': '13',
+            'ro.build.version.sdk': '33',
+            'ro.sf.lcd_density': '420',
+        }
+        self.props.update(props or {})
+        self.files = {}
+        self.commands = []
+        self.handlers = {}
+        self.pixels = None  # raw screen contents, see screencap_raw()
+        self.env = {}
+        self.touch_events = []  # (path, type, code, value) written with sendevent
+        self.packages = {}  # package -> {'version_code', 'version_name', 'apks': [bytes]}, see _cmd_pm
+        self.install_sessions = {}
+        # apk_reader(data) -> manifest attributes ('package', 'versionCode', 'versionName'); without one pm cannot install
+        self.apk_reader = apk_reader
+        self.lock = threading.Lock()
+
+    def screencap_png(self):
+        return make_png(self.width // 20, self.height // 20)
+
+    def run(self, command):
+        """Run a shell command line, returning (exit_code, stdout, stderr)
+
+        Understands just enough sh for the app's scripts: `;`, `&&`, `||`,
+        pipes into grep, `$?`, `NAME=value` and `$NAME`, `eval`, `>&2` and
+        other redirects (which are ignored). Subshell parentheses are
+        ignored as well.
+        """
+        with self.lock:
+            self.commands.append(command)
+        return self._execute(command)
+
+    def _execute(self, command):
+        try:
+            lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+            lexer.whitespace_split = True
+            tokens = list(lexer)
+        except ValueError:
+            tokens = command.split()
+
+        code, out, err = 0, b'', b''
+        connector = ';'
+        pipeline = [[]]
+        for token in tokens + [';']:
+            if token in (';', '&&', '||'):
+                if pipeline != [[]]:
+                    if connector == ';' or (connector == '&&') == (code == 0):
+                        pipeline = [words if words[:1] == ['eval'] else [self._expand(word, code) for word in words]
+                                    for words in pipeline]
+                        code, pipe_out, pipe_err = self._run_pipeline(pipeline)
+                        out += pipe_out
+                        err += pipe_err
+                connector = token
+                pipeline = [[]]
+            elif token == '|':
+                pipeline.append([])
+            elif token in ('(', ')'):
+                continue
+            else:
+                pipeline[-1].append(token)
+        return code, out, err
+
+    def _expand(self, word, code):
+        word = word.replace('$?', str(code))
+        return re.sub(r'\$(\w+)', lambda match: self.env.get(match.group(1), ''), word)
+
+    def _run_pipeline(self, pipeline):
+        code, out, err = 0, b'', b''
+        for index, words in enumerate(pipeline):
+            argv = []
+            skip = False
+            to_stderr = False
+            for position, word in enumerate(words):
+                if skip:
+                    skip = False
+                elif word == '>&':
+                    # `>&2` sends stdout to stderr; `2>&1` is ignored
+                    source = argv.pop() if argv and argv[-1].isdigit() else '1'
+                    to_stderr = source == '1' and words[position + 1:position + 2] == ['2']
+                    skip = True
+                elif word in ('>', '>>', '<'):
+                    if argv and argv[-1].isdigit():
+                        argv.pop()
+                    skip = True
+                else:
+                    argv.append(word)
+            if index == 0:
+                code, out, err = self._run_simple(argv)
+            elif argv[:1] == ['grep']:
+                code, out = self._grep(argv[1:], out)
+            if to_stderr:
+                out, err = b'', err + out
+        return code, out, err
+
+    def _run_simple(self, argv):
+        if not argv:
+            return 0, b'', b''
+        if re.match(r'\w+=', argv[0]):
+            name, value = argv[0].split('=', 1)
+            self.env[name] = value
+            return 0, b'', b''
+        handler = self.handlers.get(argv[0]) or getattr(self, '_cmd_' + argv[0].replace('-', '_'), None)
+        if handler is None:
+            return 127, b'', f'/system/bin/sh: {argv[0]}: inaccessible or not found\n'.encode()
+        return handler(argv[1:])
+
+    @staticmethod
+    def _grep(args, data):
+        invert = ignore_case = False
+        limit = None
+        pattern = None
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg == '-v':
+                invert = True
+            elif arg == '-i':
+                ignore_case = True
+            elif arg == '-m':
+                limit = int(args.pop(0))
+            elif arg.startswith('-'):
+                continue
+            elif pattern is None:
+                pattern = arg
+        regex = re.compile(pattern or '', re.IGNORECASE if ignore_case else 0)
+        lines = [line for line in data.decode('utf-8', 'replace').split('\n') if line and bool(regex.search(line)) != invert]
+        if limit is not None:
+            lines = lines[:limit]
+        return (0 if lines else 1), ''.join(line + '\n' for line in lines).encode()
+
+    def _cmd_eval(self, args):
+        return self.run(' '.join(args))
+
+    def _cmd_exit(self, args):
+        return (int(args[0]) if args and args[0].isdigit() else 0), b'', b''
+
+    def _cmd_true(self, args):
+        return 0, b'', b''
+
+    def _cmd_false(self, args):
+        return 1, b'', b''
+
+    def _cmd_echo(self, args):
+        return 0, (' '.join(args) + '\n').encode(), b''
+
+    def _cmd_sleep(self, args):
+        time.sleep(float(args[0]) if args else 0)
+        return 0, b'', b''
+
+    def _cmd_getprop(self, args):
+        if args:
+            return 0, (self.props.get(args[0], '') + '\n').encode(), b''
+        return 0, ''.join(f'[{k}]: [{v}]\n' for k, v in sorted(self.props.items())).encode(), b''
+
+    def _cmd_wm(self, args):
+        if args[:1] == ['size']:
+            return 0, f'Physical size: {self.width}x{self.height}\n'.encode(), b''
+        if args[:1] == ['density']:
+            return 0, f'Physical density: {self.props["ro.sf.lcd_density"]}\n'.encode(), b''
+        return 0, b'', b''
+
+    def _cmd_input(self, args):
+        return 0, b'', b''
+
+    def _cmd_am(self, args):
+        return 0, b'Starting: Intent { }\n', b''
+
+    def _cmd_svc(self, args):
+        return 0, b'', b''
+
+    def _cmd_monkey(self, args):
+        return 0, b'Events injected: 1\n', b''
+
+    def _cmd_dumpsys(self, args):
+        service = args[0] if args else ''
+        if service == 'battery':
+            return 0, b'Current Battery Service state:\n  AC powered: false\n  USB powered: true\n  status: 2\n  level: 87\n', b''
+        if service == 'power':
+            return 0, b'POWER MANAGER (dumpsys power)\n  Display Power: state=ON\n', b''
+        if service == 'wifi':
+            return 0, b'Wi-Fi is enabled\n', b''
+        if service == 'package' and len(args) > 1 and args[1] in self.packages:
+            package = self.packages[args[1]]
+            return 0, (f'Packages:\n  Package [{args[1]}]:\n    versionCode={package["version_code"]} minSdk=21 targetSdk=33\n'
+                       f'    versionName={package["version_name"]}\n').encode(), b''
+        return 0, b'', b''
+
+    def _cmd_pm(self, args):
+        """Package manager: path, install and install sessions (install-create/write/commit/abandon)"""
+        command = args[0] if args else ''
+        words = [arg for arg in args[1:] if not arg.startswith('-')]
+        if command == 'path':
+            package = self.packages.get(words[0] if words else '')
+            if package is None:
+                return 1, b'', b''
+            return 0, ''.join(f'package:/data/app/{words[0]}/{index}.apk\n' for index in range(len(package['apks']))).encode(), b''
+        if command == 'install-create':
+            session = str(1000 + len(self.install_sessions))
+            self.install_sessions[session] = []
+            return 0, f'Success: created install session [{session}]\n'.encode(), b''
+        if command == 'install-write':
+            # pm install-write -S SIZE SESSION NAME PATH
+            words = [arg for arg in args[1:] if not arg.startswith('-')][1:]
+            if words[0] not in self.install_sessions or words[2] not in self.files:
+                return 1, b'', b'Error: no such session or file\n'
+            self.install_sessions[words[0]].append(self.files[words[2]])
+            return 0, b'Success: streamed bytes\n', b''
+        if command == 'install-abandon':
+            self.install_sessions.pop(words[0], None)
+            return 0, b'Success\n', b''
+        if command in ('install', 'install-commit'):
+            if command == 'install':
+                if not words or words[0] not in self.files:
+                    return 1, b'', b'Error: Unable to open file\n'
+                apks = [self.files[words[0]]]
+            else:
+                apks = self.install_sessions.pop(words[0], None)
+                if not apks:
+                    return 1, b'', b'Error: no such session\n'
+            manifest = self.apk_reader(apks[0]) if self.apk_reader else {}
+            if not manifest.get('package'):
+                return 1, b'Failure [INSTALL_PARSE_FAILED_NOT_APK]\n', b''
+            self.packages[manifest['package']] = {'version_code': manifest.get('versionCode'),
+                                                  'version_name': manifest.get('versionName'), 'apks': apks}
+            return 0, b'Success\n', b''
+        return 1, b'', f'Unknown command: {command}\n'.encode()
+
+    def _cmd_sha256sum(self, args):
+        out = ''
+        for path in args:
+            match = re.match(r'/data/app/([^/]+)/(\d+)\.apk$', path)
+            if match and match.group(1) in self.packages:
+                data = self.packages[match.group(1)]['apks'][int(match.group(2))]
+            elif path in self.files:
+                data = self.files[path]
+            else:
+                return 1, out.encode(), f'sha256sum: {path}: No such file or directory\n'.encode()
+            out += f'{hashlib.sha256(data).hexdigest()}  {path}\n'
+        return 0, out.encode(), b''
+
+    def _cmd_cmd(self, args):
+        if args[:2] == ['wifi', 'status']:
+            return 0, b'Wifi is enabled\nWifi is connected to "FakeNet"\n', b''
+        return 255, b'', f"Can't find service: {args[0] if args else ''}\n".encode()
+
+    def _cmd_settings(self, args):
+        return 0, b'1\n', b''
+
+    def screencap_raw(self):
+        """Framebuffer as `screencap` without -p prints it (scaled down like the PNG)"""
+        width, height = self.width // 20, self.height // 20
+        if self.pixels is None or len(self.pixels) != width * height * 4:
+            self.pixels = bytearray(bytes((32, 96, 160, 255)) * (width * height))
+        return struct.pack('<IIII', width, height, 1, 0) + bytes(self.pixels)
+
+    def _cmd_screencap(self, args):
+        paths = [a for a in args if not a.startswith('-')]
+        if '-p' not in args and not paths:
+            return 0, self.screencap_raw(), b''
+        png = self.screencap_png()
+        if paths:
+            self.files[paths[0]] = png
+            return 0, b'', b''
+        return 0, png, b''
+
+    def screenrecord_stream(self, args, fps=30):
+        """Yield a fake raw H.264 stream the way `screenrecord -` writes it
+
+        Parameter sets and a keyframe come first, then one keyframe per
+        second and P frames in between, until --time-limit runs out. The
+        slices are filler, only the NAL structure is realistic.
+        """
+        time_limit = 180
+        if '--time-limit' in args:
+            time_limit = float(args[args.index('--time-limit') + 1])
+        sps = b'\x00\x00\x00\x01\x67\x42\xc0\x1f\x8c\x8d\x40'
+        pps = b'\x00\x00\x00\x01\x68\xce\x3c\x80'
+        started = time.time()
+        frame = 0
+        while time.time() - started < time_limit:
+            if frame % fps == 0:
+                data = (sps + pps if frame == 0 else b'') + b'\x00\x00\x00\x01\x65' + b'\x88' * 2000
+            else:
+                data = b'\x00\x00\x00\x01\x41' + b'\x9a' * 200
+            yield data
+            frame += 1
+            time.sleep(1 / fps)
+
+    def stream(self, command):
+        """Iterator of output chunks for long-running commands, else None"""
+        argv = command.split()
+        if argv[:1] == ['screenrecord'] and argv[-1:] == ['-']:
+            with self.lock:
+                self.commands.append(command)
+            return self.screenrecord_stream(argv[1:])
+        return None
+
+    def _cmd_getevent(self, args):
+        if '-p' not in args:
+            return 1, b'', b'getevent: streaming is not supported by the fake device\n'
+        return 0, (
+            'add device 1: /dev/input/event0\n'
+            '  name:     "gpio-keys"\n'
+            '  events:\n'
+            '    KEY (0001): 0072  0073  0074\n'
+            '  input props:\n'
+            '    <none>\n'
+            'add device 2: /dev/input/event2\n'
+            '  name:     "fake_touchscreen"\n'
+            '  events:\n'
+            '    KEY (0001): 014a\n'
+            '    ABS (0003): 002f  : value 0, min 0, max 9, fuzz 0, flat 0, resolution 0\n'
+            '                0030  : value 0, min 0, max 255, fuzz 0, flat 0, resolution 0\n'
+            '                0035  : value 0, min 0, max 4095, fuzz 0, flat 0, resolution 0\n'
+            '                0036  : value 0, min 0, max 4095, fuzz 0, flat 0, resolution 0\n'
+            '                0039  : value 0, min 0, max 65535, fuzz 0, flat 0, resolution 0\n'
+            '  input props:\n'
+            '    INPUT_PROP_DIRECT\n'
+        ).encode(), b''
+
+    def _cmd_sendevent(self, args):
+        if len(args) != 4:
+            return 1, b'', b'usage: sendevent DEVICE TYPE CODE VALUE\n'
+        self.touch_events.append((args[0], int(args[1]), int(args[2]), int(args[3])))
+        return 0, b'', b''
+
+    def _cmd_test(self, args):
+        return 0, b'', b''
+
+    def _cmd_rm(self, args):
+        for path in args:
+            if not path.startswith('-'):
+                self.files.pop(path, None)
+        return 0, b'', b''
+
+
+class _AdbRequestHandler(socketserver.BaseRequestHandler):
+    """Serves one client connection of the adb host protocol"""
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('client closed connection')
+            data += chunk
+        return data
+
+    def _read_request(self):
+        length = int(self._recv_exact(4), 16)
+        return self._recv_exact(length).decode('utf-8')
+
+    def _okay(self, payload=None):
+        self.request.sendall(b'OKAY')
+        if payload is not None:
+            self._send_block(payload)
+
+    def _send_block(self, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self.request.sendall(b'%04x' % len(payload) + payload)
+
+    def _fail(self, message):
+        self.request.sendall(b'FAIL')
+        self._send_block(message)
+
+    def handle(self):
+        server = self.server.fake
+        try:
+            request = self._read_request()
+            server.log_request(request)
+            if request.startswith('host:transport'):
+                self._handle_transport(server, request)
+            else:
+                self._handle_host(server, request)
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+    def _resolve(self, server, serial):
+        if serial is None:
+            online = [d for d in server.devices.values() if d.state == 'device']
+            if len(online) != 1:
+                self._fail('more than one device/emulator' if online else 'no devices/emulators found')
+                return None
+            return online[0]
+        device = server.devices.get(serial)
+        if device is None:
+            self._fail(f"device '{serial}' not found")
+        return device
+
+    def _handle_host(self, server, request):
+        serial = None
+        if request.startswith('host-serial:'):
+            serial, _, command = request[len('host-serial:'):].rpartition(':')
+        elif request.startswith('host:'):
+            command = request[len('host:'):]
+        else:
+            self._fail(f'unknown host service {request}')
+            return
+
+        if command == 'version':
+            self._okay('%04x' % server.version)
+        elif command in ('devices', 'devices-l'):
+            self._okay(server.device_list())
+        elif command == 'track-devices':
+            self._track_devices(server)
+        elif command in ('get-state', 'get-serialno', 'features'):
+            device = self._resolve(server, serial)
+            if device is None:
+                return
+            if command == 'get-state':
+                self._okay(device.state)
+            elif command == 'get-serialno':
+                self._okay(device.serial)
+            else:
+                self._okay(','.join(device.features))
+        else:
+            self._fail(f'unknown host service {request}')
+
+    def _track_devices(self, server):
+        with server.changed:
+            generation = server.generation
+            self._okay(server.device_list())
+            while not server.stopped:
+                server.changed.wait(0.5)
+                if server.generation != generation:
+                    generation = server.generation
+                    self._send_block(server.device_list())
+
+    def _handle_transport(self, server, request):
+        serial = request[len('host:transport:'):] if request.startswith('host:transport:') else None
+        device = self._resolve(server, serial)
+        if device is None:
+            return
+        if device.state != 'device':
+            self._fail(f"device '{device.serial}' is {device.state}")
+            return
+        self._okay()
+
+        service = self._read_request()
+        server.log_request(service)
+        if service.startswith('shell,v2') and service.split(':', 1)[1] == 'sh':
+            self._okay()
+            self._interactive_shell(device)
+        elif service.startswith('shell,v2'):
+            command = service.split(':', 1)[1]
+            self._okay()
+            code, out, err = device.run(command)
+            for packet_id, data in ((1, out), (2, err)):
+                if data:
+                    self.request.sendall(struct.pack('<BI', packet_id, len(data)) + data)
+            self.request.sendall(struct.pack('<BIB', 3, 1, code & 0xff))
+        elif service.startswith('shell:') or service.startswith('exec:'):
+            command = service.split(':', 1)[1]
+            self._okay()
+            marker = ';echo :ADB_EXIT_CODE:$?'
+            legacy_marker = service.startswith('shell:') and command.endswith(marker)
+            if legacy_marker:
+                command = command[:-len(marker)]
+            stream = device.stream(command) if service.startswith('exec:') else None
+            if stream is not None:
+                for chunk in stream:
+                    self.request.sendall(chunk)
+                return
+            code, out, err = device.run(command)
+            self.request.sendall(out + err)
+            if legacy_marker:
+                self.request.sendall(f':ADB_EXIT_CODE:{code}\n'.encode())
+        elif service == 'sync:':
+            self._okay()
+            self._handle_sync(device)
+        else:
+            self._fail(f'unknown service {service}')
+
+    def _interactive_shell(self, device):
+        """`sh` reading command lines from shell v2 stdin packets"""
+        pending = b''
+        while True:
+            try:
+                header = self._recv_exact(5)
+            except ConnectionError:
+                return
+            packet_id, length = struct.unpack('<BI', header)
+            data = self._recv_exact(length) if length else b''
+            if packet_id == 4:  # stdin closed
+                self.request.sendall(struct.pack('<BIB', 3, 1, 0))
+                return
+            pending += data
+            while b'\n' in pending:
+                line, pending = pending.split(b'\n', 1)
+                code, out, err = device._execute(line.decode('utf-8', 'replace'))
+                # One write per command, as adbd's small packets would otherwise wait on Nagle
+                self.request.sendall(b''.join(
+                    struct.pack('<BI', packet_id, len(output)) + output
+                    for packet_id, output in ((1, out), (2, err)) if output))
+
+    def _handle_sync(self, device):
+        while True:
+            header = self._recv_exact(8)
+            command, length = header[:4], struct.unpack('<I', header[4:])[0]
+            path = self._recv_exact(length).decode('utf-8') if length else ''
+            if command == b'QUIT':
+                return
+            if command == b'STAT':
+                data = device.files.get(path)
+                if data is None:
+                    # A path some file lives under is a directory
+                    prefix = path.rstrip('/') + '/'
+                    mode = 0o040755 if any(name.startswith(prefix) for name in device.files) else 0
+                    self.request.sendall(b'STAT' + struct.pack('<III', mode, 0, 0))
+                else:
+                    self.request.sendall(b'STAT' + struct.pack('<III', 0o100644, len(data), int(time.time())))
+            elif command == b'RECV':
+                data = device.files.get(path)
+                if data is None:
+                    message = f'remote object \'{path}\' does not exist'.encode()
+                    self.request.sendall(b'FAIL' + struct.pack('<I', len(message)) + message)
+                    return
+                for offset in range(0, len(data), 64 * 1024):
+                    chunk = data[offset:offset + 64 * 1024]
+                    self.request.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+                self.request.sendall(b'DONE' + struct.pack('<I', 0))
+            elif command == b'SEND':
+                remote_path = path.rsplit(',', 1)[0]
+                chunks = []
+                while True:
+                    header = self._recv_exact(8)
+                    kind, size = header[:4], struct.unpack('<I', header[4:])[0]
+                    if kind == b'DATA':
+                        chunks.append(self._recv_exact(size))
+                    elif kind == b'DONE':
+                        break
+                    else:
+                        return
+                device.files[remote_path] = b''.join(chunks)
+                self.request.sendall(b'OKAY' + struct.pack('<I', 0))
+            else:
+                return
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeAdbServer:
+    """Threaded fake adb server; use port=0 to pick a free port"""
+
+    def __init__(self, devices=None, host='127.0.0.1', port=0, version=41):
+        self.devices = {}
+        for device in devices or []:
+            self.devices[device.serial] = device
+        self.version = version
+        self.requests = []
+        self._lock = threading.Lock()
+        self.changed = threading.Condition()
+        self.generation = 0
+        self.stopped = False
+        self._server = _ThreadingServer((host, port), _AdbRequestHandler)
+        self._server.fake = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def log_request(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def device_list(self):
+        return ''.join(f'{d.serial}\t{d.state}\n' for d in list(self.devices.values()))
+
+    def _notify(self):
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+
+    def add_device(self, device):
+        self.devices[device.serial] = device
+        self._notify()
+
+    def remove_device(self, serial):
+        self.devices.pop(serial, None)
+        self._notify()
+
+    def set_state(self, serial, state):
+        self.devices[serial].state = state
+        self._notify()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        self._notify()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake adb server for ADB Device Manager development')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5037)
+    parser.add_argument('--devices', type=int, default=2, help='number of fake devices')
+    args = parser.parse_args()
+
+    devices = [FakeDevice(f'FAKE{i:04d}') for i in range(1, args.devices + 1)]
+    server = FakeAdbServer(devices, host=args.host, port=args.port)
+    print(f"[DEBUG] Fake adb server listening on {server.host}:{server.port} with {len(devices)} devices")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Raw framebuffer handling for the live view.
+
+`screencap` without `-p` returns the framebuffer as-is: a small header and
+width x height RGBA pixels. Comparing raw pixels is exact and cheap, so the
+live stream can skip frames that did not change and send only the tiles
+that did. NumPy is used for the tile comparison when it is installed; the
+pure Python fallback compares whole rows first and only splits changed rows
+into tiles.
+"""
+import os
+import struct
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TILE_SIZE = int(os.environ.get('LIVE_STREAM_TILE_SIZE', '128'))
+PNG_COMPRESSION = 1  # zlib level: tiles are small, speed matters more than size
+
+# screencap pixel formats (android.graphics.PixelFormat)
+PIXEL_FORMAT_RGBA_8888 = 1
+PIXEL_FORMAT_RGBX_8888 = 2
+
+
+class RawFrame:
+    """A decoded screencap framebuffer (always 4 bytes per pixel)"""
+
+    __slots__ = ('width', 'height', 'pixels')
+
+    def __init__(self, width, height, pixels):
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+
+    @property
+    def stride(self):
+        return self.width * 4
+
+    def same_size(self, other):
+        return other is not None and other.width == self.width and other.height == self.height
+
+
+def parse_raw_screencap(data):
+    """Parse `screencap` output without -p; raises ValueError if unusable
+
+    The header is width, height and pixel format as little-endian u32, plus
+    a colour space u32 on Android 8 and later.
+    """
+    if len(data) < 12:
+        raise ValueError('Screencap output too short')
+    width, height, pixel_format = struct.unpack_from('<III', data)
+    if pixel_format not in (PIXEL_FORMAT_RGBA_8888, PIXEL_FORMAT_RGBX_8888):
+        raise ValueError(f'Unsupported screencap pixel format {pixel_format}')
+    size = width * height * 4
+    header = len(data) - size
+    if header not in (12, 16):
+        raise ValueError(f'Screencap size {len(data)} does not match {width}x{height}')
+    return RawFrame(width, height, bytes(data[header:]))
+
+
+def _png_chunk(kind, data):
+    body = kind + data
+    return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+
+def encode_png(frame, x=0, y=0, width=None, height=None):
+    """Encode a region of a RawFrame as an RGB PNG
+
+    The screen is opaque, and RGBX framebuffers carry no usable alpha, so
+    the fourth byte of every pixel is dropped.
+    """
+    width = frame.width - x if width is None else width
+    height = frame.height - y if height is None else height
+    stride = frame.stride
+    pixels = frame.pixels
+    start = y * stride + x * 4
+    rows = []
+    for offset in range(start, start + height * stride, stride):
+        row = bytearray(pixels[offset:offset + width * 4])
+        del row[3::4]
+        rows.append(b'\x00')
+        rows.append(row)
+    return (b'\x89PNG\r\n\x1a\n'
+            + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + _png_chunk(b'IDAT', zlib.compress(b''.join(rows), PNG_COMPRESSION))
+            + _png_chunk(b'IEND', b''))
+
+
+def tile_grid(frame, tile=TILE_SIZE):
+    """All (x, y, width, height) tiles covering a frame"""
+    return [
+        (x, y, min(tile, frame.width - x), min(tile, frame.height - y))
+        for y in range(0, frame.height, tile)
+        for x in range(0, frame.width, tile)
+    ]
+
+
+def changed_tiles(previous, current, tile=TILE_SIZE):
+    """(x, y, width, height) of every tile that differs between two frames"""
+    if numpy is not None:
+        return _changed_tiles_numpy(previous, current, tile)
+
+    stride = current.stride
+    old, new = previous.pixels, current.pixels
+    tiles = []
+    for y in range(0, current.height, tile):
+        rows = min(tile, current.height - y)
+        changed_rows = [
+            offset for offset in range(y * stride, (y + rows) * stride, stride)
+            if old[offset:offset + stride] != new[offset:offset + stride]
+        ]
+        if not changed_rows:
+            continue
+        for x in range(0, current.width, tile):
+            start, end = x * 4, min(x + tile, current.width) * 4
+            if any(old[offset + start:offset + end] != new[offset + start:offset + end] for offset in changed_rows):
+                tiles.append((x, y, (end - start) // 4, rows))
+    return tiles
+
+
+def _changed_tiles_numpy(previous, current, tile):
+    height, width = current.height, current.width
+    old = numpy.frombuffer(previous.pixels, dtype=numpy.uint32).reshape(height, width)
+    new = numpy.frombuffer(current.pixels, dtype=numpy.uint32).reshape(height, width)
+    diff = old != new
+    # Pad to whole tiles, then reduce each tile to one flag
+    diff = numpy.pad(diff, ((0, -height % tile), (0, -width % tile)))
+    flags = diff.reshape(diff.shape[0] // tile, tile, diff.shape[1] // tile, tile).any(axis=(1, 3))
+    return [
+        (int(col) * tile, int(row) * tile, min(tile, width - int(col) * tile), min(tile, height - int(row) * tile))
+        for row, col in numpy.argwhere(flags)
+    ]
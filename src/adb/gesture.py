@@ -0,0 +1,263 @@
+"""
+Touch gestures played back through the kernel input device.
+
+`input swipe` can only draw a straight line, and every `input` call starts
+a Java process on the device. A gesture here is any path, with one or more
+fingers and a timestamp per point, written as raw multi-touch events with
+`sendevent` to the touchscreen found by `getevent -p`. The whole gesture
+is one shell command line, so it goes through the device's input queue
+like a tap and keeps its place in line.
+
+Devices whose touchscreen cannot be written by the shell user fall back to
+`input motionevent` (one finger only, and with a Java process per point,
+so the path is thinned out first).
+
+Coordinates are screen pixels in the device's natural orientation; they
+are scaled to the touchscreen's axis ranges.
+"""
+import random
+import re
+import threading
+
+from src.adb.client import run_adb_shell
+from src.adb.tracker import device_registry
+
+GESTURE_MAX_POINTERS = 10
+GESTURE_MAX_POINTS = 500
+GESTURE_MAX_DURATION = 10000  # ms
+GESTURE_FALLBACK_POINTS = 8  # points kept for `input motionevent`
+SENDEVENT_COST_MS = 2  # rough time one sendevent call takes, taken off the sleeps
+
+# linux/input-event-codes.h
+EV_SYN, EV_KEY, EV_ABS = 0, 1, 3
+SYN_REPORT, SYN_MT_REPORT = 0, 2
+BTN_TOUCH = 0x14a
+ABS_MT_SLOT = 0x2f
+ABS_MT_TOUCH_MAJOR = 0x30
+ABS_MT_POSITION_X = 0x35
+ABS_MT_POSITION_Y = 0x36
+ABS_MT_TRACKING_ID = 0x39
+ABS_MT_PRESSURE = 0x3a
+
+_touch_devices = {}  # device_id -> TouchDevice, or None when there is no usable one
+_touch_lock = threading.Lock()
+
+
+class TouchDevice:
+    """A multi-touch input node and its axis ranges"""
+
+    def __init__(self, path, axes, keys, direct=False):
+        self.path = path
+        self.axes = axes  # ABS code -> (min, max)
+        self.keys = keys
+        self.direct = direct
+        self.writable = False
+
+    @property
+    def slots(self):
+        """Type B protocol (slots) rather than type A (SYN_MT_REPORT)"""
+        return ABS_MT_SLOT in self.axes
+
+    def scale(self, code, value, size):
+        low, high = self.axes[code]
+        if not size:
+            return int(value)
+        return int(round(low + min(max(value, 0), size - 1) * (high - low) / max(size - 1, 1)))
+
+
+def parse_getevent(output):
+    """Find multi-touch devices in `getevent -p` output, touchscreens first"""
+    devices = []
+    for block in output.split('add device')[1:]:
+        path = re.search(r'(/dev/input/\S+)', block)
+        if not path:
+            continue
+        axes, keys = {}, set()
+        section = None
+        for line in block.split('\n'):
+            # "    ABS (0003): 0035  : value 0, min 0, max 1079, ..." then indented continuation lines
+            header = re.match(r'\s*([A-Z]+) \([0-9a-f]{4}\):', line)
+            if header:
+                section, line = header.group(1), line[header.end():]
+            elif not re.match(r'\s*[0-9a-f]{4}\b', line):
+                section = None
+            if section == 'ABS':
+                for code, low, high in re.findall(r'([0-9a-f]{4})\s*: value -?\d+, min (-?\d+), max (-?\d+)', line):
+                    axes[int(code, 16)] = (int(low), int(high))
+            elif section == 'KEY':
+                keys.update(int(code, 16) for code in re.findall(r'\b([0-9a-f]{4})\b', line))
+        if ABS_MT_POSITION_X in axes and ABS_MT_POSITION_Y in axes:
+            devices.append(TouchDevice(path.group(1), axes, keys, 'INPUT_PROP_DIRECT' in block))
+    devices.sort(key=lambda device: not device.direct)
+    return devices
+
+
+def get_touch_device(device_id):
+    """The device's touchscreen, or None if sendevent cannot be used (cached)"""
+    with _touch_lock:
+        if device_id in _touch_devices:
+            return _touch_devices[device_id]
+    result = run_adb_shell('getevent -p', device_id)
+    if not result['success'] and not result['output']:
+        raise RuntimeError(result['error'] or 'getevent failed')
+    candidates = parse_getevent(result['output'])
+    touch = candidates[0] if candidates else None
+    if touch is not None:
+        touch.writable = run_adb_shell(f'test -w {touch.path}', device_id)['success']
+        if not touch.writable:
+            print(f"[DEBUG] {touch.path} on {device_id} is not writable, gestures use input motionevent")
+            touch = None
+    with _touch_lock:
+        _touch_devices[device_id] = touch
+    return touch
+
+
+def parse_gesture(data):
+    """Pointer paths from a request body as [[(x, y, t), ...], ...]
+
+    Accepts {"points": [...]} for one finger or {"pointers": [[...], ...]};
+    a point is {"x", "y", "t"} or [x, y, t] with t in ms from the start.
+    Raises ValueError for malformed or oversized gestures.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Gesture must be a JSON object')
+    pointers = data.get('pointers') or ([data['points']] if data.get('points') else None)
+    if not pointers or not isinstance(pointers, list):
+        raise ValueError('points or pointers is required')
+    if len(pointers) > GESTURE_MAX_POINTERS:
+        raise ValueError(f'At most {GESTURE_MAX_POINTERS} pointers are supported')
+
+    paths = []
+    for pointer in pointers:
+        if not isinstance(pointer, list) or not pointer:
+            raise ValueError('Every pointer needs at least one point')
+        path = []
+        for point in pointer:
+            try:
+                if isinstance(point, dict):
+                    x, y, t = float(point['x']), float(point['y']), float(point.get('t', 0))
+                else:
+                    x, y, t = (float(value) for value in point)
+            except (KeyError, TypeError, ValueError):
+                raise ValueError('Points must be {"x", "y", "t"} objects or [x, y, t] lists')
+            if path and t < path[-1][2]:
+                raise ValueError('Point times must not decrease')
+            path.append((x, y, t))
+        paths.append(path)
+
+    if sum(len(path) for path in paths) > GESTURE_MAX_POINTS:
+        raise ValueError(f'At most {GESTURE_MAX_POINTS} points are supported')
+    if max(path[-1][2] for path in paths) - min(path[0][2] for path in paths) > GESTURE_MAX_DURATION:
+        raise ValueError(f'Gestures may last at most {GESTURE_MAX_DURATION} ms')
+    return paths
+
+
+def _frames(paths):
+    """Group pointer updates by time: [(t, [(pointer, 'down'|'move'|'up', x, y)])]"""
+    updates = {}
+    for index, path in enumerate(paths):
+        for position, (x, y, t) in enumerate(path):
+            updates.setdefault(t, []).append((index, 'down' if position == 0 else 'move', x, y))
+    frames = []
+    for t in sorted(updates):
+        frames.append((t, updates[t]))
+        # Lifting goes in its own frame, after the finger's last position
+        ups = [(index, 'up', path[-1][0], path[-1][1]) for index, path in enumerate(paths) if path[-1][2] == t]
+        if ups:
+            frames.append((t, ups))
+    return frames
+
+
+def sendevent_script(touch, paths, screen_size=None):
+    """One shell command line that plays the paths back on touch"""
+    width, height = screen_size or (None, None)
+    tracking_base = random.randint(1, 30000)
+    down = set()
+    lines = [f'd={touch.path}']
+    last_t = None
+    for t, updates in _frames(paths):
+        touching = bool(down)
+        events = []
+        for index, action, x, y in updates:
+            if action == 'up':
+                down.discard(index)
+                if touch.slots:
+                    events += [(EV_ABS, ABS_MT_SLOT, index), (EV_ABS, ABS_MT_TRACKING_ID, -1)]
+                continue
+            if touch.slots:
+                events.append((EV_ABS, ABS_MT_SLOT, index))
+                if action == 'down':
+                    events.append((EV_ABS, ABS_MT_TRACKING_ID, tracking_base + index))
+            elif ABS_MT_TRACKING_ID in touch.axes:
+                events.append((EV_ABS, ABS_MT_TRACKING_ID, index))
+            events += [(EV_ABS, ABS_MT_POSITION_X, touch.scale(ABS_MT_POSITION_X, x, width)),
+                       (EV_ABS, ABS_MT_POSITION_Y, touch.scale(ABS_MT_POSITION_Y, y, height))]
+            if action == 'down':
+                down.add(index)
+                for code in (ABS_MT_PRESSURE, ABS_MT_TOUCH_MAJOR):
+                    if code in touch.axes:
+                        low, high = touch.axes[code]
+                        events.append((EV_ABS, code, max(low + 1, (low + high) // 8)))
+            if not touch.slots:
+                events.append((EV_SYN, SYN_MT_REPORT, 0))
+        if not touch.slots:
+            # Type A: every frame repeats all fingers still down
+            for index in down - {update[0] for update in updates}:
+                x, y = _position_at(paths[index], t)
+                events += [(EV_ABS, ABS_MT_POSITION_X, touch.scale(ABS_MT_POSITION_X, x, width)),
+                           (EV_ABS, ABS_MT_POSITION_Y, touch.scale(ABS_MT_POSITION_Y, y, height)),
+                           (EV_SYN, SYN_MT_REPORT, 0)]
+            if not down:
+                events.append((EV_SYN, SYN_MT_REPORT, 0))
+        if BTN_TOUCH in touch.keys and touching != bool(down):
+            events.append((EV_KEY, BTN_TOUCH, 1 if down else 0))
+        events.append((EV_SYN, SYN_REPORT, 0))
+
+        if last_t is not None:
+            pause = (t - last_t - SENDEVENT_COST_MS * len(events)) / 1000
+            if pause > 0:
+                lines.append(f'sleep {pause:.3f}')
+        last_t = t
+        lines += [f'sendevent $d {kind} {code} {value}' for kind, code, value in events]
+    return '; '.join(lines)
+
+
+def _position_at(path, t):
+    """Where a finger is at time t: its last point at or before t"""
+    position = path[0]
+    for point in path:
+        if point[2] > t:
+            break
+        position = point
+    return position[0], position[1]
+
+
+def motionevent_script(paths):
+    """`input motionevent` fallback for one finger, thinned out to a few points"""
+    if len(paths) > 1:
+        raise ValueError('Multi-touch gestures need a touchscreen that accepts sendevent')
+    path = paths[0]
+    step = max(1, -(-len(path) // GESTURE_FALLBACK_POINTS))
+    points = path[::step]
+    if points[-1] != path[-1]:
+        points.append(path[-1])
+    commands = [f'input motionevent DOWN {int(points[0][0])} {int(points[0][1])}']
+    commands += [f'input motionevent MOVE {int(x)} {int(y)}' for x, y, _ in points[1:]]
+    commands.append(f'input motionevent UP {int(points[-1][0])} {int(points[-1][1])}')
+    return '; '.join(commands)
+
+
+def gesture_script(device_id, paths, screen_size=None):
+    """(script, method) playing paths on the device, see module docstring"""
+    touch = get_touch_device(device_id)
+    if touch is None:
+        return motionevent_script(paths), 'motionevent'
+    return sendevent_script(touch, paths, screen_size), 'sendevent'
+
+
+def _forget_touch_device(event, serial, status):
+    with _touch_lock:
+        _touch_devices.pop(serial, None)
+
+
+device_registry.add_listener(_forget_touch_device)
@@ -0,0 +1,155 @@
+"""
+Adaptive frame rate for live streams.
+
+A FrameHub used to capture every LIVE_STREAM_INTERVAL seconds no matter
+how long a capture took or whether anyone could keep up. Now each hub has
+a CaptureGovernor and each subscriber a ClientGovernor:
+
+- the client side measures how long encoding and writing a frame to the
+  subscriber's socket take, and from that the interval it can sustain;
+  lossy encodings lose quality while the client is slow and regain it
+  once it catches up;
+- the hub captures as fast as its fastest subscriber can take frames, but
+  never keeps the device busy capturing more than LIVE_STREAM_MAX_DUTY of
+  the time, always within LIVE_STREAM_MIN/MAX_INTERVAL.
+
+Slower subscribers simply skip frames (see Subscriber), nothing queues.
+Every adjustment records a reason, which is reported in the stream.
+"""
+import collections
+import os
+import time
+
+from src.adb.imaging import ImageOptions
+
+LIVE_STREAM_MIN_INTERVAL = float(os.environ.get('LIVE_STREAM_MIN_INTERVAL', '0.25'))
+LIVE_STREAM_MAX_INTERVAL = float(os.environ.get('LIVE_STREAM_MAX_INTERVAL', '5'))
+LIVE_STREAM_MAX_DUTY = 0.5  # share of the time a device may spend capturing
+LIVE_STREAM_MIN_QUALITY = 30
+LIVE_STREAM_STATS_INTERVAL = 5  # seconds between stats messages without adjustments
+EWMA_WEIGHT = 0.3
+
+
+def ewma(average, value, weight=EWMA_WEIGHT):
+    return value if average is None else average + weight * (value - average)
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class RateMeter:
+    """Events per second over the last few events"""
+
+    def __init__(self, size=20):
+        self._times = collections.deque(maxlen=size)
+
+    def tick(self):
+        self._times.append(time.time())
+
+    def rate(self):
+        if len(self._times) < 2:
+            return 0.0
+        span = time.time() - self._times[0]
+        return round((len(self._times) - 1) / span, 2) if span > 0 else 0.0
+
+
+class CaptureGovernor:
+    """Picks a hub's capture interval"""
+
+    def __init__(self, interval):
+        self.interval = clamp(float(interval), LIVE_STREAM_MIN_INTERVAL, LIVE_STREAM_MAX_INTERVAL)
+        self.capture_s = None
+        self.reason = 'initial interval'
+        self.version = 0  # bumped on every adjustment
+        self.meter = RateMeter()
+
+    def record_capture(self, seconds):
+        self.capture_s = ewma(self.capture_s, seconds)
+        self.meter.tick()
+
+    def update(self, client_intervals):
+        """Re-evaluate the interval from what the subscribers can take"""
+        device_floor = (self.capture_s or 0) / LIVE_STREAM_MAX_DUTY
+        wanted = min(client_intervals) if client_intervals else self.interval
+        if device_floor > wanted:
+            target, reason = device_floor, f'capture takes {self.capture_s * 1000:.0f} ms'
+        elif wanted > LIVE_STREAM_MIN_INTERVAL:
+            target, reason = wanted, 'fastest subscriber cannot take frames faster'
+        else:
+            target, reason = wanted, 'full rate'
+        target = clamp(target, LIVE_STREAM_MIN_INTERVAL, LIVE_STREAM_MAX_INTERVAL)
+        # Ignore jitter; only move for changes of more than 10%
+        if abs(target - self.interval) <= 0.1 * self.interval:
+            return False
+        self.interval = target
+        self.reason = reason
+        self.version += 1
+        return True
+
+
+class ClientGovernor:
+    """Tracks one subscriber's throughput and the quality it gets"""
+
+    def __init__(self, options):
+        self.requested = options
+        self.quality = options.quality
+        self.encode_s = None
+        self.drain_s = None
+        self.reason = 'requested quality'
+        self.frames_dropped = 0
+        self.meter = RateMeter()
+        self._reported_version = None
+        self._reported_at = 0
+
+    @property
+    def options(self):
+        if self.quality == self.requested.quality:
+            return self.requested
+        return ImageOptions(self.requested.max_width, self.requested.format, self.quality)
+
+    def wanted_interval(self):
+        """Shortest interval this subscriber can sustain"""
+        busy = (self.encode_s or 0) + (self.drain_s or 0)
+        return max(LIVE_STREAM_MIN_INTERVAL, busy * 1.25)
+
+    def record_send(self, encode_ms, seconds, interval):
+        """A frame was encoded in encode_ms and written to the socket in seconds"""
+        self.encode_s = ewma(self.encode_s, encode_ms / 1000)
+        self.drain_s = ewma(self.drain_s, seconds)
+        self.meter.tick()
+        if self.quality is None:
+            return
+        # Lossy formats trade quality for throughput
+        busy = self.encode_s + self.drain_s
+        if busy > 0.8 * interval and self.quality > LIVE_STREAM_MIN_QUALITY:
+            self.quality = max(LIVE_STREAM_MIN_QUALITY, self.quality - 10)
+            self.reason = f'slow client ({busy * 1000:.0f} ms per frame)'
+            self._reported_version = None
+        elif busy < 0.3 * interval and self.quality < self.requested.quality:
+            self.quality = min(self.requested.quality, self.quality + 5)
+            self.reason = 'client caught up'
+            self._reported_version = None
+
+    def stats(self, hub_governor):
+        return {
+            'effective_fps': self.meter.rate(),
+            'capture_fps': hub_governor.meter.rate(),
+            'interval': round(hub_governor.interval, 3),
+            'interval_reason': hub_governor.reason,
+            'capture_ms': round(hub_governor.capture_s * 1000, 1) if hub_governor.capture_s is not None else None,
+            'encode_ms': round(self.encode_s * 1000, 1) if self.encode_s is not None else None,
+            'drain_ms': round(self.drain_s * 1000, 1) if self.drain_s is not None else None,
+            'quality': self.quality,
+            'quality_reason': self.reason,
+            'frames_dropped': self.frames_dropped
+        }
+
+    def report_due(self, hub_governor):
+        """True when something changed or the last report is getting old"""
+        now = time.time()
+        if self._reported_version != hub_governor.version or now - self._reported_at > LIVE_STREAM_STATS_INTERVAL:
+            self._reported_version = hub_governor.version
+            self._reported_at = now
+            return True
+        return False
@@ -0,0 +1,220 @@
+"""
+Server-side resizing and encoding of screen captures.
+
+The dashboard shows screens as small cards, so sending the full-resolution
+PNG for every screenshot wastes bandwidth and browser decode time. Raw
+framebuffers are resized and encoded here instead, as PNG, JPEG or WebP,
+in a process pool so the work does not hold the GIL in request threads.
+
+Pillow is optional. Without it only PNG is produced and images are scaled
+down by whole-pixel sampling; JPEG and WebP requests fall back to PNG and
+the response reports the format actually used.
+"""
+import base64
+import io
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.adb.frames import RawFrame, encode_png
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_FORMATS = {'png': 'image/png', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+IMAGE_PRESETS = {
+    'thumbnail': {'max_width': 240, 'format': 'jpeg', 'quality': 60},
+    'preview': {'max_width': 540, 'format': 'jpeg', 'quality': 75},
+    'full': {'max_width': None, 'format': 'png', 'quality': None},
+}
+
+IMAGE_ENCODE_WORKERS = int(os.environ.get('IMAGE_ENCODE_WORKERS', '2'))
+IMAGE_POOL_MIN_PIXELS = 200000  # smaller images are encoded inline, the pool round trip costs more
+
+_pool = None  # created on first use; False once it has failed
+_pool_lock = threading.Lock()
+
+
+class ImageOptions:
+    """How a capture should be sized and encoded"""
+
+    __slots__ = ('max_width', 'format', 'quality')
+
+    def __init__(self, max_width=None, format='png', quality=None):
+        self.max_width = max_width
+        self.format = format
+        self.quality = quality
+
+    @property
+    def key(self):
+        return (self.max_width, self.format, self.quality)
+
+    @property
+    def original(self):
+        """True when the capture is sent unchanged as full-size PNG"""
+        return self.max_width is None and self.format == 'png'
+
+    @property
+    def content_type(self):
+        return IMAGE_FORMATS[self.format]
+
+
+def parse_image_options(args, default_preset='full'):
+    """Build ImageOptions from request args (preset, max_width, format, quality)
+
+    Raises ValueError for unknown presets or out of range values.
+    """
+    preset = args.get('preset', default_preset)
+    if preset not in IMAGE_PRESETS:
+        raise ValueError(f"Unknown preset '{preset}', use one of: {', '.join(IMAGE_PRESETS)}")
+    values = dict(IMAGE_PRESETS[preset])
+
+    if args.get('max_width'):
+        try:
+            values['max_width'] = int(args['max_width'])
+        except ValueError:
+            raise ValueError('max_width must be a number')
+        if not 16 <= values['max_width'] <= 4096:
+            raise ValueError('max_width must be between 16 and 4096')
+    if args.get('format'):
+        values['format'] = args['format'].lower().replace('jpg', 'jpeg')
+        if values['format'] not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown format, use one of: {', '.join(IMAGE_FORMATS)}")
+    if args.get('quality'):
+        try:
+            values['quality'] = int(args['quality'])
+        except ValueError:
+            raise ValueError('quality must be a number')
+        if not 1 <= values['quality'] <= 100:
+            raise ValueError('quality must be between 1 and 100')
+
+    if Image is None and values['format'] != 'png':
+        values['format'] = 'png'
+    if values['format'] == 'png':
+        values['quality'] = None
+    elif values['quality'] is None:
+        values['quality'] = 80
+    return ImageOptions(**values)
+
+
+ORIGINAL = ImageOptions()
+
+
+class EncodedImage:
+    """An encoded capture and what it took to produce it"""
+
+    __slots__ = ('data', 'format', 'width', 'height', 'encode_ms')
+
+    def __init__(self, data, format, width, height, encode_ms):
+        self.data = data
+        self.format = format
+        self.width = width
+        self.height = height
+        self.encode_ms = encode_ms
+
+    @property
+    def content_type(self):
+        return IMAGE_FORMATS[self.format]
+
+    def data_url(self):
+        return f'data:{self.content_type};base64,{base64.b64encode(self.data).decode("utf-8")}'
+
+
+def _sample_down(raw, max_width):
+    """Nearest-neighbour downscale by a whole step, without Pillow"""
+    step = -(-raw.width // max_width)
+    if step <= 1:
+        return raw
+    stride = raw.stride
+    pixels = memoryview(raw.pixels)
+    rows = [
+        pixels[offset:offset + stride].cast('I')[::step].tobytes()
+        for offset in range(0, raw.height * stride, stride * step)
+    ]
+    return RawFrame(len(range(0, raw.width, step)), len(rows), b''.join(rows))
+
+
+def _encode(width, height, pixels, png, max_width, format, quality):
+    """Resize and encode one image; runs in a worker process
+
+    Takes either raw RGBA pixels or an already encoded PNG.
+    Returns (data, width, height).
+    """
+    if Image is None:
+        raw = RawFrame(width, height, pixels)
+        if max_width and width > max_width:
+            raw = _sample_down(raw, max_width)
+        return encode_png(raw), raw.width, raw.height
+
+    if pixels is not None:
+        image = Image.frombuffer('RGBA', (width, height), pixels, 'raw', 'RGBA', 0, 1)
+    else:
+        image = Image.open(io.BytesIO(png))
+    image = image.convert('RGB')
+    if max_width and image.width > max_width:
+        image = image.resize((max_width, max(1, round(image.height * max_width / image.width))), Image.BILINEAR)
+    output = io.BytesIO()
+    if format == 'png':
+        image.save(output, 'PNG', compress_level=1)
+    elif format == 'jpeg':
+        image.save(output, 'JPEG', quality=quality)
+    else:
+        image.save(output, 'WEBP', quality=quality, method=0)
+    return output.getvalue(), image.width, image.height
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None and IMAGE_ENCODE_WORKERS > 0:
+            # spawn: forking a threaded server process is not safe
+            _pool = ProcessPoolExecutor(IMAGE_ENCODE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool or None
+
+
+def _disable_pool():
+    global _pool
+    with _pool_lock:
+        if _pool:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = False
+
+
+def encode_image(options, raw=None, png=None):
+    """Encode a RawFrame (or PNG bytes) according to options
+
+    Large images are encoded in the process pool. encode_ms is the time
+    the caller waited, including the hand-off to the worker.
+    """
+    start = time.time()
+    if raw is None and (Image is None or options.original):
+        # Already a full-size PNG, or no way to decode it: pass it through
+        width, height = struct.unpack('>II', png[16:24])
+        return EncodedImage(png, 'png', width, height, 0.0)
+
+    if raw is not None:
+        width, height, pixels = raw.width, raw.height, raw.pixels
+    else:
+        width = height = 0
+        pixels = None
+    args = (width, height, pixels, png, options.max_width, options.format, options.quality)
+
+    result = None
+    pool = _get_pool() if pixels is not None and width * height >= IMAGE_POOL_MIN_PIXELS else None
+    if pool is not None:
+        try:
+            result = pool.submit(_encode, *args).result()
+        except (BrokenProcessPool, OSError) as e:
+            print(f"[DEBUG] Encode pool failed ({e}), encoding inline from now on")
+            _disable_pool()
+    if result is None:
+        result = _encode(*args)
+    data, width, height = result
+    return EncodedImage(data, options.format, width, height, round((time.time() - start) * 1000, 1))
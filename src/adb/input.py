@@ -0,0 +1,247 @@
+"""
+Ordered input events for interactive control.
+
+Clicking around in the live view fires overlapping tap, swipe and key
+requests; run as separate adb commands they can overtake each other and
+pile up. Instead every device has an InputQueue: events are numbered in
+arrival order and a single worker sends everything that is pending as one
+command line through the device's shell session.
+
+Pending events are coalesced before sending: consecutive key presses
+become one `input keyevent`, consecutive texts one `input text`, and a
+drag step still waiting to be sent is replaced by a newer step of the
+same drag.
+
+Batches are sent under a lease on the device's input (see locks): a
+script step that needs the device to itself holds up manual input until
+it is done instead of having taps land in the middle of it.
+"""
+import collections
+import itertools
+import shlex
+import threading
+import time
+
+from src.adb.client import run_adb_shell
+from src.adb.governor import ewma
+from src.adb.locks import lock_manager
+from src.adb.tracker import device_registry
+
+INPUT_BATCH_MAX = 32  # events sent in one shell command line
+INPUT_IDLE_TIMEOUT = 30  # seconds an idle worker waits before exiting
+INPUT_COMMAND_TIMEOUT = 30
+INPUT_LOCK_WAIT = 10  # seconds a batch waits while a script holds the device's input
+INPUT_RESULTS_KEPT = 256  # finished events remembered for status lookups
+INPUT_STATUS_MARKER = ':INPUT_STATUS:'
+
+
+class InputEvent:
+    """One input command; after coalescing it may stand for several requests"""
+
+    __slots__ = ('seq', 'kind', 'args', 'drag_id', 'queued_at', 'sent_at', 'done_at', 'latency_ms', 'success', 'error', '_done')
+
+    def __init__(self, seq, kind, args, drag_id=None):
+        self.seq = seq  # newest request folded into this event
+        self.kind = kind
+        self.args = list(args)
+        self.drag_id = drag_id
+        self.queued_at = time.time()
+        self.sent_at = None  # when the worker wrote it to the device
+        self.done_at = None
+        self.latency_ms = None
+        self.success = None
+        self.error = ''
+        self._done = threading.Event()
+
+    def command(self):
+        if self.kind == 'script':
+            return self.args[0]  # prepared elsewhere, e.g. a gesture
+        if self.kind == 'text':
+            # `input text` reads %s as a space
+            return f"input text {shlex.quote(''.join(self.args).replace(' ', '%s'))}"
+        command = {'key': 'keyevent'}.get(self.kind, self.kind)
+        return f"input {command} {' '.join(shlex.quote(str(arg)) for arg in self.args)}"
+
+    def absorb(self, other):
+        """Fold a newer pending event into this one if that changes nothing observable"""
+        if self.kind != other.kind:
+            return False
+        if self.kind in ('key', 'text'):
+            self.args.extend(other.args)
+        elif self.kind == 'swipe' and self.drag_id is not None and self.drag_id == other.drag_id:
+            self.args = other.args  # the drag has moved on
+        else:
+            return False
+        self.seq = other.seq
+        return True
+
+    def finish(self, success, error=''):
+        self.success = success
+        self.error = error
+        self.done_at = time.time()
+        self.latency_ms = round((self.done_at - self.queued_at) * 1000, 1)
+        self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def state(self):
+        if self.success is None:
+            return 'pending'
+        return 'delivered' if self.success else 'failed'
+
+
+class InputQueue:
+    """Keeps one device's input events in order and sends them in batches"""
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.pending = collections.deque()
+        self.last_seq = 0
+        self.delivered_seq = 0  # every event up to here has been sent
+        self.events = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.failed = 0
+        self.latency_ms = None
+        self.max_latency_ms = 0
+        self._seq = itertools.count(1)
+        self._results = collections.OrderedDict()  # seq -> finished InputEvent
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def submit(self, kind, args, drag_id=None):
+        """Queue an event; returns (seq, event), where event may carry newer requests too"""
+        with self._cond:
+            seq = next(self._seq)
+            self.last_seq = seq
+            self.events += 1
+            event = InputEvent(seq, kind, args, drag_id)
+            if self.pending and self.pending[-1].absorb(event):
+                self.coalesced += 1
+                event = self.pending[-1]
+            else:
+                self.pending.append(event)
+            self._results[seq] = event
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f'input-{self.device_id}', daemon=True)
+                self._worker.start()
+            self._cond.notify()
+            return seq, event
+
+    def result(self, seq):
+        with self._cond:
+            return self._results.get(seq)
+
+    def _take_batch(self):
+        with self._cond:
+            if not self.pending:
+                self._cond.wait(INPUT_IDLE_TIMEOUT)
+            if not self.pending:
+                self._worker = None
+                return None
+            batch = []
+            while self.pending and len(batch) < INPUT_BATCH_MAX:
+                batch.append(self.pending.popleft())
+            return batch
+
+    def _send(self, batch):
+        """Run a batch as one command line; each event reports its own exit status"""
+        script = '; '.join(f'{event.command()}; echo {INPUT_STATUS_MARKER}$?' for event in batch)
+        # A gesture must not have taps mixed into it; plain input can go alongside other input
+        mode = 'exclusive' if any(event.kind == 'script' for event in batch) else 'shared'
+        with lock_manager.lease(self.device_id, 'input', mode, owner='control', wait=INPUT_LOCK_WAIT):
+            sent_at = time.time()
+            for event in batch:
+                event.sent_at = sent_at
+            result = run_adb_shell(script, self.device_id, INPUT_COMMAND_TIMEOUT)
+        statuses = [
+            line[len(INPUT_STATUS_MARKER):].strip()
+            for line in result['output'].split('\n') if line.startswith(INPUT_STATUS_MARKER)
+        ]
+        for index, event in enumerate(batch):
+            if index < len(statuses):
+                success = statuses[index] == '0'
+                event.finish(success, '' if success else result['error'] or f'input exited with {statuses[index]}')
+            else:
+                event.finish(False, result['error'] or 'Input command did not complete')
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self._send(batch)
+            except Exception as e:
+                print(f"[DEBUG] Input batch failed for {self.device_id}: {e}")
+                for event in batch:
+                    if event.success is None:
+                        event.finish(False, str(e))
+            with self._cond:
+                self.batches += 1
+                for event in batch:
+                    self.delivered_seq = max(self.delivered_seq, event.seq)
+                    if not event.success:
+                        self.failed += 1
+                    self.latency_ms = ewma(self.latency_ms, event.latency_ms)
+                    self.max_latency_ms = max(self.max_latency_ms, event.latency_ms)
+                while len(self._results) > INPUT_RESULTS_KEPT and self._results[next(iter(self._results))].success is not None:
+                    self._results.popitem(last=False)
+
+    def fail_pending(self, error):
+        with self._cond:
+            pending, self.pending = list(self.pending), collections.deque()
+        for event in pending:
+            event.finish(False, error)
+
+    def status(self):
+        with self._cond:
+            return {
+                'depth': len(self.pending),
+                'last_seq': self.last_seq,
+                'delivered_seq': self.delivered_seq,
+                'events': self.events,
+                'coalesced': self.coalesced,
+                'batches': self.batches,
+                'failed': self.failed,
+                'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+                'max_latency_ms': self.max_latency_ms
+            }
+
+
+class InputManager:
+    """One InputQueue per device"""
+
+    def __init__(self):
+        self.queues = {}
+        self._lock = threading.Lock()
+
+    def get(self, device_id):
+        with self._lock:
+            queue = self.queues.get(device_id)
+            if queue is None:
+                queue = self.queues[device_id] = InputQueue(device_id)
+            return queue
+
+    def submit(self, device_id, kind, args, drag_id=None):
+        return self.get(device_id).submit(kind, args, drag_id)
+
+    def status(self):
+        with self._lock:
+            queues = dict(self.queues)
+        return {device_id: queue.status() for device_id, queue in queues.items()}
+
+
+input_manager = InputManager()
+
+
+def _fail_input_on_disconnect(event, serial, status):
+    if event == 'removed' or status != 'device':
+        queue = input_manager.queues.get(serial)
+        if queue is not None:
+            queue.fail_pending('Device disconnected or not available')
+
+
+device_registry.add_listener(_fail_input_on_disconnect)
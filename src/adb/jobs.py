@@ -0,0 +1,414 @@
+"""
+Background jobs for automation scripts.
+
+Scripts used to run as bare threads that reported progress by writing to a
+global dict and were stopped by setting a flag in it. Now they are Jobs run
+by a JobManager:
+
+- a bounded pool of JOB_WORKERS threads takes jobs from a priority queue
+  (high, normal, low; first come first served within a priority), so a
+  burst of jobs waits its turn instead of starting a thread each;
+- every job has a CancelToken; a job function checks job.cancelled between
+  steps, and job.sleep() returns early once the job is cancelled. A job
+  cancelled before it started never runs;
+- job.step(device_id, name) times each step per device, optionally
+  holding a lease on one of the device's resources (see locks);
+- every change bumps the job's version and is kept as a delta, so status
+  watchers are sent what changed when it changes (job.changes) instead of
+  polling for snapshots;
+- status messages also go to a ring buffer of the job's last
+  JOB_LOG_LINES log lines, and job.log() adds lines without changing the
+  status message;
+- finished jobs are kept for status lookups, within a count
+  (JOB_HISTORY_LIMIT), age (JOB_HISTORY_MAX_AGE) and size
+  (JOB_HISTORY_MAX_BYTES) budget; the oldest are evicted first;
+- listeners registered with job_manager.add_listener are told about every
+  delta, which is how job history gets persisted (see src/models/store.py).
+
+A job function is called as fn(job, *args) and reports progress with
+job.update(progress=..., message=..., **other_fields). When it returns, the
+job is completed, unless it set an error status itself or was cancelled.
+"""
+import collections
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+
+from src.adb.locks import lock_manager
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_HISTORY_LIMIT = int(os.environ.get('JOB_HISTORY_LIMIT', '200'))
+JOB_HISTORY_MAX_AGE = float(os.environ.get('JOB_HISTORY_MAX_AGE', '86400'))  # seconds a finished job is kept
+JOB_HISTORY_MAX_BYTES = int(os.environ.get('JOB_HISTORY_MAX_BYTES', str(32 * 1024 * 1024)))  # of finished jobs, estimated
+JOB_PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+JOB_STEPS_KEPT = 500  # step timings kept per job
+JOB_LOCK_WAIT = 120  # seconds a step waits for its device resource
+JOB_EVENTS_KEPT = 1000  # deltas kept per job for watchers catching up
+JOB_LOG_LINES = 200  # log lines kept per job
+FINISHED_STATES = ('completed', 'error', 'stopped')
+
+
+class CancelToken:
+    """Set once to ask a job to stop"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = ''
+
+    def cancel(self, reason='Stopped by user'):
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, seconds):
+        """Sleep for seconds; returns True early if cancelled meanwhile"""
+        return self._event.wait(seconds)
+
+
+class StepRecord:
+    """Timing of one step on one device
+
+    Supports record['success'] = False as well as attribute access.
+    """
+
+    __slots__ = ('device_id', 'step', 'started_at', 'duration_ms', 'success', 'lock_wait_ms')
+
+    def __init__(self, device_id, step):
+        self.device_id = device_id
+        self.step = step
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.success = True
+        self.lock_wait_ms = None  # only for steps that held a device lease
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def to_dict(self):
+        record = {slot: getattr(self, slot) for slot in self.__slots__}
+        if record['lock_wait_ms'] is None:
+            del record['lock_wait_ms']
+        return record
+
+
+class Job:
+    """One run of a script, with its status fields and step timings"""
+
+    __slots__ = ('id', 'name', 'fn', 'args', 'devices', 'priority', 'token', 'fields', 'steps', 'device_timing',
+                 'log_lines', 'created_at', 'started_at', 'finished_at', 'version', 'events', 'listeners',
+                 'running', '_size', '_lock', '_changed')
+
+    def __init__(self, name, fn, args=(), devices=(), priority='normal'):
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.devices = list(devices)
+        self.priority = priority
+        self.token = CancelToken()
+        self.fields = {'status': 'queued', 'progress': 0, 'message': 'Waiting for a free worker'}
+        self.steps = collections.deque(maxlen=JOB_STEPS_KEPT)
+        self.device_timing = {}  # device_id -> {'steps', 'total_ms', 'failed'}
+        self.log_lines = collections.deque(maxlen=JOB_LOG_LINES)  # (time, line)
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0  # bumped on every change
+        self.events = collections.deque(maxlen=JOB_EVENTS_KEPT)  # (version, delta)
+        self.listeners = ()  # callback(job, version, delta), set by the JobManager
+        self.running = False  # taken by a worker; set and read under the JobManager's lock
+        self._size = None  # estimated bytes, cached once finished
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    @property
+    def status(self):
+        return self.fields['status']
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def update(self, **fields):
+        """Change status fields (status, progress, message, or anything script specific)"""
+        with self._lock:
+            self.fields.update(fields)
+            delta = dict(fields)
+            if 'status' in fields:
+                delta.update(started_at=self.started_at, finished_at=self.finished_at)
+            self._record(delta)
+            if 'message' in fields:
+                self.log_lines.append((delta['time'], fields['message']))
+
+    def log(self, line):
+        """Add a line to the job's log without changing its status message"""
+        with self._lock:
+            delta = {'log': line}
+            self._record(delta)
+            self.log_lines.append((delta['time'], line))
+
+    def _record(self, delta):
+        """Keep a delta under a new version and wake up watchers; needs self._lock"""
+        self.version += 1
+        self._size = None
+        delta['time'] = time.time()
+        self.events.append((self.version, delta))
+        self._changed.notify_all()
+        for callback in self.listeners:
+            try:
+                callback(self, self.version, delta)
+            except Exception as e:
+                print(f"[DEBUG] Job listener error: {e}")
+
+    def changes(self, since, timeout):
+        """Deltas after version `since`, waiting up to timeout seconds for the next one
+        
+        Returns None if the deltas after `since` are no longer kept (or
+        `since` is unknown): the watcher has to start over from a snapshot.
+        """
+        with self._lock:
+            if not self._kept(since):
+                return None
+            if since == self.version and not self.finished:
+                self._changed.wait(timeout)
+                if not self._kept(since):
+                    return None
+            return [(version, delta) for version, delta in self.events if version > since]
+
+    def _kept(self, since):
+        """Whether every delta after `since` is still in events; a restored job keeps none"""
+        if since == self.version:
+            return True
+        return since < self.version and bool(self.events) and self.events[0][0] <= since + 1
+
+    def sleep(self, seconds):
+        """time.sleep that ends early when the job is cancelled; returns True if it was"""
+        return self.token.wait(seconds)
+
+    @contextlib.contextmanager
+    def step(self, device_id, name, lock=None):
+        """Time a step on a device
+        
+        Yields the step's record; set record['success'] = False for a step
+        that failed without raising. A step that raises is failed too.
+        lock=(resource, mode) holds that lease on the device for the step;
+        if it cannot be had within JOB_LOCK_WAIT, LockTimeout is raised.
+        The lease never expires: a long step keeps the device to itself
+        until it ends, and the step always gives it back.
+        """
+        record = StepRecord(device_id, name)
+        with self._lock:
+            self.fields.update(current_device=device_id, current_step=name)
+            self._record({'current_device': device_id, 'current_step': name})
+        try:
+            with contextlib.ExitStack() as stack:
+                if lock is not None:
+                    stack.enter_context(lock_manager.lease(device_id, *lock, owner=f'job:{self.name}',
+                                                           wait=JOB_LOCK_WAIT, lease=None))
+                    record.lock_wait_ms = int((time.time() - record.started_at) * 1000)
+                yield record
+        except BaseException:
+            record.success = False
+            raise
+        finally:
+            record.duration_ms = duration_ms = int((time.time() - record.started_at) * 1000)
+            success = record.success
+            with self._lock:
+                self.steps.append(record)
+                timing = self.device_timing.setdefault(device_id, {'steps': 0, 'total_ms': 0, 'failed': 0})
+                timing['steps'] += 1
+                timing['total_ms'] += duration_ms
+                timing['failed'] += 0 if success else 1
+                self._record({'step': record.to_dict(), 'device_timing': {device_id: dict(timing)}})
+
+    def snapshot(self, steps=False, log=False):
+        """Status fields plus job details; the step list and log lines only if asked for"""
+        with self._lock:
+            snapshot = dict(self.fields)
+            snapshot.update({
+                'job_id': self.id,
+                'name': self.name,
+                'priority': self.priority,
+                'devices': self.devices,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'duration_ms': int(((self.finished_at or time.time()) - self.started_at) * 1000) if self.started_at else None,
+                'device_timing': {device_id: dict(timing) for device_id, timing in self.device_timing.items()},
+                'version': self.version
+            })
+            if steps:
+                snapshot['steps'] = [step.to_dict() for step in self.steps]
+            if log:
+                snapshot['log'] = [{'time': at, 'line': line} for at, line in self.log_lines]
+            return snapshot
+
+    def size(self):
+        """Rough number of bytes the job's status, deltas, steps and log take up"""
+        with self._lock:
+            if self._size is None:
+                self._size = len(json.dumps([self.fields, self.device_timing, list(self.events), list(self.log_lines)],
+                                            default=str)) + 100 * len(self.steps)
+            return self._size
+
+    def release(self):
+        """Drop what only a running job needs: its function and arguments"""
+        self.fn = None
+        self.args = ()
+
+
+class JobManager:
+    """Priority queue of jobs, a bounded worker pool and the job history"""
+
+    def __init__(self, workers=JOB_WORKERS, history_limit=JOB_HISTORY_LIMIT, history_max_age=JOB_HISTORY_MAX_AGE,
+                 history_max_bytes=JOB_HISTORY_MAX_BYTES):
+        self.workers = workers
+        self.history_limit = history_limit
+        self.history_max_age = history_max_age
+        self.history_max_bytes = history_max_bytes
+        self.evicted = 0
+        self.jobs = collections.OrderedDict()  # job id -> Job, in submission order
+        self._queue = []  # heap of (priority, order, job)
+        self._order = itertools.count()
+        self._threads = []
+        self._busy = 0
+        self._listeners = []
+        self._cond = threading.Condition()
+
+    def add_listener(self, callback):
+        """Register callback(job, version, delta) for every job change
+        
+        It is called with the job's lock held, so it must only note the
+        change and return.
+        """
+        self._listeners.append(callback)
+
+    def submit(self, name, fn, args=(), devices=(), priority='normal'):
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(JOB_PRIORITIES)}")
+        job = Job(name, fn, args, devices, priority)
+        job.listeners = self._listeners
+        with self._cond:
+            self.jobs[job.id] = job
+            heapq.heappush(self._queue, (JOB_PRIORITIES[priority], next(self._order), job))
+            if self._busy + len(self._queue) > len(self._threads) and len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'job-worker-{len(self._threads)}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+            self._trim()
+        print(f"[DEBUG] Queued job {job.id} ({name}, {priority} priority)")
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self.jobs.get(job_id)
+
+    def restore(self, jobs):
+        """Put jobs from an earlier run back into the history, oldest first; they are not run"""
+        with self._cond:
+            for job in jobs:
+                job.listeners = self._listeners
+                self.jobs[job.id] = job
+            self._trim()
+
+    def cancel(self, job_id, reason='Stopped by user'):
+        """Ask a job to stop; returns the job, or None if unknown"""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job.token.cancel(reason)
+            # A worker checks the token and takes the job under the same lock, so it either already
+            # runs it (and stops at its next step) or will skip it
+            stop_now = not job.running and job.status == 'queued'
+        if stop_now:
+            job.finished_at = time.time()
+            job.update(status='stopped', message=reason)
+            job.release()
+        return job
+
+    def list(self):
+        with self._cond:
+            return list(self.jobs.values())
+
+    def stats(self):
+        with self._cond:
+            self._trim()
+            states = collections.Counter(job.status for job in self.jobs.values())
+            queued = sum(1 for _, _, job in self._queue if not job.cancelled)
+            return {'workers': self.workers, 'busy': self._busy, 'queued': queued,
+                    'history_limit': self.history_limit, 'history_max_age': self.history_max_age,
+                    'history_max_bytes': self.history_max_bytes,
+                    'history_bytes': sum(job.size() for job in self.jobs.values() if job.finished),
+                    'evicted': self.evicted, 'jobs': dict(states)}
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._queue)
+                if job.cancelled:
+                    continue
+                job.running = True
+                self._busy += 1
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._trim()
+
+    def _run(self, job):
+        job.started_at = time.time()
+        job.update(status='running', message=f'Starting {job.name}')
+        try:
+            job.fn(job, *job.args)
+        except Exception as e:
+            print(f"[DEBUG] Job {job.id} ({job.name}) failed: {e}")
+            traceback.print_exc()
+            job.update(status='error', message=f'Error: {e}')
+        finally:
+            job.finished_at = time.time()
+            if job.cancelled and job.status != 'error':
+                job.update(status='stopped', message=job.token.reason)
+            elif not job.finished:
+                job.update(status='completed', progress=100)
+            else:
+                job.update(status=job.status)  # the job set its own final status; watchers still need finished_at
+            job.release()
+
+    def _trim(self):
+        """Evict finished jobs, oldest first, that are too old or beyond the count or size budget"""
+        now = time.time()
+        finished = [job for job in self.jobs.values() if job.finished]
+        excess = len(finished) - self.history_limit
+        total = sum(job.size() for job in finished)
+        for job in finished:
+            too_old = now - (job.finished_at or now) > self.history_max_age
+            if excess <= 0 and total <= self.history_max_bytes and not too_old:
+                continue
+            del self.jobs[job.id]
+            excess -= 1
+            total -= job.size()
+            self.evicted += 1
+
+
+job_manager = JobManager()
@@ -0,0 +1,250 @@
+"""
+Per-device resource locks.
+
+A device can have a live stream, a screen recording, a running script and
+manual control requests at the same time, all going through the same adbd.
+Most of that is fine side by side, but some of it is not: a tap landing in
+the middle of a script typing a password, an app launched while it is
+being reinstalled, two deployments pushing to the same temp file.
+
+Code that touches a device takes a lease on one of its resources:
+
+- screen: the screen recorder (screenrecord for recordings and live
+  video; only one runs per device). Screenshots do not need it
+- input: taps, keys, text, gestures, script steps that drive the UI
+- package: app launches, installs
+- filesystem: files pushed to or pulled from the device
+
+A lease is shared (any number of shared holders at once) or exclusive
+(only holder). Waiters are served first come first served, so a shared
+request queued behind an exclusive one waits for it instead of starving
+it. A lease that is not released within its lease timeout is reclaimed
+when someone else needs the resource; a holder that crashed cannot block a
+device forever.
+
+Every resource keeps contention statistics: how often a lease had to
+wait, for how long, and which owners were waiting on which.
+"""
+import collections
+import contextlib
+import itertools
+import os
+import threading
+import time
+
+LOCK_RESOURCES = ('screen', 'input', 'package', 'filesystem')
+LOCK_MODES = ('shared', 'exclusive')
+LOCK_WAIT_TIMEOUT = float(os.environ.get('LOCK_WAIT_TIMEOUT', '30'))  # seconds to wait for a lease
+LOCK_LEASE_TIMEOUT = float(os.environ.get('LOCK_LEASE_TIMEOUT', '300'))  # seconds before a lease can be reclaimed (lease=None: never)
+LOCK_BLOCKED_BY_KEPT = 200  # waiter/holder pairs kept in the statistics
+
+
+class LockTimeout(Exception):
+    """A lease could not be granted in time"""
+
+    def __init__(self, message, holders=()):
+        super().__init__(message)
+        self.holders = list(holders)
+
+
+class Lease:
+    """A granted, or still waiting, claim on a device resource"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, device_id, resource, mode, owner, timeout):
+        self.id = next(self._ids)
+        self.device_id = device_id
+        self.resource = resource
+        self.mode = mode
+        self.owner = owner
+        self.timeout = timeout  # None: held until released
+        self.requested_at = time.time()
+        self.acquired_at = None
+        self.expires_at = None
+        self.blocked_by = ()  # owners it had to wait for
+
+    @property
+    def granted(self):
+        return self.acquired_at is not None
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'lease_id': self.id,
+            'owner': self.owner,
+            'mode': self.mode,
+            'held_ms': int((now - self.acquired_at) * 1000) if self.granted else None,
+            'waiting_ms': int(((self.acquired_at or now) - self.requested_at) * 1000),
+            'expires_in': round(self.expires_at - now, 1) if self.expires_at else None
+        }
+
+
+class ResourceLock:
+    """Holders, the waiting queue and the statistics of one resource of one device"""
+
+    def __init__(self, device_id, resource):
+        self.device_id = device_id
+        self.resource = resource
+        self.holders = []
+        self.waiters = collections.deque()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_ms = 0
+        self.max_wait_ms = 0
+        self.timeouts = 0
+        self.expired = 0
+
+    def compatible(self, lease):
+        if not self.holders:
+            return True
+        return lease.mode == 'shared' and all(holder.mode == 'shared' for holder in self.holders)
+
+    def expire(self, now):
+        for holder in [holder for holder in self.holders if holder.expires_at and holder.expires_at <= now]:
+            print(f"[DEBUG] Lease on {self.resource} of {self.device_id} held by {holder.owner} expired")
+            self.holders.remove(holder)
+            self.expired += 1
+
+    def to_dict(self):
+        return {
+            'device_id': self.device_id,
+            'resource': self.resource,
+            'holders': [holder.to_dict() for holder in self.holders],
+            'waiters': [waiter.to_dict() for waiter in self.waiters],
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'wait_ms': self.wait_ms,
+            'max_wait_ms': self.max_wait_ms,
+            'timeouts': self.timeouts,
+            'expired': self.expired
+        }
+
+
+class LockManager:
+    """Shared/exclusive leases on device resources, with fair queuing and statistics"""
+
+    def __init__(self):
+        self.locks = {}  # (device_id, resource) -> ResourceLock
+        self.blocked_by = collections.OrderedDict()  # (waiter owner, holder owner) -> {'count', 'wait_ms'}
+        self._cond = threading.Condition()
+
+    def acquire(self, device_id, resource, mode='exclusive', owner=None, wait=LOCK_WAIT_TIMEOUT,
+                lease=LOCK_LEASE_TIMEOUT):
+        """Wait up to `wait` seconds for a lease; raises LockTimeout
+
+        wait=0 only takes the lease if it is free right now. lease=None
+        keeps it until it is released, for holders that always release it
+        themselves (a recording, a live stream).
+        """
+        if resource not in LOCK_RESOURCES:
+            raise ValueError(f"resource must be one of {', '.join(LOCK_RESOURCES)}")
+        if mode not in LOCK_MODES:
+            raise ValueError(f"mode must be one of {', '.join(LOCK_MODES)}")
+        claim = Lease(device_id, resource, mode, owner or threading.current_thread().name, lease)
+        deadline = claim.requested_at + wait
+        with self._cond:
+            lock = self.locks.get((device_id, resource))
+            if lock is None:
+                lock = self.locks[(device_id, resource)] = ResourceLock(device_id, resource)
+            lock.waiters.append(claim)
+            self._grant(lock)
+            if not claim.granted:
+                claim.blocked_by = tuple(dict.fromkeys(
+                    other.owner for other in lock.holders + list(lock.waiters) if other is not claim))
+                lock.contended += 1
+            while not claim.granted:
+                now = time.time()
+                if now >= deadline:
+                    lock.waiters.remove(claim)
+                    lock.timeouts += 1
+                    self._record_blocked(claim, now)
+                    # Whoever queued behind it may be able to go now
+                    self._grant(lock)
+                    self._cond.notify_all()
+                    holders = [holder.to_dict() for holder in lock.holders]
+                    raise LockTimeout(
+                        f"{resource} of {device_id} is busy ({', '.join(holder['owner'] for holder in holders)})",
+                        holders)
+                # Wake up in time to reclaim a lease that runs out
+                expiry = min((holder.expires_at for holder in lock.holders if holder.expires_at), default=deadline)
+                self._cond.wait(max(0.001, min(deadline, expiry) - now))
+                self._grant(lock)
+        return claim
+
+    def release(self, claim):
+        """Give a lease back; returns False if it had already expired"""
+        with self._cond:
+            lock = self.locks.get((claim.device_id, claim.resource))
+            if lock is None or claim not in lock.holders:
+                return False
+            lock.holders.remove(claim)
+            self._grant(lock)
+            self._cond.notify_all()
+            return True
+
+    @contextlib.contextmanager
+    def lease(self, device_id, resource, mode='exclusive', owner=None, wait=LOCK_WAIT_TIMEOUT,
+              lease=LOCK_LEASE_TIMEOUT):
+        claim = self.acquire(device_id, resource, mode, owner, wait, lease)
+        try:
+            yield claim
+        finally:
+            self.release(claim)
+
+    def _grant(self, lock):
+        """Grant leases from the head of the queue while they fit"""
+        now = time.time()
+        lock.expire(now)
+        granted = False
+        while lock.waiters and lock.compatible(lock.waiters[0]):
+            claim = lock.waiters.popleft()
+            claim.acquired_at = now
+            if claim.timeout is not None:
+                claim.expires_at = now + claim.timeout
+            lock.holders.append(claim)
+            lock.acquisitions += 1
+            wait_ms = int((now - claim.requested_at) * 1000)
+            lock.wait_ms += wait_ms
+            lock.max_wait_ms = max(lock.max_wait_ms, wait_ms)
+            self._record_blocked(claim, now)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _record_blocked(self, claim, now):
+        wait_ms = int((now - claim.requested_at) * 1000)
+        for owner in claim.blocked_by:
+            pair = self.blocked_by.pop((claim.owner, owner), None) or {'count': 0, 'wait_ms': 0}
+            pair['count'] += 1
+            pair['wait_ms'] += wait_ms
+            self.blocked_by[(claim.owner, owner)] = pair
+        while len(self.blocked_by) > LOCK_BLOCKED_BY_KEPT:
+            self.blocked_by.popitem(last=False)
+
+    def holders(self, device_id, resource):
+        with self._cond:
+            lock = self.locks.get((device_id, resource))
+            return [holder.to_dict() for holder in lock.holders] if lock else []
+
+    def stats(self, device_id=None):
+        """Holders, waiters and contention per resource, plus who waited on whom"""
+        with self._cond:
+            now = time.time()
+            locks = []
+            for (lock_device, _), lock in self.locks.items():
+                if device_id is None or lock_device == device_id:
+                    lock.expire(now)
+                    locks.append(lock.to_dict())
+            return {
+                'locks': locks,
+                'blocked_by': [
+                    {'waiter': waiter, 'holder': holder, 'count': pair['count'], 'wait_ms': pair['wait_ms']}
+                    for (waiter, holder), pair in sorted(self.blocked_by.items(), key=lambda item: -item[1]['wait_ms'])
+                ],
+                'wait_timeout': LOCK_WAIT_TIMEOUT,
+                'lease_timeout': LOCK_LEASE_TIMEOUT
+            }
+
+
+lock_manager = LockManager()
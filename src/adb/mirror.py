@@ -0,0 +1,232 @@
+"""
+Input mirroring across devices.
+
+Running the same manual QA step on a whole device matrix used to mean one
+control request per device, one after the other. A mirror sends an input
+event to several devices at once:
+
+- a leader device is mirrored onto its targets, so every tap, swipe, key,
+  text or gesture sent to the leader is also sent to them;
+- a named group receives an action sent to any device with ?group=<name>.
+
+Every target has its own InputQueue, whose worker sends the event through
+the device's shell session. Every device's event is prepared first and
+then all are queued in one quick pass, so the devices receive them in
+parallel. Sessions are opened when a mirror starts, not on the first tap.
+Coordinates are scaled from the leader's screen size to each target's.
+
+For every dispatch the skew is measured: the spread between the first and
+the last device the command was written to, and between the first and the
+last device that finished running it.
+"""
+import re
+import threading
+import time
+
+from src.adb.cache import device_info_cache
+from src.adb.client import run_adb_shell
+from src.adb.governor import ewma
+from src.adb.input import input_manager
+from src.adb.tracker import device_registry
+
+MIRROR_MAX_TARGETS = 100
+MIRROR_WAIT_TIMEOUT = 30  # seconds a dispatch waits for all devices
+
+# Argument positions holding x and y coordinates, per input kind
+COORDINATE_ARGS = {
+    'tap': ((0, 1),),
+    'swipe': ((0, 1), (2, 3)),
+}
+
+
+def screen_size(device_id, probe=True):
+    """(width, height) from the device info cache, or None if unknown
+
+    Only the static screen size is read, so this never waits on a battery
+    or screen state probe.
+    """
+    size = device_info_cache.resolution(device_id, probe=probe) or ''
+    return tuple(int(value) for value in size.split('x')) if re.fullmatch(r'\d+x\d+', size) else None
+
+
+def screen_sizes(device_ids):
+    """{device_id: screen_size}; devices whose size is not cached yet are probed in parallel"""
+    sizes = {device_id: screen_size(device_id, probe=False) for device_id in device_ids}
+    missing = [device_id for device_id, size in sizes.items() if size is None]
+    if missing:
+        def fetch(device_id):
+            sizes[device_id] = screen_size(device_id)
+        threads = [threading.Thread(target=fetch, args=(device_id,), daemon=True) for device_id in missing]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + MIRROR_WAIT_TIMEOUT
+        for thread in threads:
+            thread.join(max(0, deadline - time.time()))
+    return sizes
+
+
+def scale_point(x, y, source, target):
+    if not source or not target or source == target:
+        return x, y
+    return x * target[0] / source[0], y * target[1] / source[1]
+
+
+def scale_args(kind, args, source, target):
+    """Input arguments with coordinates moved from the source screen size to the target's"""
+    args = list(args)
+    for x_index, y_index in COORDINATE_ARGS.get(kind, ()):
+        x, y = scale_point(args[x_index], args[y_index], source, target)
+        args[x_index], args[y_index] = int(round(x)), int(round(y))
+    return args
+
+
+class MirrorDispatch:
+    """One action sent to several devices"""
+
+    def __init__(self, events, started_at=None):
+        self.events = events  # [(device_id, seq, InputEvent)]
+        self.started_at = started_at  # when the dispatch began preparing events
+
+    def wait(self, timeout=MIRROR_WAIT_TIMEOUT):
+        deadline = time.time() + timeout
+        return all(event.wait(max(0, deadline - time.time())) for _, _, event in self.events)
+
+    def skew(self):
+        """(dispatch_skew_ms, completion_skew_ms) over the devices that got that far
+
+        Dispatch skew runs from the start of the dispatch, so time spent
+        preparing the events (looking up screen sizes) counts too.
+        """
+        sent = [event.sent_at for _, _, event in self.events if event.sent_at is not None]
+        done = [event.done_at for _, _, event in self.events if event.success]
+        first = self.started_at if self.started_at is not None else min(sent, default=None)
+        return (round((max(sent) - first) * 1000, 1) if len(sent) > 1 else 0.0,
+                round((max(done) - min(done)) * 1000, 1) if len(done) > 1 else 0.0)
+
+    def results(self):
+        return {
+            device_id: {
+                'seq': seq,
+                'state': event.state,
+                'error': event.error,
+                'latency_ms': event.latency_ms
+            }
+            for device_id, seq, event in self.events
+        }
+
+
+class MirrorManager:
+    """Device groups, leader mirrors and dispatch statistics"""
+
+    def __init__(self):
+        self.groups = {}  # name -> [device_id]
+        self.mirrors = {}  # leader device_id -> [target device_id]
+        self.stats = {'dispatches': 0, 'events': 0, 'failed': 0, 'timeouts': 0,
+                      'dispatch_skew_ms': None, 'completion_skew_ms': None,
+                      'max_dispatch_skew_ms': 0, 'max_completion_skew_ms': 0}
+        self._lock = threading.Lock()
+
+    def set_group(self, name, device_ids):
+        device_ids = list(dict.fromkeys(device_ids))
+        if len(device_ids) > MIRROR_MAX_TARGETS:
+            raise ValueError(f'A group may have at most {MIRROR_MAX_TARGETS} devices')
+        with self._lock:
+            self.groups[name] = device_ids
+        return device_ids
+
+    def delete_group(self, name):
+        with self._lock:
+            return self.groups.pop(name, None) is not None
+
+    def group(self, name):
+        with self._lock:
+            return list(self.groups.get(name, []))
+
+    def start(self, leader, targets):
+        """Mirror the leader onto targets and open their shell sessions"""
+        targets = [target for target in dict.fromkeys(targets) if target != leader]
+        if not targets:
+            raise ValueError('A mirror needs at least one target besides the leader')
+        if len(targets) > MIRROR_MAX_TARGETS:
+            raise ValueError(f'A mirror may have at most {MIRROR_MAX_TARGETS} targets')
+        with self._lock:
+            self.mirrors[leader] = targets
+        self.warm_up([leader] + targets)
+        return targets
+
+    def stop(self, leader):
+        with self._lock:
+            return self.mirrors.pop(leader, None) is not None
+
+    def targets(self, leader):
+        with self._lock:
+            return list(self.mirrors.get(leader, []))
+
+    def warm_up(self, device_ids):
+        """Open every device's shell session and read its screen size in parallel, so the first dispatch does not pay for it"""
+        def warm(device_id):
+            run_adb_shell('true', device_id)
+            screen_size(device_id)
+        threads = [threading.Thread(target=warm, args=(device_id,), daemon=True) for device_id in device_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(MIRROR_WAIT_TIMEOUT)
+
+    def dispatch(self, leader, targets, kind, args, drag_id=None, build=None):
+        """Queue an action on the leader and every target; returns a MirrorDispatch
+
+        build(device_id, screen_size) -> (kind, args) prepares a target's own event; by
+        default the leader's coordinates are scaled to the target's screen.
+        """
+        started_at = time.time()
+        # Sizes not cached yet are fetched in parallel, so build() only reads the cache
+        sizes = screen_sizes([leader] + list(targets))
+        if build is None:
+            source = sizes.get(leader) if kind in COORDINATE_ARGS else None
+            build = lambda device_id, size: (kind, scale_args(kind, args, source, size) if source else args)
+        # Prepare every event before queueing any, so they leave together
+        prepared = [(leader, kind, args)] + [(target,) + tuple(build(target, sizes.get(target))) for target in targets]
+        events = []
+        for device_id, device_kind, device_args in prepared:
+            seq, event = input_manager.submit(device_id, device_kind, device_args, drag_id)
+            events.append((device_id, seq, event))
+        with self._lock:
+            self.stats['dispatches'] += 1
+            self.stats['events'] += len(events)
+        return MirrorDispatch(events, started_at)
+
+    def finish(self, dispatch, timeout=MIRROR_WAIT_TIMEOUT):
+        """Wait for a dispatch and fold it into the statistics; returns (finished, dispatch_skew_ms, completion_skew_ms)"""
+        finished = dispatch.wait(timeout)
+        dispatch_skew, completion_skew = dispatch.skew()
+        with self._lock:
+            stats = self.stats
+            stats['failed'] += sum(1 for _, _, event in dispatch.events if event.success is False)
+            if not finished:
+                stats['timeouts'] += 1
+            stats['dispatch_skew_ms'] = round(ewma(stats['dispatch_skew_ms'], dispatch_skew), 1)
+            stats['completion_skew_ms'] = round(ewma(stats['completion_skew_ms'], completion_skew), 1)
+            stats['max_dispatch_skew_ms'] = max(stats['max_dispatch_skew_ms'], dispatch_skew)
+            stats['max_completion_skew_ms'] = max(stats['max_completion_skew_ms'], completion_skew)
+        return finished, dispatch_skew, completion_skew
+
+    def status(self):
+        with self._lock:
+            return {
+                'groups': {name: list(devices) for name, devices in self.groups.items()},
+                'mirrors': {leader: list(targets) for leader, targets in self.mirrors.items()},
+                'stats': dict(self.stats)
+            }
+
+
+mirror_manager = MirrorManager()
+
+
+def _drop_mirror_on_disconnect(event, serial, status):
+    # A leader that goes away stops mirroring; targets that go away simply fail their events
+    if event == 'removed':
+        mirror_manager.stop(serial)
+
+
+device_registry.add_listener(_drop_mirror_on_disconnect)
@@ -0,0 +1,197 @@
+"""
+Fleet mosaic: thumbnails of many devices over one connection.
+
+Watching a rack through one live stream per device costs one capture loop,
+one Flask thread and one browser connection per phone. The mosaic instead
+runs a single capture scheduler for all devices that any mosaic viewer
+wants, visiting them round-robin within a global frame budget so that
+every device gets an equal share no matter how many are connected. A slow
+device is skipped while its capture is still running rather than holding
+up the others, and unchanged screens are not sent.
+"""
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.adb.client import parse_device_list, run_adb_command
+from src.adb.imaging import IMAGE_PRESETS, ImageOptions
+from src.adb.screen import ScreenCaptureError, capture_png, capture_raw
+from src.adb.stream import LIVE_STREAM_RAW, Frame
+from src.adb.tracker import get_live_registry
+
+LIVE_MOSAIC_FPS = float(os.environ.get('LIVE_MOSAIC_FPS', '4'))  # captures per second across all devices
+LIVE_MOSAIC_WORKERS = int(os.environ.get('LIVE_MOSAIC_WORKERS', '4'))
+LIVE_MOSAIC_ERROR_BACKOFF = 10  # seconds a failing device is left alone
+LIVE_MOSAIC_DEVICE_POLL = 5  # seconds between `adb devices` when the tracker is down
+MOSAIC_OPTIONS = ImageOptions(**IMAGE_PRESETS['thumbnail'])
+
+
+class MosaicViewer:
+    """One mosaic connection; keeps only the newest frame per device"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, device_ids=None, options=MOSAIC_OPTIONS):
+        self.id = next(self._ids)
+        self.device_ids = set(device_ids) if device_ids else None  # None = every device
+        self.options = options
+        self._frames = {}
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def wants(self, device_id):
+        return self.device_ids is None or device_id in self.device_ids
+
+    def push_frame(self, frame):
+        with self._cond:
+            self._frames[frame.device_id] = frame
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def next_frames(self, timeout=None):
+        """Return the pending frames (possibly empty on timeout), or None once closed"""
+        with self._cond:
+            if not self._frames and not self._closed:
+                self._cond.wait(timeout)
+            if self._closed:
+                return None
+            frames = list(self._frames.values())
+            self._frames.clear()
+            return frames
+
+
+class FleetMosaic:
+    """Round-robin capture scheduler shared by every mosaic viewer"""
+
+    def __init__(self, fps=LIVE_MOSAIC_FPS, workers=LIVE_MOSAIC_WORKERS):
+        self.fps = fps
+        self.viewers = {}
+        self.frames_captured = 0
+        self.frames_unchanged = 0
+        self.last_frames = {}  # device_id -> Frame
+        self._in_flight = set()
+        self._last_visit = {}  # device_id -> when its last capture was started
+        self._failed_until = {}
+        self._png_only = set()  # devices whose framebuffer format is not understood
+        self._polled = []
+        self._polled_at = 0
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mosaic')
+        self._thread = None
+
+    def add_viewer(self, viewer):
+        with self._lock:
+            self.viewers[viewer.id] = viewer
+            # New viewers see the latest thumbnails straight away
+            for device_id, frame in self.last_frames.items():
+                if viewer.wants(device_id):
+                    viewer.push_frame(frame)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='mosaic-scheduler', daemon=True)
+                self._thread.start()
+
+    def remove_viewer(self, viewer):
+        with self._lock:
+            self.viewers.pop(viewer.id, None)
+            if not self.viewers:
+                self.last_frames.clear()
+        viewer.close()
+
+    def _connected_devices(self):
+        registry = get_live_registry(timeout=0)
+        if registry is not None:
+            return [device['id'] for device in registry.snapshot() if device['status'] == 'device']
+        # No tracker: poll `adb devices`, but not on every budget slot
+        if time.time() - self._polled_at > LIVE_MOSAIC_DEVICE_POLL:
+            result = run_adb_command('devices')
+            if result['success']:
+                self._polled = [serial for serial, state in parse_device_list(result['output']) if state == 'device']
+            self._polled_at = time.time()
+        return self._polled
+
+    def _targets(self):
+        """Connected devices that at least one viewer wants, in stable order"""
+        with self._lock:
+            viewers = list(self.viewers.values())
+        now = time.time()
+        return [
+            device_id for device_id in self._connected_devices()
+            if self._failed_until.get(device_id, 0) <= now
+            and any(viewer.wants(device_id) for viewer in viewers)
+        ]
+
+    def _capture(self, device_id):
+        try:
+            previous = self.last_frames.get(device_id)
+            if device_id in self._png_only or not LIVE_STREAM_RAW:
+                png = capture_png(device_id)
+                if previous is not None and previous.raw is None and png == previous.png:
+                    self.frames_unchanged += 1
+                    return
+                frame = Frame(device_id, next(self._seq), png=png)
+            else:
+                try:
+                    raw = capture_raw(device_id)
+                except ScreenCaptureError:
+                    if previous is not None:
+                        raise
+                    self._png_only.add(device_id)
+                    return
+                if previous is not None and raw.same_size(previous.raw) and raw.pixels == previous.raw.pixels:
+                    self.frames_unchanged += 1
+                    return
+                frame = Frame(device_id, next(self._seq), raw=raw)
+            self._failed_until.pop(device_id, None)
+            self.frames_captured += 1
+            with self._lock:
+                self.last_frames[device_id] = frame
+                viewers = [viewer for viewer in self.viewers.values() if viewer.wants(device_id)]
+            for viewer in viewers:
+                viewer.push_frame(frame)
+        except Exception as e:
+            print(f"[DEBUG] Mosaic capture failed for {device_id}: {e}")
+            self._failed_until[device_id] = time.time() + LIVE_MOSAIC_ERROR_BACKOFF
+        finally:
+            with self._lock:
+                self._in_flight.discard(device_id)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self.viewers:
+                    self._thread = None
+                    return
+            started = time.time()
+            targets = self._targets()
+            with self._lock:
+                ready = [device_id for device_id in targets if device_id not in self._in_flight]
+            if ready:
+                # Round-robin: the device waiting longest goes next; busy ones sit out
+                device_id = min(ready, key=lambda d: self._last_visit.get(d, 0))
+                self._last_visit[device_id] = started
+                with self._lock:
+                    self._in_flight.add(device_id)
+                self._executor.submit(self._capture, device_id)
+            # One capture per budget slot, shared by all devices
+            time.sleep(max(0, 1.0 / self.fps - (time.time() - started)))
+
+    def status(self):
+        with self._lock:
+            return {
+                'viewers': len(self.viewers),
+                'fps_budget': self.fps,
+                'devices': sorted(self.last_frames),
+                'in_flight': sorted(self._in_flight),
+                'frames_captured': self.frames_captured,
+                'frames_unchanged': self.frames_unchanged
+            }
+
+
+fleet_mosaic = FleetMosaic()
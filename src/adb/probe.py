@@ -0,0 +1,154 @@
+"""
+Single-round-trip device probe.
+
+get_device_info() used to run a separate adb command for every property,
+plus full `dumpsys wifi` / `dumpsys power` dumps that can be hundreds of KB.
+The probe composes all queries into one `adb shell` script whose sections
+are separated by marker lines, then parses the combined output in one pass.
+"""
+import re
+import time
+
+from src.adb.client import ADB_COMMAND_TIMEOUT, run_adb_shell
+
+SECTION_MARKER = ':::adbm-probe:'
+
+BATTERY_STATUS = {
+    '1': 'Unknown',
+    '2': 'Charging',
+    '3': 'Discharging',
+    '4': 'Not charging',
+    '5': 'Full'
+}
+
+PROPERTY_FIELDS = {
+    'brand': 'ro.product.brand',
+    'model': 'ro.product.model',
+    'android_version': 'ro.build.version.release',
+    'api_level': 'ro.build.version.sdk',
+    'density': 'ro.sf.lcd_density'
+}
+
+GETPROP_LINE = re.compile(r'^\[(.+?)\]: \[(.*)\]$')
+
+
+def parse_props(output):
+    props = {}
+    for line in output.split('\n'):
+        match = GETPROP_LINE.match(line.strip())
+        if match:
+            props[match.group(1)] = match.group(2)
+    return {field: props[prop] for field, prop in PROPERTY_FIELDS.items() if props.get(prop)}
+
+
+def parse_resolution(output):
+    # "Override size" wins over "Physical size" when both are printed
+    sizes = dict(re.findall(r'(Physical|Override) size: (\S+)', output))
+    size = sizes.get('Override') or sizes.get('Physical')
+    return {'resolution': size} if size else {}
+
+
+def parse_battery(output):
+    info = {}
+    for line in output.split('\n'):
+        key, _, value = line.strip().partition(':')
+        value = value.strip()
+        if key == 'level' and value:
+            info['battery_level'] = value + '%'
+        elif key == 'status' and value:
+            info['battery_status'] = BATTERY_STATUS.get(value, f'Code {value}')
+    return info
+
+
+def parse_wifi(output):
+    # `cmd wifi status` leads with "Wifi is enabled|disabled"; later lines may
+    # mention "enabled" either way ("...only available when wifi is enabled")
+    match = re.search(r'^Wifi is (enabled|disabled)', output.strip(), re.IGNORECASE | re.MULTILINE)
+    if match:
+        return {'wifi_status': match.group(1).lower()}
+    text = output.strip().lower()
+    if text.isdigit():
+        # settings get global wifi_on: 0 = off, 1 = on, 2 = on but airplane mode saved it
+        return {'wifi_status': 'disabled' if text == '0' else 'enabled'}
+    return {}
+
+
+def parse_screen(output):
+    match = re.search(r'Display Power: state=(\w+)', output)
+    if match:
+        return {'screen_status': 'on' if match.group(1) == 'ON' else 'off'}
+    match = re.search(r'mWakefulness=(\w+)', output)
+    if match:
+        return {'screen_status': 'on' if match.group(1) == 'Awake' else 'off'}
+    return {}
+
+
+# section name -> (shell command, parser, fields it produces)
+PROBE_SECTIONS = {
+    'props': ('getprop', parse_props, list(PROPERTY_FIELDS)),
+    'resolution': ('wm size', parse_resolution, ['resolution']),
+    'battery': ('dumpsys battery', parse_battery, ['battery_level', 'battery_status']),
+    # `cmd wifi status` is a few lines; `dumpsys wifi` can be several hundred KB
+    'wifi': ('cmd wifi status 2>/dev/null || settings get global wifi_on', parse_wifi, ['wifi_status']),
+    'screen': ("dumpsys power | grep -E 'Display Power: state=|mWakefulness='", parse_screen, ['screen_status']),
+}
+
+FIELD_SECTIONS = {field: name for name, (_, _, fields) in PROBE_SECTIONS.items() for field in fields}
+
+
+def sections_for_fields(fields):
+    """Probe sections needed to produce the given fields"""
+    names = {FIELD_SECTIONS[field] for field in fields if field in FIELD_SECTIONS}
+    return [name for name in PROBE_SECTIONS if name in names]
+
+
+def build_probe_script(sections):
+    parts = []
+    for name in sections:
+        command = PROBE_SECTIONS[name][0]
+        parts.append(f"echo '{SECTION_MARKER}{name}'; {command}")
+    return '; '.join(parts)
+
+
+def parse_probe_output(output, sections):
+    """Split the combined output on the marker lines and parse each section"""
+    chunks = {}
+    current = None
+    lines = []
+    for line in output.split('\n'):
+        if line.startswith(SECTION_MARKER):
+            if current is not None:
+                chunks[current] = '\n'.join(lines)
+            current = line[len(SECTION_MARKER):].strip()
+            lines = []
+        elif current is not None:
+            lines.append(line)
+    if current is not None:
+        chunks[current] = '\n'.join(lines)
+
+    info = {}
+    for name in sections:
+        if name not in chunks:
+            continue
+        try:
+            info.update(PROBE_SECTIONS[name][1](chunks[name]))
+        except Exception as e:
+            print(f"[DEBUG] Error parsing probe section {name}: {e}")
+    return info
+
+
+def probe_device(device_id, sections=None, timeout=ADB_COMMAND_TIMEOUT):
+    """Run the probe script on a device in one adb shell round trip
+
+    Returns (fields, error); fields only contains values that were found.
+    """
+    sections = list(PROBE_SECTIONS) if sections is None else sections
+    if not sections:
+        return {}, None
+
+    start = time.time()
+    result = run_adb_shell(build_probe_script(sections), device_id, timeout)
+    print(f"[DEBUG] Probed {device_id} ({', '.join(sections)}) in {time.time() - start:.3f}s")
+    if not result['output'] and not result['success']:
+        return {}, result['error'] or 'Probe failed'
+    return parse_probe_output(result['output'], sections), None
@@ -0,0 +1,79 @@
+"""
+Screen capture straight into memory.
+
+`adb exec-out screencap -p` writes the PNG to the adb stream instead of a
+file on the device, so a screenshot needs no /sdcard temp file, no pull,
+no local temp file and no cleanup commands. Concurrent captures of the
+same device no longer collide on fixed file paths either.
+"""
+import subprocess
+
+from src.adb.client import (
+    ADB_COMMAND_TIMEOUT, ADB_NATIVE_CLIENT, AdbConnectionError, AdbError, adb_client
+)
+from src.adb.frames import parse_raw_screencap
+from src.adb.imaging import encode_image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class ScreenCaptureError(Exception):
+    """The device did not return a usable screenshot"""
+
+
+def exec_out(device_id, command, timeout=ADB_COMMAND_TIMEOUT):
+    """Binary-safe `adb exec-out`, in-process when possible"""
+    if ADB_NATIVE_CLIENT:
+        try:
+            return adb_client.exec_out(device_id, command, timeout)
+        except AdbConnectionError as e:
+            print(f"[DEBUG] {e}, falling back to adb binary")
+        except AdbError as e:
+            raise ScreenCaptureError(str(e))
+
+    argv = ['adb'] + (['-s', device_id] if device_id else []) + ['exec-out'] + command.split()
+    try:
+        result = subprocess.run(argv, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise ScreenCaptureError(f'Command timed out after {timeout} seconds')
+    except FileNotFoundError:
+        raise ScreenCaptureError('ADB not found. Please ensure Android SDK is installed and ADB is in PATH.')
+    if result.returncode != 0:
+        raise ScreenCaptureError(result.stderr.decode('utf-8', 'replace').strip() or 'exec-out failed')
+    return result.stdout
+
+
+def capture_png(device_id, timeout=ADB_COMMAND_TIMEOUT):
+    """Return the device screen as PNG bytes"""
+    data = exec_out(device_id, 'screencap -p', timeout)
+    if not data.startswith(PNG_SIGNATURE):
+        message = data[:200].decode('utf-8', 'replace').strip()
+        raise ScreenCaptureError(message or 'Device returned an empty screenshot')
+    return data
+
+
+def capture_raw(device_id, timeout=ADB_COMMAND_TIMEOUT):
+    """Return the device framebuffer as a RawFrame, skipping PNG encoding on the device"""
+    data = exec_out(device_id, 'screencap', timeout)
+    try:
+        return parse_raw_screencap(data)
+    except ValueError as e:
+        message = data[:200].decode('utf-8', 'replace').strip() if len(data) < 200 else ''
+        raise ScreenCaptureError(message or str(e))
+
+
+def capture_image(device_id, options, timeout=ADB_COMMAND_TIMEOUT):
+    """Capture the screen resized and encoded per ImageOptions, as an EncodedImage
+
+    Full-size PNGs are encoded on the device; anything else is encoded here
+    from the raw framebuffer, falling back to the device PNG if the
+    framebuffer format is not understood.
+    """
+    if options.original:
+        return encode_image(options, png=capture_png(device_id, timeout))
+    try:
+        raw = capture_raw(device_id, timeout)
+    except ScreenCaptureError as e:
+        print(f"[DEBUG] Raw capture failed for {device_id} ({e}), using PNG")
+        return encode_image(options, png=capture_png(device_id, timeout))
+    return encode_image(options, raw=raw)
@@ -0,0 +1,455 @@
+"""
+Shared live-view capture.
+
+Each device being watched has one FrameHub: a single capture worker that
+publishes frames to every subscriber. Any number of SSE connections can
+subscribe to the same device without adding adb load, and the worker stops
+by itself when the last subscriber leaves. Device liveness is checked only
+when a capture fails or the tracker reports a disconnect, not per frame.
+
+Frames are captured as raw framebuffers: unchanged screens are not sent at
+all, and subscribers that asked for tiles get only the changed regions.
+
+Frames go out either as SSE messages (JSON with base64 images) or, for
+clients that can read a streamed response body, as binary records:
+
+    u32 length of the rest of the record (0 = keepalive)
+    header, see BINARY_HEADER: kind, encoding, device id length, seq,
+        base_seq, timestamp (ms), width, height
+    device id (UTF-8)
+    payload: the image bytes (BINARY_FRAME), a u16 tile count followed by
+        u16 x, y, width, height, u32 size and PNG bytes per tile
+        (BINARY_TILES), or a JSON status message (BINARY_MESSAGE)
+"""
+import base64
+import itertools
+import json
+import os
+import struct
+import threading
+import time
+
+from src.adb.client import run_adb_command
+from src.adb.frames import changed_tiles, encode_png, tile_grid
+from src.adb.governor import CaptureGovernor, ClientGovernor
+from src.adb.imaging import ORIGINAL, encode_image
+from src.adb.screen import ScreenCaptureError, capture_png, capture_raw
+from src.adb.tracker import device_registry, get_live_registry
+
+LIVE_STREAM_INTERVAL = 2  # initial seconds between captures, see governor.py
+LIVE_STREAM_MAX_ERRORS = 5
+LIVE_STREAM_RAW = os.environ.get('LIVE_STREAM_RAW', '1') != '0'
+LIVE_STREAM_DELTA_MAX = 0.5  # above this share of changed tiles a full frame is sent
+
+# Binary transport, see the module docstring
+BINARY_LENGTH = struct.Struct('>I')
+BINARY_HEADER = struct.Struct('>BBHIIQHH')
+BINARY_TILE = struct.Struct('>HHHHI')
+BINARY_FRAME, BINARY_TILES, BINARY_MESSAGE = 1, 2, 3
+BINARY_ENCODINGS = {'json': 0, 'png': 1, 'jpeg': 2, 'webp': 3}
+BINARY_KEEPALIVE = BINARY_LENGTH.pack(0)
+
+
+def binary_record(kind, encoding, device_id, payload, seq=0, base_seq=0, timestamp=0, width=0, height=0):
+    device = device_id.encode('utf-8')
+    header = BINARY_HEADER.pack(kind, BINARY_ENCODINGS[encoding], len(device), seq, base_seq, timestamp,
+                                width, height)
+    return b''.join((BINARY_LENGTH.pack(len(header) + len(device) + len(payload)), header, device, payload))
+
+
+def binary_message(device_id, message):
+    """A status message (connected, error, stream_stats...) as a binary record"""
+    return binary_record(BINARY_MESSAGE, 'json', device_id, json.dumps(message).encode('utf-8'))
+
+
+class Frame:
+    """One captured screen image, encoded lazily and at most once per encoding"""
+
+    __slots__ = ('device_id', 'seq', 'timestamp', 'raw', '_png', '_encoded', '_sse', '_binary', '_lock')
+
+    def __init__(self, device_id, seq, png=None, raw=None):
+        self.device_id = device_id
+        self.seq = seq
+        self.timestamp = int(time.time() * 1000)
+        self.raw = raw
+        self._png = png
+        self._encoded = {}  # ImageOptions.key -> EncodedImage
+        self._sse = {}
+        self._binary = {}
+        self._lock = threading.Lock()
+
+    @property
+    def png(self):
+        return self.encoded(ORIGINAL).data
+
+    def encoded(self, options):
+        """The frame resized and encoded for options, shared by all subscribers"""
+        with self._lock:
+            image = self._encoded.get(options.key)
+            if image is None:
+                image = encode_image(options, raw=self.raw, png=self._png)
+                self._encoded[options.key] = image
+            return image
+
+    def sse_payload(self, options=ORIGINAL):
+        """The SSE message every subscriber with these options sends for this frame"""
+        payload = self._sse.get(options.key)
+        if payload is None:
+            image = self.encoded(options)
+            data = {
+                'type': 'screenshot',
+                'device_id': self.device_id,
+                'data': image.data_url(),
+                'timestamp': self.timestamp,
+                'seq': self.seq,
+                'format': image.format,
+                'width': image.width,
+                'height': image.height,
+                'encode_ms': image.encode_ms
+            }
+            payload = self._sse[options.key] = f"data: {json.dumps(data)}\n\n"
+        return payload
+
+    def binary_payload(self, options=ORIGINAL):
+        """The binary record for this frame: the encoded image, no base64"""
+        payload = self._binary.get(options.key)
+        if payload is None:
+            image = self.encoded(options)
+            payload = self._binary[options.key] = binary_record(
+                BINARY_FRAME, image.format, self.device_id, image.data,
+                self.seq, 0, self.timestamp, image.width, image.height)
+        return payload
+
+
+class TileFrame:
+    """The regions that changed between frame base_seq and frame seq"""
+
+    __slots__ = ('device_id', 'seq', 'base_seq', 'timestamp', 'width', 'height', 'tiles', 'encode_ms', '_sse',
+                 '_binary')
+
+    def __init__(self, device_id, seq, base_seq, width, height, tiles, encode_ms=0.0):
+        self.device_id = device_id
+        self.seq = seq
+        self.base_seq = base_seq
+        self.timestamp = int(time.time() * 1000)
+        self.width = width
+        self.height = height
+        self.tiles = tiles  # (x, y) -> (width, height, png)
+        self.encode_ms = encode_ms
+        self._sse = None
+        self._binary = None
+
+    @classmethod
+    def from_raw(cls, device_id, seq, base_seq, raw, regions):
+        start = time.time()
+        tiles = {(x, y): (w, h, encode_png(raw, x, y, w, h)) for x, y, w, h in regions}
+        return cls(device_id, seq, base_seq, raw.width, raw.height, tiles, round((time.time() - start) * 1000, 1))
+
+    def merged(self, newer):
+        """One delta covering both; newer tiles replace older ones"""
+        tiles = dict(self.tiles)
+        tiles.update(newer.tiles)
+        return TileFrame(self.device_id, newer.seq, self.base_seq, newer.width, newer.height, tiles,
+                         self.encode_ms + newer.encode_ms)
+
+    def sse_payload(self, options=None):
+        if self._sse is None:
+            data = {
+                'type': 'tiles',
+                'device_id': self.device_id,
+                'seq': self.seq,
+                'base_seq': self.base_seq,
+                'width': self.width,
+                'height': self.height,
+                'timestamp': self.timestamp,
+                'tiles': [
+                    {'x': x, 'y': y, 'w': w, 'h': h, 'data': base64.b64encode(png).decode('utf-8')}
+                    for (x, y), (w, h, png) in self.tiles.items()
+                ]
+            }
+            self._sse = f"data: {json.dumps(data)}\n\n"
+        return self._sse
+
+    def binary_payload(self, options=None):
+        if self._binary is None:
+            parts = [struct.pack('>H', len(self.tiles))]
+            for (x, y), (w, h, png) in self.tiles.items():
+                parts.append(BINARY_TILE.pack(x, y, w, h, len(png)))
+                parts.append(png)
+            self._binary = binary_record(BINARY_TILES, 'png', self.device_id, b''.join(parts),
+                                         self.seq, self.base_seq, self.timestamp, self.width, self.height)
+        return self._binary
+
+
+class Subscriber:
+    """A viewer of one device's stream.
+
+    Only the newest frame is kept: a slow viewer skips frames instead of
+    queueing them. Status messages (errors, stop) are never dropped.
+
+    A tile subscriber gets a TileFrame when it already has the frame the
+    delta is based on; pending deltas are merged, so skipping frames never
+    leaves the viewer with a gap. Otherwise it gets the full frame.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, hub, tiles=False, options=ORIGINAL):
+        self.id = next(self._ids)
+        self.hub = hub
+        self.device_id = hub.device_id
+        self.governor = ClientGovernor(options)
+        # Tiles are cut from the full-size frame, so only for original PNG
+        self.tiles = tiles and options.original
+        self._seq = 0  # newest frame delivered or pending
+        self._frame = None
+        self._messages = []
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def options(self):
+        """Image options, with the quality the governor currently allows"""
+        return self.governor.options
+
+    def push_frame(self, frame, delta=None):
+        with self._cond:
+            if frame.seq <= self._seq:
+                return
+            pending = self._frame
+            if isinstance(pending, Frame):
+                # Never delivered: the viewer is slower than the capture rate
+                self.governor.frames_dropped += 1
+            if (self.tiles and delta is not None and delta.base_seq == self._seq
+                    and (pending is None or isinstance(pending, TileFrame))):
+                self._frame = pending.merged(delta) if pending is not None else delta
+            else:
+                self._frame = frame
+            self._seq = frame.seq
+            self._cond.notify()
+
+    def push_message(self, message, close=False):
+        with self._cond:
+            self._messages.append(message)
+            if close:
+                self._closed = True
+            self._cond.notify()
+
+    def next_event(self, timeout=None):
+        """Return a status message dict, a Frame or TileFrame, or None on timeout
+
+        After the stream was closed, returns {'type': 'stopped'} once all
+        pending messages have been delivered.
+        """
+        with self._cond:
+            if not self._messages and self._frame is None and not self._closed:
+                self._cond.wait(timeout)
+            if self._messages:
+                return self._messages.pop(0)
+            if self._frame is not None:
+                frame, self._frame = self._frame, None
+                return frame
+            if self._closed:
+                return {'type': 'stopped'}
+            return None
+
+
+class FrameHub:
+    """Single capture worker for one device, fanning frames out to subscribers"""
+
+    def __init__(self, manager, device_id):
+        self.manager = manager
+        self.device_id = device_id
+        self.subscribers = {}
+        self.frames_captured = 0
+        self.frames_unchanged = 0
+        self.last_frame = None
+        self.raw_capture = LIVE_STREAM_RAW
+        self.governor = CaptureGovernor(LIVE_STREAM_INTERVAL)
+        self._seq = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'live-{device_id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, message=None):
+        """Stop capturing and close every subscriber"""
+        self._stopped.set()
+        for subscriber in list(self.subscribers.values()):
+            if message:
+                subscriber.push_message(message)
+            subscriber.push_message({'type': 'stopped'}, close=True)
+
+    @property
+    def running(self):
+        return not self._stopped.is_set()
+
+    def _publish(self, frame, delta=None):
+        self.last_frame = frame
+        for subscriber in list(self.subscribers.values()):
+            subscriber.push_frame(frame, delta)
+
+    def _error(self, error):
+        return {'type': 'error', 'device_id': self.device_id, 'error': error}
+
+    def _device_connected(self):
+        """Liveness check, only run after a failed capture"""
+        registry = get_live_registry(timeout=0)
+        if registry is not None:
+            device = registry.get(self.device_id)
+            return device is not None and device['status'] == 'device'
+        result = run_adb_command('get-state', self.device_id)
+        return result['success'] and result['output'] == 'device'
+
+    def _capture(self):
+        """Capture the screen; returns (frame, delta), or None if nothing changed"""
+        previous = self.last_frame
+        if not self.raw_capture:
+            png = capture_png(self.device_id)
+            if previous is not None and png == previous.png:
+                return None
+            self._seq += 1
+            return Frame(self.device_id, self._seq, png=png), None
+
+        raw = capture_raw(self.device_id)
+        previous_raw = previous.raw if previous is not None else None
+        same_size = raw.same_size(previous_raw)
+        if same_size and raw.pixels == previous_raw.pixels:
+            return None
+        self._seq += 1
+        frame = Frame(self.device_id, self._seq, raw=raw)
+        delta = None
+        if same_size and any(s.tiles for s in list(self.subscribers.values())):
+            regions = changed_tiles(previous_raw, raw)
+            if len(regions) <= LIVE_STREAM_DELTA_MAX * len(tile_grid(raw)):
+                delta = TileFrame.from_raw(self.device_id, self._seq, previous.seq, raw, regions)
+        return frame, delta
+
+    def _run(self):
+        error_count = 0
+        while self.running:
+            started = time.time()
+            try:
+                captured = self._capture()
+                self.governor.record_capture(time.time() - started)
+                error_count = 0
+                if captured is None:
+                    self.frames_unchanged += 1
+                else:
+                    self.frames_captured += 1
+                    self._publish(*captured)
+            except ScreenCaptureError as e:
+                if self.raw_capture and self.last_frame is None:
+                    # Framebuffer format not understood: let the device encode PNGs
+                    print(f"[DEBUG] Raw capture failed for {self.device_id} ({e}), using PNG")
+                    self.raw_capture = False
+                    continue
+                error_count += 1
+                if not self._device_connected():
+                    self.manager.close_hub(self, self._error('Device disconnected or not available'))
+                    break
+                if error_count >= LIVE_STREAM_MAX_ERRORS:
+                    self.manager.close_hub(self, self._error(f'Too many errors, stopping stream: {e}'))
+                    break
+                print(f"[DEBUG] Live capture failed for {self.device_id}: {e}")
+            except Exception as e:
+                error_count += 1
+                print(f"[DEBUG] Live stream error for {self.device_id}: {e}")
+                if error_count >= LIVE_STREAM_MAX_ERRORS:
+                    self.manager.close_hub(self, self._error(f'Stream error: {e}'))
+                    break
+
+            subscribers = list(self.subscribers.values())
+            if self.governor.update([subscriber.governor.wanted_interval() for subscriber in subscribers]):
+                print(f"[DEBUG] Live interval for {self.device_id} now {self.governor.interval:.2f}s: {self.governor.reason}")
+
+            # Wait out the rest of the interval, waking early on stop
+            self._stopped.wait(max(0, self.governor.interval - (time.time() - started)))
+
+
+class StreamManager:
+    """Registry of capture hubs, one per watched device"""
+
+    def __init__(self):
+        self.hubs = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, device_id, tiles=False, options=ORIGINAL):
+        """Attach a new subscriber, starting the device's capture worker if needed"""
+        with self._lock:
+            hub = self.hubs.get(device_id)
+            if hub is None or not hub.running:
+                hub = FrameHub(self, device_id)
+                self.hubs[device_id] = hub
+                hub.start()
+            subscriber = Subscriber(hub, tiles, options)
+            hub.subscribers[subscriber.id] = subscriber
+            # New viewers see the current screen immediately
+            if hub.last_frame is not None:
+                subscriber.push_frame(hub.last_frame)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Detach a subscriber; the worker stops when the last one leaves"""
+        with self._lock:
+            hub = subscriber.hub
+            hub.subscribers.pop(subscriber.id, None)
+            if not hub.subscribers:
+                hub.stop()
+                if self.hubs.get(hub.device_id) is hub:
+                    del self.hubs[hub.device_id]
+
+    def stop_subscriber(self, device_id, subscriber_id):
+        """Close one viewer's stream; returns False if it is unknown"""
+        with self._lock:
+            hub = self.hubs.get(device_id)
+            subscriber = hub.subscribers.get(subscriber_id) if hub else None
+        if subscriber is None:
+            return False
+        subscriber.push_message({'type': 'stopped'}, close=True)
+        return True
+
+    def close_hub(self, hub, message=None):
+        """Stop a device's stream for all of its subscribers"""
+        with self._lock:
+            if self.hubs.get(hub.device_id) is hub:
+                del self.hubs[hub.device_id]
+        hub.stop(message)
+
+    def stop_device(self, device_id, message=None):
+        with self._lock:
+            hub = self.hubs.get(device_id)
+        if hub is None:
+            return False
+        self.close_hub(hub, message)
+        return True
+
+    def status(self):
+        with self._lock:
+            return {
+                device_id: {
+                    'subscribers': len(hub.subscribers),
+                    'frames_captured': hub.frames_captured,
+                    'frames_unchanged': hub.frames_unchanged,
+                    'interval': round(hub.governor.interval, 3),
+                    'interval_reason': hub.governor.reason,
+                    'capture_fps': hub.governor.meter.rate()
+                }
+                for device_id, hub in self.hubs.items()
+            }
+
+
+stream_manager = StreamManager()
+
+
+def _stop_streams_on_disconnect(event, serial, status):
+    if event == 'removed' or status != 'device':
+        stream_manager.stop_device(serial, {
+            'type': 'error',
+            'device_id': serial,
+            'error': 'Device disconnected or not available'
+        })
+
+
+device_registry.add_listener(_stop_streams_on_disconnect)
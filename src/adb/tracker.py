@@ -0,0 +1,181 @@
+"""
+Push-based device inventory.
+
+A single background thread holds a `host:track-devices` stream open to the
+adb server. The server pushes the full device list whenever a device is
+connected, disconnected or changes state, and the thread applies it to an
+in-memory DeviceRegistry. Routes read the registry instead of running
+`adb devices` / `adb get-state` on every refresh.
+
+Every change bumps the registry version and stamps the devices it touched
+with it, so a client that last saw version N can be told just which
+devices were added, changed or removed since (DeviceRegistry.changes).
+"""
+import collections
+import threading
+import time
+
+from src.adb.client import AdbError, adb_client, run_adb_command
+
+# Seconds to wait before reconnecting a dropped track-devices stream
+TRACKER_RETRY_DELAYS = [0.5, 1, 2, 5, 10]
+REGISTRY_REMOVED_KEPT = 256  # removals remembered for delta queries
+
+
+class DeviceRegistry:
+    """In-memory list of devices known to the adb server"""
+
+    def __init__(self):
+        self._devices = {}  # serial -> {'id', 'status', 'since', 'version'}
+        self._removed = collections.deque(maxlen=REGISTRY_REMOVED_KEPT)  # (version, serial)
+        self._lock = threading.Lock()
+        self._listeners = []
+        # Counting from the clock, versions handed out before a restart are never mistaken for current ones
+        self.version = self._first_version = int(time.time() * 1000)
+        self.live = False
+        self.ready = threading.Event()
+
+    def add_listener(self, callback):
+        """Register callback(event, serial, status); event is added, removed or changed"""
+        self._listeners.append(callback)
+
+    def update(self, device_list):
+        """Apply a full (serial, state) list pushed by the adb server"""
+        events = []
+        with self._lock:
+            current = {}
+            version = self.version + 1
+            for serial, status in device_list:
+                previous = self._devices.get(serial)
+                if previous is None:
+                    current[serial] = {'id': serial, 'status': status, 'since': time.time(), 'version': version}
+                    events.append(('added', serial, status))
+                elif previous['status'] != status:
+                    current[serial] = dict(previous, status=status, since=time.time(), version=version)
+                    events.append(('changed', serial, status))
+                else:
+                    current[serial] = previous
+            for serial, previous in self._devices.items():
+                if serial not in current:
+                    events.append(('removed', serial, previous['status']))
+                    self._removed.append((version, serial))
+            self._devices = current
+            if events:
+                self.version = version
+        self.ready.set()
+
+        for event, serial, status in events:
+            print(f"[DEBUG] Device {serial} {event} ({status})")
+            for callback in self._listeners:
+                try:
+                    callback(event, serial, status)
+                except Exception as e:
+                    print(f"[DEBUG] Device listener error: {e}")
+
+    def snapshot(self):
+        """Copy of all devices in adb server order"""
+        with self._lock:
+            return [dict(device) for device in self._devices.values()]
+
+    def versioned_snapshot(self):
+        """(version, snapshot()) taken together"""
+        with self._lock:
+            return self.version, [dict(device) for device in self._devices.values()]
+
+    def touch(self, serial):
+        """Mark a device changed for something the registry does not track itself, like its name"""
+        with self._lock:
+            device = self._devices.get(serial)
+            if device is not None:
+                self.version += 1
+                self._devices[serial] = dict(device, version=self.version)
+
+    def changes(self, since):
+        """(version, changed devices, removed serials) after version `since`
+        
+        Returns None if `since` is not a version this registry can answer
+        for: from before a restart, from the future, or older than the
+        removals it still remembers.
+        """
+        with self._lock:
+            if since > self.version or since < self._first_version:
+                return None
+            if len(self._removed) == self._removed.maxlen and since < self._removed[0][0]:
+                return None
+            changed = [dict(device) for device in self._devices.values() if device['version'] > since]
+            removed = list(dict.fromkeys(serial for version, serial in self._removed
+                                         if version > since and serial not in self._devices))
+            return self.version, changed, removed
+
+    def ids(self):
+        with self._lock:
+            return list(self._devices)
+
+    def get(self, serial):
+        with self._lock:
+            device = self._devices.get(serial)
+            return dict(device) if device else None
+
+
+class DeviceTracker:
+    """Keeps one track-devices stream open and feeds a DeviceRegistry"""
+
+    def __init__(self, registry, client=adb_client):
+        self.registry = registry
+        self.client = client
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        """Start the watcher thread once; safe to call from every request"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='adb-device-tracker', daemon=True)
+                self._thread.start()
+        return self.registry
+
+    def _run(self):
+        failures = 0
+        while True:
+            try:
+                for device_list in self.client.track_devices():
+                    self.registry.live = True
+                    failures = 0
+                    self.registry.update(device_list)
+            except AdbError as e:
+                print(f"[DEBUG] Device tracker disconnected: {e}")
+            except OSError as e:
+                print(f"[DEBUG] Device tracker socket error: {e}")
+            self.registry.live = False
+            # Don't keep requests waiting for a first snapshot that isn't coming
+            self.registry.ready.set()
+
+            if failures == 0:
+                # The adb binary starts the server if it is not running yet
+                run_adb_command('start-server')
+            delay = TRACKER_RETRY_DELAYS[min(failures, len(TRACKER_RETRY_DELAYS) - 1)]
+            failures += 1
+            time.sleep(delay)
+
+
+device_registry = DeviceRegistry()
+device_tracker = DeviceTracker(device_registry)
+
+
+def _forget_device(event, serial, status):
+    # Cached features may change across reconnects (e.g. after an OTA)
+    adb_client.forget_device(serial)
+
+
+device_registry.add_listener(_forget_device)
+
+
+def get_live_registry(timeout=2):
+    """Return the registry if the watcher is connected, else None.
+
+    Callers fall back to asking adb directly when this returns None.
+    """
+    device_tracker.ensure_running()
+    if device_registry.ready.wait(timeout) and device_registry.live:
+        return device_registry
+    return None
@@ -0,0 +1,452 @@
+"""
+H.264 live view.
+
+`adb exec-out screenrecord --output-format=h264 -` makes the device's own
+hardware encoder stream the screen as raw H.264, which gives 15-30 fps at a
+fraction of the bandwidth of repeated PNG screenshots. The stream is split
+into NAL units and fanned out to every viewer of the device, like FrameHub
+does for screenshots.
+
+screenrecord stops itself at its time limit (180 s on most devices), so the
+hub starts the next recording shortly before the current one expires and
+switches viewers over at the new recording's first keyframe. Viewers that
+join mid-stream get the parameter sets and the current group of pictures
+so they can start decoding immediately.
+"""
+import itertools
+import os
+import socket
+import subprocess
+import threading
+import time
+
+from src.adb.client import ADB_NATIVE_CLIENT, AdbConnectionError, AdbError, adb_client
+from src.adb.locks import LockTimeout, lock_manager
+from src.adb.tracker import device_registry, get_live_registry
+
+LIVE_VIDEO_BIT_RATE = int(os.environ.get('LIVE_VIDEO_BIT_RATE', '4000000'))
+LIVE_VIDEO_TIME_LIMIT = int(os.environ.get('LIVE_VIDEO_TIME_LIMIT', '180'))
+LIVE_VIDEO_RESTART_OVERLAP = 2  # seconds the next recording starts early
+LIVE_VIDEO_MAX_ERRORS = 5
+LIVE_VIDEO_GOP_LIMIT = 8 * 1024 * 1024  # bytes of cached GOP for late joiners
+LIVE_VIDEO_SUBSCRIBER_BUFFER = 4 * 1024 * 1024  # bytes a slow viewer may lag
+
+START_CODE = b'\x00\x00\x00\x01'
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SPS = 7
+NAL_PPS = 8
+# Access unit delimiter: a valid no-op NAL unit, used as keepalive
+ACCESS_UNIT_DELIMITER = START_CODE + b'\x09\xf0'
+
+
+def nal_type(nal):
+    return nal[0] & 0x1f if nal else 0
+
+
+class NalSplitter:
+    """Split an Annex B byte stream into NAL units (without start codes)"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._synced = False
+
+    def feed(self, data):
+        buf = self._buffer
+        scan = max(0, len(buf) - 3)
+        buf.extend(data)
+        if not self._synced:
+            index = buf.find(b'\x00\x00\x01')
+            if index < 0:
+                del buf[:-3]
+                return []
+            del buf[:index + 3]
+            self._synced = True
+            scan = 0
+
+        units = []
+        start = 0
+        while True:
+            index = buf.find(b'\x00\x00\x01', scan)
+            if index < 0:
+                break
+            end = index
+            # Zero bytes before a start code belong to the start code
+            while end > start and buf[end - 1] == 0:
+                end -= 1
+            if end > start:
+                units.append(bytes(buf[start:end]))
+            start = scan = index + 3
+        del buf[:start]
+        return units
+
+    def flush(self):
+        """Return the last NAL unit once the stream has ended"""
+        unit = bytes(self._buffer) if self._synced and self._buffer else None
+        self._buffer = bytearray()
+        self._synced = False
+        return [unit] if unit else []
+
+
+def screenrecord_command(bit_rate=LIVE_VIDEO_BIT_RATE, size=None, time_limit=LIVE_VIDEO_TIME_LIMIT):
+    command = f'screenrecord --output-format=h264 --bit-rate {int(bit_rate)} --time-limit {int(time_limit)}'
+    if size:
+        command += f' --size {size}'
+    return command + ' -'
+
+
+class Recording:
+    """One screenrecord process streaming H.264 from a device"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, hub):
+        self.id = next(self._ids)
+        self.hub = hub
+        self.started = time.time()
+        self.bytes_read = 0
+        self.config = {}  # parameter sets seen before the first keyframe
+        self._interrupt = None
+        self._stopped = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'video-{hub.device_id}-{self.id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._interrupt is not None:
+            # Unblocks the reader thread
+            try:
+                self._interrupt()
+            except OSError:
+                pass
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def _open(self):
+        """Yield raw H.264 chunks from the device"""
+        command = self.hub.command
+        if ADB_NATIVE_CLIENT:
+            try:
+                sock = adb_client.open_service(self.hub.device_id, f'exec:{command}')
+            except AdbConnectionError as e:
+                print(f"[DEBUG] {e}, falling back to adb binary")
+            else:
+                self._interrupt = lambda: sock.shutdown(socket.SHUT_RDWR)
+                try:
+                    while not self._stopped.is_set():
+                        data = sock.recv(65536)
+                        if not data:
+                            return
+                        yield data
+                finally:
+                    sock.close()
+                return
+
+        argv = ['adb', '-s', self.hub.device_id, 'exec-out'] + command.split()
+        process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._interrupt = process.kill
+        try:
+            while not self._stopped.is_set():
+                data = process.stdout.read1(65536)
+                if not data:
+                    return
+                yield data
+        finally:
+            process.kill()
+            process.wait()
+
+    def _run(self):
+        splitter = NalSplitter()
+        try:
+            for data in self._open():
+                self.bytes_read += len(data)
+                for nal in splitter.feed(data):
+                    self.hub.on_nal(self, nal)
+            for nal in splitter.flush():
+                self.hub.on_nal(self, nal)
+        except (AdbError, OSError, ValueError) as e:
+            if not self._stopped.is_set():
+                print(f"[DEBUG] Screen recording failed for {self.hub.device_id}: {e}")
+        finally:
+            self._done.set()
+            self.hub.on_recording_done(self)
+
+
+class VideoSubscriber:
+    """A viewer of one device's H.264 stream
+
+    NAL units are queued up to LIVE_VIDEO_SUBSCRIBER_BUFFER bytes. A viewer
+    that falls further behind is reset: its backlog is dropped and it
+    resumes at the next keyframe, so it never sees a broken reference chain.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, hub):
+        self.id = next(self._ids)
+        self.hub = hub
+        self.device_id = hub.device_id
+        self.resets = 0
+        self._chunks = []
+        self._size = 0
+        self._needs_keyframe = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def push(self, data, keyframe=False):
+        with self._cond:
+            if self._needs_keyframe:
+                if not keyframe:
+                    return
+                self._needs_keyframe = False
+            if self._size + len(data) > LIVE_VIDEO_SUBSCRIBER_BUFFER:
+                self._chunks, self._size = [], 0
+                self.resets += 1
+                if not keyframe:
+                    self._needs_keyframe = True
+                    return
+            self._chunks.append(data)
+            self._size += len(data)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def next_chunk(self, timeout=None):
+        """Return queued stream bytes, b'' on timeout, or None once closed"""
+        with self._cond:
+            if not self._chunks and not self._closed:
+                self._cond.wait(timeout)
+            if self._chunks:
+                data = b''.join(self._chunks)
+                self._chunks, self._size = [], 0
+                return data
+            return None if self._closed else b''
+
+
+class VideoHub:
+    """Shared screenrecord stream for one device and encoder setting"""
+
+    def __init__(self, manager, device_id, bit_rate=LIVE_VIDEO_BIT_RATE, size=None):
+        self.manager = manager
+        self.device_id = device_id
+        self.key = (device_id, bit_rate, size)
+        self.command = screenrecord_command(bit_rate, size)
+        self.subscribers = {}
+        self.frames = 0
+        self.restarts = 0
+        self.errors = 0
+        self._recordings = 0
+        self._active = None
+        self._pending = None
+        self._config = {}  # NAL type -> latest SPS / PPS
+        self._gop = []
+        self._gop_size = 0
+        self._lease = None  # shared lease on the device screen while the hub runs
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'video-{device_id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    @property
+    def running(self):
+        return not self._stopped.is_set()
+
+    def add_subscriber(self, subscriber):
+        """Attach a viewer, priming it with the current GOP if there is one"""
+        with self._lock:
+            self.subscribers[subscriber.id] = subscriber
+            if self._gop:
+                subscriber.push(b''.join(self._gop), keyframe=True)
+
+    def remove_subscriber(self, subscriber):
+        """Detach a viewer; returns how many are left"""
+        with self._lock:
+            self.subscribers.pop(subscriber.id, None)
+            return len(self.subscribers)
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        for recording in (self._active, self._pending):
+            if recording is not None:
+                recording.stop()
+        for subscriber in list(self.subscribers.values()):
+            subscriber.close()
+        if self._lease is not None:
+            lock_manager.release(self._lease)
+
+    def on_nal(self, recording, nal):
+        kind = nal_type(nal)
+        with self._lock:
+            if recording is self._pending:
+                if kind in (NAL_SPS, NAL_PPS):
+                    recording.config[kind] = nal
+                    return
+                if kind != NAL_IDR:
+                    return
+                # The next recording has its first keyframe: switch viewers over
+                previous, self._active, self._pending = self._active, recording, None
+                self._config = recording.config
+                self.errors = 0
+                if previous is not None:
+                    previous.stop()
+            elif recording is not self._active:
+                return
+
+            if kind in (NAL_SPS, NAL_PPS):
+                self._config[kind] = nal
+                return
+
+            data = START_CODE + nal
+            keyframe = kind == NAL_IDR
+            if keyframe:
+                # Parameter sets go out in front of every keyframe
+                data = b''.join(START_CODE + self._config[k] for k in (NAL_SPS, NAL_PPS) if k in self._config) + data
+                self._gop, self._gop_size = [], 0
+            if kind in (NAL_SLICE, NAL_IDR):
+                self.frames += 1
+            if self._gop_size + len(data) <= LIVE_VIDEO_GOP_LIMIT and (keyframe or self._gop):
+                self._gop.append(data)
+                self._gop_size += len(data)
+            else:
+                # Too big to replay; late joiners wait for the next keyframe
+                self._gop, self._gop_size = [], 0
+            for subscriber in self.subscribers.values():
+                subscriber.push(data, keyframe)
+
+    def on_recording_done(self, recording):
+        with self._lock:
+            if recording is self._pending:
+                # Ended without ever producing a keyframe
+                self._pending = None
+                self.errors += 1
+            elif recording is self._active:
+                self._active = None
+        self._wake.set()
+
+    def _device_connected(self):
+        registry = get_live_registry(timeout=0)
+        if registry is None:
+            return True
+        device = registry.get(self.device_id)
+        return device is not None and device['status'] == 'device'
+
+    def _start_recording(self):
+        recording = Recording(self)
+        with self._lock:
+            if self._recordings:
+                self.restarts += 1
+            self._recordings += 1
+            # Viewers are switched to it at its first keyframe
+            self._pending = recording
+        recording.start()
+
+    def _run(self):
+        try:
+            # One screenrecord per device: a recording, or one live video setting, at a time
+            self._lease = lock_manager.acquire(self.device_id, 'screen', 'exclusive', owner='live-video', lease=None)
+        except LockTimeout as e:
+            print(f"[DEBUG] H.264 stream for {self.device_id} not started: {e}")
+            self.manager.close_hub(self)
+            return
+        if not self.running:
+            lock_manager.release(self._lease)
+            return
+        while self.running:
+            self._wake.clear()
+            with self._lock:
+                active, pending, errors = self._active, self._pending, self.errors
+            if errors and pending is None and active is None:
+                if errors >= LIVE_VIDEO_MAX_ERRORS or not self._device_connected():
+                    print(f"[DEBUG] Giving up on H.264 stream for {self.device_id}")
+                    self.manager.close_hub(self)
+                    return
+                if self._stopped.wait(1):
+                    return
+
+            if pending is None:
+                # Start the next recording before screenrecord's time limit hits
+                switch_at = active.started + LIVE_VIDEO_TIME_LIMIT - LIVE_VIDEO_RESTART_OVERLAP if active else 0
+                if time.time() >= switch_at:
+                    self._start_recording()
+                    continue
+                self._wake.wait(switch_at - time.time())
+            else:
+                self._wake.wait(1)
+
+
+class VideoManager:
+    """Registry of H.264 hubs, one per device and encoder setting"""
+
+    def __init__(self):
+        self.hubs = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, device_id, bit_rate=LIVE_VIDEO_BIT_RATE, size=None):
+        key = (device_id, bit_rate, size)
+        with self._lock:
+            hub = self.hubs.get(key)
+            if hub is None or not hub.running:
+                hub = VideoHub(self, device_id, bit_rate, size)
+                self.hubs[key] = hub
+                hub.start()
+            subscriber = VideoSubscriber(hub)
+            hub.add_subscriber(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            hub = subscriber.hub
+            if not hub.remove_subscriber(subscriber):
+                hub.stop()
+                if self.hubs.get(hub.key) is hub:
+                    del self.hubs[hub.key]
+
+    def close_hub(self, hub):
+        with self._lock:
+            if self.hubs.get(hub.key) is hub:
+                del self.hubs[hub.key]
+        hub.stop()
+
+    def stop_device(self, device_id):
+        with self._lock:
+            hubs = [hub for key, hub in self.hubs.items() if key[0] == device_id]
+        for hub in hubs:
+            self.close_hub(hub)
+        return bool(hubs)
+
+    def status(self):
+        with self._lock:
+            return [
+                {
+                    'device_id': hub.device_id,
+                    'bit_rate': hub.key[1],
+                    'size': hub.key[2],
+                    'subscribers': len(hub.subscribers),
+                    'frames': hub.frames,
+                    'restarts': hub.restarts
+                }
+                for hub in self.hubs.values()
+            ]
+
+
+video_manager = VideoManager()
+
+
+def _stop_video_on_disconnect(event, serial, status):
+    if event == 'removed' or status != 'device':
+        video_manager.stop_device(serial)
+
+
+device_registry.add_listener(_stop_video_on_disconnect)
@@ -5,12 +5,24 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from src.models.user import db
+from src.models.store import store
 from src.routes.devices import devices_bp
 from src.routes.scripts import scripts_bp
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# The database is created on first start; a fresh checkout has no database folder yet
+os.makedirs(os.path.join(os.path.dirname(__file__), 'database'), exist_ok=True)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}")
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+# With the reloader (debug=True) this module is run by a watcher process and again by the
+# serving child; only one of them may restore jobs and write behind, or both write the same events
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    store.init_app(app)
 
 # Enable CORS for all routes
 CORS(app, origins="*")
@@ -0,0 +1,36 @@
+from src.models.user import db
+
+class Device(db.Model):
+    """A device the adb server has reported, and when"""
+    serial = db.Column(db.String(128), primary_key=True)
+    status = db.Column(db.String(32))
+    first_seen = db.Column(db.Float, nullable=False)
+    last_seen = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<Device {self.serial}>'
+
+    def to_dict(self):
+        return {
+            'serial': self.serial,
+            'status': self.status,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen
+        }
+
+
+class DeviceAlias(db.Model):
+    """The name shown for a device instead of its serial"""
+    serial = db.Column(db.String(128), primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<DeviceAlias {self.serial}={self.name}>'
+
+    def to_dict(self):
+        return {
+            'serial': self.serial,
+            'name': self.name,
+            'updated_at': self.updated_at
+        }
@@ -0,0 +1,43 @@
+from src.models.user import db
+
+class JobRecord(db.Model):
+    """Last known state of a script run (see src/adb/jobs.py)"""
+    __tablename__ = 'job'
+
+    id = db.Column(db.String(36), primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    priority = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, index=True)
+    devices = db.Column(db.JSON, nullable=False)
+    fields = db.Column(db.JSON, nullable=False)  # status, progress, message and script specific fields
+    device_timing = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+    started_at = db.Column(db.Float)
+    finished_at = db.Column(db.Float)
+    version = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<JobRecord {self.id} {self.name}>'
+
+    def to_dict(self):
+        return dict(self.fields, job_id=self.id, name=self.name, priority=self.priority, devices=self.devices,
+                    created_at=self.created_at, started_at=self.started_at, finished_at=self.finished_at,
+                    device_timing=self.device_timing, version=self.version)
+
+
+class JobEvent(db.Model):
+    """One status delta of a job, as pushed to its watchers"""
+    __tablename__ = 'job_event'
+    __table_args__ = (db.UniqueConstraint('job_id', 'version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(36), db.ForeignKey('job.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    time = db.Column(db.Float, nullable=False)
+    delta = db.Column(db.JSON, nullable=False)
+
+    def __repr__(self):
+        return f'<JobEvent {self.job_id}#{self.version}>'
+
+    def to_dict(self):
+        return dict(self.delta, version=self.version, time=self.time)
@@ -0,0 +1,17 @@
+from src.models.user import db
+
+class Setting(db.Model):
+    """A named piece of state that should survive a restart, stored as JSON"""
+    key = db.Column(db.String(80), primary_key=True)
+    value = db.Column(db.JSON)
+    updated_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<Setting {self.key}>'
+
+    def to_dict(self):
+        return {
+            'key': self.key,
+            'value': self.value,
+            'updated_at': self.updated_at
+        }
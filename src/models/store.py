@@ -0,0 +1,378 @@
+"""
+Write-behind persistence for device aliases, job history and settings.
+
+Names, job status and uploaded file paths used to live only in module
+level dicts: a restart lost them, and a second worker process never saw
+them. They are now stored in the database, but job status changes many
+times a second while scripts run, and a transaction per change would put
+SQLite's fsync into the automation loop. So every change goes into an
+in-memory buffer first, and one flusher thread writes the buffer in a
+single transaction every PERSIST_FLUSH_INTERVAL seconds, or sooner once
+PERSIST_BATCH_MAX job events are waiting:
+
+- a job is written once per flush however often it changed, with its
+  latest snapshot; each of its deltas becomes a JobEvent row;
+- devices seen by the tracker, aliases and settings are upserted.
+
+Reads are served from memory. Aliases set by other processes are picked
+up every PERSIST_RELOAD_INTERVAL seconds. On startup finished jobs are
+put back into the job history, and jobs that were still queued or
+running are marked as interrupted.
+
+Jobs evicted from the in-memory history can still be looked up here.
+Once a stored job is older than PERSIST_JOB_MAX_AGE, or beyond the newest
+PERSIST_JOB_MAX_COUNT, it is moved with its events to a gzipped JSON
+lines file in JOB_ARCHIVE_DIR (one file per month), in the same format
+as export().
+"""
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+
+from src.adb.jobs import FINISHED_STATES, JOB_HISTORY_LIMIT, JOB_LOG_LINES, JOB_STEPS_KEPT, Job, job_manager
+from src.adb.tracker import device_registry
+from src.models.device import Device, DeviceAlias
+from src.models.job import JobEvent, JobRecord
+from src.models.setting import Setting
+from src.models.user import db
+
+PERSIST_FLUSH_INTERVAL = float(os.environ.get('PERSIST_FLUSH_INTERVAL', '1'))
+PERSIST_BATCH_MAX = int(os.environ.get('PERSIST_BATCH_MAX', '500'))  # buffered job events that trigger an early flush
+PERSIST_RELOAD_INTERVAL = 10  # seconds between checks for aliases written by other processes
+PERSIST_JOB_MAX_AGE = float(os.environ.get('PERSIST_JOB_MAX_AGE', str(30 * 86400)))  # seconds before a job is archived
+PERSIST_JOB_MAX_COUNT = int(os.environ.get('PERSIST_JOB_MAX_COUNT', '10000'))  # jobs kept in the database
+PERSIST_PRUNE_INTERVAL = 3600  # seconds between archive runs
+PERSIST_EXPORT_BATCH = 200  # jobs read per query when exporting or archiving
+JOB_ARCHIVE_DIR = os.environ.get('JOB_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'archive'))
+
+
+class Store:
+    """In-memory aliases and settings, with a write-behind buffer to the database"""
+
+    def __init__(self):
+        self.app = None
+        self.aliases = {}  # serial -> name
+        self.settings = {}  # key -> value
+        self.stats = {'flushes': 0, 'rows': 0, 'errors': 0, 'last_flush_ms': None, 'max_flush_ms': 0, 'archived': 0}
+        self._jobs = {}  # job id -> Job changed since the last flush
+        self._events = []  # (job id, version, time, delta)
+        self._devices = {}  # serial -> (status, seen at)
+        self._pending_aliases = {}  # serial -> (name, updated at)
+        self._pending_settings = {}  # key -> (value, updated at)
+        self._aliases_seen_until = 0  # newest alias update read from the database
+        self._aliases_checked_at = 0
+        self._pruned_at = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """Create the tables, load what earlier runs stored and start the flusher"""
+        self.app = app
+        with app.app_context():
+            db.create_all()
+            aliases = DeviceAlias.query.all()
+            self.aliases = {alias.serial: alias.name for alias in aliases}
+            self._aliases_seen_until = max((alias.updated_at for alias in aliases), default=0)
+            self.settings = {setting.key: setting.value for setting in Setting.query.all()}
+            records = JobRecord.query.order_by(JobRecord.created_at.desc()).limit(JOB_HISTORY_LIMIT).all()
+        job_manager.add_listener(self._job_changed)
+        device_registry.add_listener(self._device_changed)
+        self._restore_jobs(reversed(records))
+        self._thread = threading.Thread(target=self._run, name='store-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    # Aliases and settings
+
+    def alias(self, serial):
+        return self.aliases.get(serial)
+
+    def set_alias(self, serial, name):
+        with self._lock:
+            self.aliases[serial] = name
+            self._pending_aliases[serial] = (name, time.time())
+        self._wake.set()
+
+    def setting(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def set_setting(self, key, value):
+        with self._lock:
+            self.settings[key] = value
+            self._pending_settings[key] = (value, time.time())
+        self._wake.set()
+
+    # Buffering
+
+    def _job_changed(self, job, version, delta):
+        # Called with the job's lock held: only note the change
+        with self._lock:
+            self._jobs[job.id] = job
+            self._events.append((job.id, version, delta['time'], delta))
+            if len(self._events) >= PERSIST_BATCH_MAX:
+                self._wake.set()
+
+    def _device_changed(self, event, serial, status):
+        with self._lock:
+            self._devices[serial] = ('removed' if event == 'removed' else status, time.time())
+
+    def _restore_jobs(self, records):
+        jobs = []
+        for record in records:
+            job = Job(record.name, None, devices=record.devices, priority=record.priority)
+            job.id = record.id
+            job.fields = dict(record.fields)
+            job.device_timing = dict(record.device_timing)
+            job.created_at = record.created_at
+            job.started_at = record.started_at
+            job.finished_at = record.finished_at
+            job.version = record.version
+            jobs.append(job)
+        job_manager.restore(jobs)
+        for job in jobs:
+            if job.status not in FINISHED_STATES:
+                job.finished_at = job.finished_at or time.time()
+                job.update(status='error', message='Interrupted by a server restart')
+        print(f"[DEBUG] Restored {len(jobs)} jobs from the database")
+
+    # Flushing
+
+    def _run(self):
+        while True:
+            self._wake.wait(PERSIST_FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+            if time.time() - self._aliases_checked_at >= PERSIST_RELOAD_INTERVAL:
+                self._reload_aliases()
+            if time.time() - self._pruned_at >= PERSIST_PRUNE_INTERVAL:
+                self.prune()
+
+    def flush(self):
+        """Write everything buffered in one transaction"""
+        if self.app is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                jobs, self._jobs = list(self._jobs.values()), {}
+                events, self._events = self._events, []
+                devices, self._devices = self._devices, {}
+                aliases, self._pending_aliases = self._pending_aliases, {}
+                settings, self._pending_settings = self._pending_settings, {}
+            if not (jobs or events or devices or aliases or settings):
+                return
+            started = time.time()
+            with self.app.app_context():
+                try:
+                    self._write_devices(devices)
+                    self._write(DeviceAlias, {serial: {'name': name, 'updated_at': updated_at}
+                                              for serial, (name, updated_at) in aliases.items()})
+                    self._write(Setting, {key: {'value': value, 'updated_at': updated_at}
+                                          for key, (value, updated_at) in settings.items()})
+                    self._write(JobRecord, {job.id: self._job_row(job) for job in jobs})
+                    db.session.flush()
+                    self._write_events(events)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"[DEBUG] Store flush failed, {len(events)} job events lost: {e}")
+                    self.stats['errors'] += 1
+                    return
+            elapsed_ms = round((time.time() - started) * 1000, 1)
+            self.stats['flushes'] += 1
+            self.stats['rows'] += len(jobs) + len(events) + len(devices) + len(aliases) + len(settings)
+            self.stats['last_flush_ms'] = elapsed_ms
+            self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed_ms)
+
+    @staticmethod
+    def _write(model, rows):
+        """Insert or update rows keyed by primary key; needs an app context"""
+        if not rows:
+            return
+        key = model.__table__.primary_key.columns.values()[0]
+        existing = {getattr(row, key.name): row for row in model.query.filter(key.in_(list(rows)))}
+        for primary_key, values in rows.items():
+            row = existing.get(primary_key)
+            if row is None:
+                db.session.add(model(**{key.name: primary_key}, **values))
+            else:
+                for column, value in values.items():
+                    setattr(row, column, value)
+
+    @staticmethod
+    def _write_events(events):
+        """Insert job events, skipping (job, version) pairs already stored; needs an app context"""
+        if not events:
+            return
+        rows = {}
+        for job_id, version, at, delta in events:
+            rows.setdefault((job_id, version), {'job_id': job_id, 'version': version, 'time': at, 'delta': delta})
+        stored = db.session.query(JobEvent.job_id, JobEvent.version).filter(
+            JobEvent.job_id.in_({job_id for job_id, _ in rows}),
+            JobEvent.version >= min(version for _, version in rows))
+        for job_id, version in stored:
+            rows.pop((job_id, version), None)
+        if rows:
+            db.session.execute(JobEvent.__table__.insert(), list(rows.values()))
+
+    def _write_devices(self, devices):
+        if not devices:
+            return
+        existing = {device.serial: device for device in Device.query.filter(Device.serial.in_(list(devices)))}
+        for serial, (status, seen_at) in devices.items():
+            device = existing.get(serial)
+            if device is None:
+                db.session.add(Device(serial=serial, status=status, first_seen=seen_at, last_seen=seen_at))
+            else:
+                device.status = status
+                device.last_seen = seen_at
+
+    @staticmethod
+    def _job_row(job):
+        snapshot = job.snapshot()
+        fields = {key: value for key, value in snapshot.items() if key not in (
+            'job_id', 'name', 'priority', 'devices', 'created_at', 'started_at', 'finished_at',
+            'duration_ms', 'device_timing', 'version')}
+        return {
+            'name': job.name,
+            'priority': job.priority,
+            'status': snapshot['status'],
+            'devices': snapshot['devices'],
+            'fields': fields,
+            'device_timing': snapshot['device_timing'],
+            'created_at': snapshot['created_at'],
+            'started_at': snapshot['started_at'],
+            'finished_at': snapshot['finished_at'],
+            'version': snapshot['version']
+        }
+
+    def _reload_aliases(self):
+        """Pick up aliases other processes wrote since the last check"""
+        self._aliases_checked_at = time.time()
+        try:
+            with self.app.app_context():
+                # Overlap the previous check: another process may commit an update stamped before it
+                changed = DeviceAlias.query.filter(
+                    DeviceAlias.updated_at > self._aliases_seen_until - PERSIST_RELOAD_INTERVAL).all()
+        except Exception as e:
+            print(f"[DEBUG] Reloading device aliases failed: {e}")
+            return
+        self._aliases_seen_until = max([self._aliases_seen_until] + [alias.updated_at for alias in changed])
+        for alias in changed:
+            with self._lock:
+                if alias.serial in self._pending_aliases or self.aliases.get(alias.serial) == alias.name:
+                    continue
+                self.aliases[alias.serial] = alias.name
+            device_registry.touch(alias.serial)
+
+    # Stored job history
+
+    def job(self, job_id, steps=False, log=False):
+        """A stored job's status as Job.snapshot() gives it, or None"""
+        if self.app is None:
+            return None
+        with self.app.app_context():
+            record = db.session.get(JobRecord, job_id)
+            if record is None:
+                return None
+            snapshot = record.to_dict()
+            snapshot['duration_ms'] = (int((record.finished_at - record.started_at) * 1000)
+                                       if record.started_at and record.finished_at else None)
+            snapshot['evicted'] = True
+            if steps or log:
+                events = [event.to_dict() for event in JobEvent.query.filter_by(job_id=job_id).order_by(JobEvent.version)]
+                if steps:
+                    snapshot['steps'] = [event['step'] for event in events if 'step' in event][-JOB_STEPS_KEPT:]
+                if log:
+                    snapshot['log'] = [{'time': event['time'], 'line': event.get('log', event.get('message'))}
+                                       for event in events if 'log' in event or 'message' in event][-JOB_LOG_LINES:]
+            return snapshot
+
+    def export(self, status=None, since=None, until=None, events=False):
+        """Stored jobs, oldest first, as {'job': ..., 'events': [...]} dicts; a generator"""
+        if self.app is None:
+            return
+        self.flush()
+        offset = 0
+        while True:
+            with self.app.app_context():
+                query = JobRecord.query
+                if status:
+                    query = query.filter(JobRecord.status == status)
+                if since is not None:
+                    query = query.filter(JobRecord.created_at >= since)
+                if until is not None:
+                    query = query.filter(JobRecord.created_at < until)
+                records = query.order_by(JobRecord.created_at, JobRecord.id).offset(offset).limit(PERSIST_EXPORT_BATCH).all()
+                batch = self._export_rows(records, events)
+            if not batch:
+                return
+            yield from batch
+            offset += len(batch)
+
+    @staticmethod
+    def _export_rows(records, events):
+        """Records as export dicts, with their events if asked for; needs an app context"""
+        by_job = {}
+        if events and records:
+            for event in JobEvent.query.filter(JobEvent.job_id.in_([record.id for record in records])).order_by(JobEvent.version):
+                by_job.setdefault(event.job_id, []).append(event.to_dict())
+        return [dict({'job': record.to_dict()}, **({'events': by_job.get(record.id, [])} if events else {}))
+                for record in records]
+
+    def prune(self):
+        """Archive and delete stored jobs beyond the age and count limits; returns how many"""
+        if self.app is None:
+            return 0
+        self._pruned_at = time.time()
+        in_memory = {job.id for job in job_manager.list()}
+        archived = 0
+        with self.app.app_context():
+            try:
+                finished = JobRecord.status.in_(FINISHED_STATES)
+                old = JobRecord.created_at < time.time() - PERSIST_JOB_MAX_AGE
+                ids = [row.id for row in db.session.query(JobRecord.id).filter(finished, old)]
+                excess = JobRecord.query.count() - len(ids) - PERSIST_JOB_MAX_COUNT
+                if excess > 0:
+                    ids += [row.id for row in db.session.query(JobRecord.id).filter(finished, ~old)
+                            .order_by(JobRecord.created_at).limit(excess)]
+                ids = [job_id for job_id in ids if job_id not in in_memory]
+                for start in range(0, len(ids), PERSIST_EXPORT_BATCH):
+                    chunk = ids[start:start + PERSIST_EXPORT_BATCH]
+                    records = JobRecord.query.filter(JobRecord.id.in_(chunk)).order_by(JobRecord.created_at).all()
+                    self._archive(self._export_rows(records, True))
+                    JobEvent.query.filter(JobEvent.job_id.in_(chunk)).delete(synchronize_session=False)
+                    JobRecord.query.filter(JobRecord.id.in_(chunk)).delete(synchronize_session=False)
+                    db.session.commit()
+                    archived += len(chunk)
+            except Exception as e:
+                db.session.rollback()
+                print(f"[DEBUG] Archiving jobs failed: {e}")
+                self.stats['errors'] += 1
+        if archived:
+            print(f"[DEBUG] Archived {archived} jobs to {JOB_ARCHIVE_DIR}")
+            self.stats['archived'] += archived
+        return archived
+
+    @staticmethod
+    def _archive(rows):
+        os.makedirs(JOB_ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(JOB_ARCHIVE_DIR, time.strftime('jobs-%Y-%m.jsonl.gz'))
+        # Appending adds a gzip member; readers see one continuous file
+        with gzip.open(path, 'at', encoding='utf-8') as archive:
+            for row in rows:
+                archive.write(json.dumps(row) + '\n')
+
+    def status(self):
+        with self._lock:
+            pending = {'jobs': len(self._jobs), 'events': len(self._events), 'devices': len(self._devices),
+                       'aliases': len(self._pending_aliases), 'settings': len(self._pending_settings)}
+        return dict(self.stats, pending=pending, flush_interval=PERSIST_FLUSH_INTERVAL,
+                    job_max_age=PERSIST_JOB_MAX_AGE, job_max_count=PERSIST_JOB_MAX_COUNT, archive_dir=JOB_ARCHIVE_DIR)
+
+
+store = Store()
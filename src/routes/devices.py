@@ -1,6 +1,7 @@
 import os
 import subprocess
 import json
+import re
 import time
 import random
 import threading
@@ -9,95 +10,87 @@ import requests
 from flask import Blueprint, request, jsonify, current_app, Response
 from werkzeug.utils import secure_filename
 import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.adb.client import ADB_COMMAND_TIMEOUT, run_adb_command
+from src.adb.cache import device_info_cache
+from src.adb.gesture import gesture_script, parse_gesture
+from src.adb.imaging import parse_image_options
+from src.adb.input import input_manager
+from src.adb.locks import LOCK_MODES, LOCK_RESOURCES, LockTimeout, lock_manager
+from src.adb.mirror import mirror_manager, scale_point, screen_size
+from src.adb.mosaic import MosaicViewer, fleet_mosaic
+from src.adb.screen import ScreenCaptureError, capture_image
+from src.adb.stream import BINARY_KEEPALIVE, Frame, TileFrame, binary_message, stream_manager
+from src.adb.tracker import device_registry, get_live_registry
+from src.adb.video import ACCESS_UNIT_DELIMITER, LIVE_VIDEO_BIT_RATE, video_manager
+from src.models.store import store
 
 devices_bp = Blueprint('devices', __name__)
 
-# Global variables for script execution
-script_threads = {}
-script_status = {}
-device_names = {}  # Store custom device names
+# Device names are kept by the store (src/models/store.py) and survive restarts
 
-def run_adb_command(command, device_id=None):
-    """Execute ADB command and return result with enhanced error handling"""
-    try:
-        if device_id:
-            cmd = f"adb -s {device_id} {command}"
-        else:
-            cmd = f"adb {command}"
-        
-        print(f"[DEBUG] Executing ADB command: {cmd}")
-        
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=30)
-        
-        success = result.returncode == 0
-        output = result.stdout.strip() if result.stdout else ''
-        error = result.stderr.strip() if result.stderr else ''
-        
-        if not success:
-            print(f"[DEBUG] ADB command failed: {cmd}")
-            print(f"[DEBUG] Error output: {error}")
-        
-        return {
-            'success': success,
-            'output': output,
-            'error': error,
-            'returncode': result.returncode
-        }
-    except subprocess.TimeoutExpired:
-        print(f"[DEBUG] ADB command timed out: {cmd}")
-        return {
-            'success': False,
-            'output': '',
-            'error': 'Command timed out after 30 seconds',
-            'returncode': -1
-        }
-    except FileNotFoundError:
-        print(f"[DEBUG] ADB not found in PATH")
-        return {
-            'success': False,
-            'output': '',
-            'error': 'ADB not found. Please ensure Android SDK is installed and ADB is in PATH.',
-            'returncode': -1
-        }
-    except Exception as e:
-        print(f"[DEBUG] Unexpected error running ADB command: {e}")
-        return {
-            'success': False,
-            'output': '',
-            'error': f'Unexpected error: {str(e)}',
-            'returncode': -1
-        }
+# Worker pool shared by the fleet-wide device info endpoint
+DEVICE_PROBE_WORKERS = int(os.environ.get('DEVICE_PROBE_WORKERS', '8'))
+probe_executor = ThreadPoolExecutor(max_workers=DEVICE_PROBE_WORKERS, thread_name_prefix='device-probe')
 
+def get_connected_devices():
+    """Return [(device_id, status)] from the device tracker, or from `adb devices` if it is down
+    
+    Raises RuntimeError with adb's error message if the device list is unavailable.
+    """
+    registry = get_live_registry()
+    if registry is not None:
+        return [(device['id'], device['status']) for device in registry.snapshot()]
+    
+    result = run_adb_command("devices")
+    if not result['success']:
+        raise RuntimeError(result['error'])
+    devices = []
+    for line in result['output'].split('\n')[1:]:  # Skip header
+        if line.strip() and '\t' in line:
+            device_id, status = line.split('\t', 1)
+            devices.append((device_id, status.strip()))
+    return devices
 
+def get_default_device_name(device_id, connected=None):
+    """Custom name for a device, or "Device <n>" from its position in the device list"""
+    name = store.alias(device_id)
+    if not name:
+        if connected is None:
+            try:
+                connected = get_connected_devices()
+            except RuntimeError:
+                connected = []
+        device_ids = [connected_id for connected_id, _ in connected]
+        
+        if device_id in device_ids:
+            index = device_ids.index(device_id) + 1
+            name = f"Device {index}"
+            store.set_alias(device_id, name)
+        else:
+            name = "Unknown Device"
+    return name
 
-def get_device_info_fast(device_id):
+def get_device_info_fast(device_id, status=None, connected=None):
     """Get basic device information quickly"""
     info = {'id': device_id}
     
     # Get device name
-    name = device_names.get(device_id)
-    if not name:
-        # Generate default name based on device index
-        result = run_adb_command("devices")
-        if result['success']:
-            lines = result['output'].split('\n')[1:]  # Skip header
-            device_ids = []
-            for line in lines:
-                if line.strip() and '\t' in line:
-                    device_ids.append(line.split('\t')[0])
-            
-            if device_id in device_ids:
-                index = device_ids.index(device_id) + 1
-                name = f"Device {index}"
-                device_names[device_id] = name
-            else:
-                name = "Unknown Device"
+    name = get_default_device_name(device_id, connected)
     
     info['name'] = name
     
     # Get device status (this is fast)
-    status_result = run_adb_command("get-state", device_id)
-    info['status'] = status_result['output'] if status_result['success'] else 'Unknown'
+    if status is None:
+        registry = get_live_registry()
+        device = registry.get(device_id) if registry is not None else None
+        if device is not None:
+            status = device['status']
+        else:
+            status_result = run_adb_command("get-state", device_id)
+            status = status_result['output'] if status_result['success'] else 'Unknown'
+    info['status'] = status
     
     # Set default values for detailed info (will be loaded on demand)
     info['brand'] = 'Loading...'
@@ -106,8 +99,12 @@ def get_device_info_fast(device_id):
     
     return info
 
-def get_device_info(device_id):
-    """Get detailed device information with enhanced error handling"""
+def get_device_info(device_id, timeout=ADB_COMMAND_TIMEOUT, refresh=False):
+    """Get detailed device information with enhanced error handling
+    
+    Values come from the device info cache; field_age reports how many
+    seconds ago each one was read from the device.
+    """
     info = {
         'id': device_id,
         'brand': 'Unknown',
@@ -128,122 +125,37 @@ def get_device_info(device_id):
         print(f"[DEBUG] Getting detailed info for device {device_id}")
         
         # Check if device is connected first
-        status_result = run_adb_command('get-state', device_id)
-        if not status_result['success']:
-            info['status'] = 'disconnected'
-            info['error'] = status_result['error']
-            return info
-        
-        info['status'] = status_result['output']
+        registry = get_live_registry()
+        device = registry.get(device_id) if registry is not None else None
+        if device is not None:
+            info['status'] = device['status']
+        else:
+            status_result = run_adb_command('get-state', device_id)
+            if not status_result['success']:
+                info['status'] = 'disconnected'
+                info['error'] = status_result['error']
+                return info
+            info['status'] = status_result['output']
         
         # Only proceed if device is in 'device' state
         if info['status'] != 'device':
             print(f"[DEBUG] Device {device_id} is not ready (status: {info['status']})")
             return info
         
-        # Get basic device properties
-        properties = {
-            'brand': 'ro.product.brand',
-            'model': 'ro.product.model',
-            'android_version': 'ro.build.version.release',
-            'api_level': 'ro.build.version.sdk',
-            'density': 'ro.sf.lcd_density'
-        }
-        
-        for key, prop in properties.items():
-            try:
-                result = run_adb_command(f'shell getprop {prop}', device_id)
-                if result['success'] and result['output']:
-                    info[key] = result['output']
-                else:
-                    print(f"[DEBUG] Failed to get {prop} for device {device_id}")
-            except Exception as e:
-                print(f"[DEBUG] Error getting {prop}: {e}")
-        
-        # Get screen resolution
-        try:
-            resolution_result = run_adb_command('shell wm size', device_id)
-            if resolution_result['success'] and 'Physical size:' in resolution_result['output']:
-                info['resolution'] = resolution_result['output'].split('Physical size: ')[1].strip()
-        except Exception as e:
-            print(f"[DEBUG] Error getting screen resolution: {e}")
-        
-        # Get battery information
-        try:
-            battery_result = run_adb_command('shell dumpsys battery', device_id)
-            if battery_result['success']:
-                battery_output = battery_result['output']
-                
-                # Extract battery level
-                for line in battery_output.split('\n'):
-                    if 'level:' in line:
-                        info['battery_level'] = line.split(':')[1].strip() + '%'
-                    elif 'status:' in line:
-                        status_code = line.split(':')[1].strip()
-                        status_map = {
-                            '1': 'Unknown',
-                            '2': 'Charging',
-                            '3': 'Discharging',
-                            '4': 'Not charging',
-                            '5': 'Full'
-                        }
-                        info['battery_status'] = status_map.get(status_code, f'Code {status_code}')
-        except Exception as e:
-            print(f"[DEBUG] Error getting battery info: {e}")
-        
-        # Get WiFi status
-        try:
-            wifi_result = run_adb_command('shell dumpsys wifi', device_id)
-            if wifi_result['success'] and 'Wi-Fi is' in wifi_result['output']:
-                if 'enabled' in wifi_result['output'].lower():
-                    info['wifi_status'] = 'enabled'
-                elif 'disabled' in wifi_result['output'].lower():
-                    info['wifi_status'] = 'disabled'
-                else:
-                    info['wifi_status'] = 'unknown'
-            else:
-                # Alternative method
-                wifi_alt = run_adb_command('shell settings get global wifi_on', device_id)
-                if wifi_alt['success']:
-                    info['wifi_status'] = 'enabled' if wifi_alt['output'] == '1' else 'disabled'
-        except Exception as e:
-            print(f"[DEBUG] Error getting WiFi status: {e}")
-        
-        # Get screen status
-        try:
-            screen_result = run_adb_command('shell dumpsys power', device_id)
-            if screen_result['success'] and 'Display Power' in screen_result['output']:
-                info['screen_status'] = 'on' if 'ON' in screen_result['output'] else 'off'
-            else:
-                # Alternative method
-                screen_alt = run_adb_command('shell dumpsys display', device_id)
-                if screen_alt['success'] and 'mScreenState' in screen_alt['output']:
-                    info['screen_status'] = 'on' if 'ON' in screen_alt['output'] else 'off'
-        except Exception as e:
-            print(f"[DEBUG] Error getting screen status: {e}")
+        # Properties, resolution, battery, WiFi and screen state; stale ones in one adb shell
+        probed, field_age, error = device_info_cache.get(device_id, refresh, timeout)
+        if error:
+            print(f"[DEBUG] Failed to probe device {device_id}: {error}")
+            info['error'] = error
+        info.update(probed)
+        info['field_age'] = field_age
     
     except Exception as e:
         print(f"[DEBUG] Error getting device info for {device_id}: {e}")
         info['error'] = str(e)
     
     # Get device name
-    name = device_names.get(device_id)
-    if not name:
-        # Generate default name based on device index
-        result = run_adb_command("devices")
-        if result['success']:
-            lines = result['output'].split('\n')[1:]  # Skip header
-            device_ids = []
-            for line in lines:
-                if line.strip() and '\t' in line:
-                    device_ids.append(line.split('\t')[0])
-            
-            if device_id in device_ids:
-                index = device_ids.index(device_id) + 1
-                name = f"Device {index}"
-                device_names[device_id] = name
-            else:
-                name = "Unknown Device"
+    name = get_default_device_name(device_id)
     
     info['name'] = name
     
@@ -251,22 +163,49 @@ def get_device_info(device_id):
 
 @devices_bp.route('/devices', methods=['GET'])
 def list_devices():
-    """List all connected devices with basic info for fast loading"""
+    """List all connected devices with basic info for fast loading
+    
+    While the device tracker is live the list is tagged with the registry
+    version: If-None-Match with the current ETag gets 304 Not Modified, and
+    ?since=<version> returns only the devices added, changed or removed
+    since then (or the full list if that version is unknown).
+    """
     try:
-        result = run_adb_command("devices")
-        if not result['success']:
-            return jsonify({'error': result['error']}), 500
-        
-        devices = []
-        lines = result['output'].split('\n')[1:]  # Skip header
-        
-        for line in lines:
-            if line.strip() and '\t' in line:
-                device_id = line.split('\t')[0]
-                device_info = get_device_info_fast(device_id)
-                devices.append(device_info)
-        
-        return jsonify({'devices': devices})
+        registry = get_live_registry()
+        if registry is None:
+            connected = get_connected_devices()
+            return jsonify({'devices': [get_device_info_fast(device_id, status, connected) for device_id, status in connected]})
+        
+        version, snapshot = registry.versioned_snapshot()
+        etag = f'devices-{version}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        connected = [(device['id'], device['status']) for device in snapshot]
+        changes = None
+        if request.args.get('since'):
+            try:
+                changes = registry.changes(int(request.args['since']))
+            except ValueError:
+                return jsonify({'error': 'since must be a version number'}), 400
+        if changes is not None:
+            version, changed, removed = changes
+            body = {
+                'version': version,
+                'since': int(request.args['since']),
+                'changed': [get_device_info_fast(device['id'], device['status'], connected) for device in changed],
+                'removed': removed
+            }
+        else:
+            body = {
+                'version': version,
+                'devices': [get_device_info_fast(device_id, status, connected) for device_id, status in connected]
+            }
+        response = jsonify(body)
+        response.set_etag(f'devices-{version}')
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -414,47 +353,135 @@ def get_proxy_location():
 
 @devices_bp.route('/devices/<device_id>/info', methods=['GET'])
 def get_device_detailed_info(device_id):
-    """Get detailed information for a specific device"""
+    """Get detailed information for a specific device (?refresh=1 bypasses the cache)"""
     try:
-        device_info = get_device_info(device_id)
+        refresh = request.args.get('refresh') in ('1', 'true')
+        device_info = get_device_info(device_id, refresh=refresh)
         return jsonify(device_info)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@devices_bp.route('/devices/info', methods=['GET'])
+def get_devices_detailed_info():
+    """Stream detailed information for many devices as each probe completes
+    
+    Query parameters: ids (comma separated, default all connected devices),
+    format (ndjson or sse), timeout (seconds per device) and refresh=1 to
+    bypass the device info cache.
+    """
+    try:
+        device_ids = [d.strip() for d in request.args.get('ids', '').split(',') if d.strip()]
+        if not device_ids:
+            device_ids = [device_id for device_id, _ in get_connected_devices()]
+        
+        stream_format = request.args.get('format', 'ndjson')
+        if stream_format not in ('ndjson', 'sse'):
+            return jsonify({'error': 'Invalid format. Use ndjson or sse'}), 400
+        
+        timeout = request.args.get('timeout', ADB_COMMAND_TIMEOUT, type=float)
+        if timeout <= 0:
+            return jsonify({'error': 'timeout must be positive'}), 400
+        refresh = request.args.get('refresh') in ('1', 'true')
+        
+        def timed_device_info(device_id):
+            start = time.time()
+            info = get_device_info(device_id, timeout, refresh)
+            return info, int((time.time() - start) * 1000)
+        
+        def encode(record):
+            if stream_format == 'sse':
+                return f"data: {json.dumps(record)}\n\n"
+            return json.dumps(record) + '\n'
+        
+        def generate():
+            started = time.time()
+            futures = {probe_executor.submit(timed_device_info, device_id): device_id for device_id in device_ids}
+            failed = 0
+            try:
+                for future in as_completed(futures):
+                    device_id = futures[future]
+                    try:
+                        info, duration_ms = future.result()
+                    except Exception as e:
+                        info, duration_ms = {'id': device_id, 'error': str(e)}, None
+                    if 'error' in info or info.get('status') != 'device':
+                        failed += 1
+                    yield encode({
+                        'type': 'device',
+                        'device_id': device_id,
+                        'info': info,
+                        'duration_ms': duration_ms
+                    })
+                
+                yield encode({
+                    'type': 'summary',
+                    'total': len(device_ids),
+                    'succeeded': len(device_ids) - failed,
+                    'failed': failed,
+                    'workers': DEVICE_PROBE_WORKERS,
+                    'duration_ms': int((time.time() - started) * 1000)
+                })
+            finally:
+                # Client went away: don't probe devices nobody is waiting for
+                for future in futures:
+                    future.cancel()
+        
+        mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+        response = Response(generate(), mimetype=mimetype)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @devices_bp.route('/devices/<device_id>/screenshot', methods=['GET'])
 def take_screenshot(device_id):
-    """Take screenshot of device"""
+    """Take screenshot of device as a base64 data URL (kept for compatibility)
+    
+    Accepts preset (thumbnail, preview, full), max_width, format and quality.
+    """
     try:
-        # Take screenshot
-        screenshot_result = run_adb_command("shell screencap -p /sdcard/screenshot.png", device_id)
-        if not screenshot_result['success']:
-            return jsonify({'error': 'Failed to take screenshot'}), 500
-        
-        # Pull screenshot
-        pull_result = run_adb_command(f"pull /sdcard/screenshot.png /tmp/screenshot_{device_id}.png", device_id)
-        if not pull_result['success']:
-            return jsonify({'error': 'Failed to pull screenshot'}), 500
-        
-        # Read and encode screenshot
-        screenshot_path = f"/tmp/screenshot_{device_id}.png"
-        if os.path.exists(screenshot_path):
-            with open(screenshot_path, 'rb') as f:
-                screenshot_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            # Clean up
-            os.remove(screenshot_path)
-            run_adb_command("shell rm /sdcard/screenshot.png", device_id)
-            
-            return jsonify({'screenshot': f"data:image/png;base64,{screenshot_data}"})
-        else:
-            return jsonify({'error': 'Screenshot file not found'}), 500
-            
+        options = parse_image_options(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        image = capture_image(device_id, options)
+        return jsonify({
+            'screenshot': image.data_url(),
+            'format': image.format,
+            'width': image.width,
+            'height': image.height,
+            'encode_ms': image.encode_ms
+        })
+    except ScreenCaptureError as e:
+        return jsonify({'error': f'Failed to take screenshot: {e}'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-
-
-
+@devices_bp.route('/devices/<device_id>/screenshot.png', methods=['GET'])
+def get_screenshot_image(device_id):
+    """Take screenshot of device and return the image itself
+    
+    Full-size PNG by default; preset, max_width, format and quality work as
+    for /screenshot, and the Content-Type follows the format used.
+    """
+    try:
+        options = parse_image_options(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        image = capture_image(device_id, options)
+        response = Response(image.data, mimetype=image.content_type)
+        # Always revalidate; an unchanged screen answers 304 without the body
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['Server-Timing'] = f'encode;dur={image.encode_ms}'
+        response.set_etag(hashlib.md5(image.data).hexdigest())
+        response.last_modified = time.time()
+        return response.make_conditional(request)
+    except ScreenCaptureError as e:
+        return jsonify({'error': f'Failed to take screenshot: {e}'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @devices_bp.route('/devices/<device_id>/wifi', methods=['POST'])
 def manage_wifi(device_id):
@@ -488,8 +515,12 @@ def launch_app(device_id):
         if not package_name:
             return jsonify({'error': 'Package name is required'}), 400
         
-        # Launch app
-        launch_result = run_adb_command(f"shell monkey -p {package_name} -c android.intent.category.LAUNCHER 1", device_id)
+        # Launch app, unless it is being installed right now
+        try:
+            with lock_manager.lease(device_id, 'package', 'shared', owner='launch-app'):
+                launch_result = run_adb_command(f"shell monkey -p {package_name} -c android.intent.category.LAUNCHER 1", device_id)
+        except LockTimeout as e:
+            return jsonify({'error': str(e), 'holders': e.holders}), 409
         
         if launch_result['success']:
             return jsonify({'message': f'App {package_name} launched successfully'})
@@ -510,7 +541,11 @@ def open_url(device_id):
             return jsonify({'error': 'URL is required'}), 400
         
         # Open URL
-        url_result = run_adb_command(f"shell am start -a android.intent.action.VIEW -d '{url}'", device_id)
+        try:
+            with lock_manager.lease(device_id, 'package', 'shared', owner='open-url'):
+                url_result = run_adb_command(f"shell am start -a android.intent.action.VIEW -d '{url}'", device_id)
+        except LockTimeout as e:
+            return jsonify({'error': str(e), 'holders': e.holders}), 409
         
         if url_result['success']:
             return jsonify({'message': f'URL opened successfully'})
@@ -522,7 +557,12 @@ def open_url(device_id):
 
 @devices_bp.route('/devices/<device_id>/command', methods=['POST'])
 def execute_command(device_id):
-    """Execute custom ADB command"""
+    """Execute custom ADB command
+    
+    Optional "lock": a device resource (screen, input, package, filesystem)
+    to hold while the command runs, with "lock_mode" shared or exclusive
+    (default exclusive).
+    """
     try:
         data = request.get_json()
         command = data.get('command')
@@ -530,8 +570,20 @@ def execute_command(device_id):
         if not command:
             return jsonify({'error': 'Command is required'}), 400
         
+        resource = data.get('lock')
+        mode = data.get('lock_mode', 'exclusive')
+        if resource is not None and (resource not in LOCK_RESOURCES or mode not in LOCK_MODES):
+            return jsonify({'error': f"lock must be one of {', '.join(LOCK_RESOURCES)} and lock_mode one of {', '.join(LOCK_MODES)}"}), 400
+        
         # Execute command
-        result = run_adb_command(command, device_id)
+        try:
+            if resource is not None:
+                with lock_manager.lease(device_id, resource, mode, owner='command'):
+                    result = run_adb_command(command, device_id)
+            else:
+                result = run_adb_command(command, device_id)
+        except LockTimeout as e:
+            return jsonify({'error': str(e), 'holders': e.holders}), 409
         
         return jsonify({
             'success': result['success'],
@@ -543,30 +595,11 @@ def execute_command(device_id):
         return jsonify({'error': str(e)}), 500
 
 
-# Device naming storage (in production, this should be in a database)
-device_names = {}
-
 @devices_bp.route('/devices/<device_id>/name', methods=['GET'])
 def get_device_name(device_id):
     """Get custom name for device"""
     try:
-        name = device_names.get(device_id)
-        if not name:
-            # Generate default name based on device index
-            result = run_adb_command("devices")
-            if result['success']:
-                lines = result['output'].split('\n')[1:]  # Skip header
-                device_ids = []
-                for line in lines:
-                    if line.strip() and '\t' in line:
-                        device_ids.append(line.split('\t')[0])
-                
-                if device_id in device_ids:
-                    index = device_ids.index(device_id) + 1
-                    name = f"Device {index}"
-                    device_names[device_id] = name
-                else:
-                    name = "Unknown Device"
+        name = get_default_device_name(device_id)
         
         return jsonify({'name': name})
     except Exception as e:
@@ -585,7 +618,8 @@ def set_device_name(device_id):
         if len(name) > 50:
             return jsonify({'error': 'Name must be 50 characters or less'}), 400
         
-        device_names[device_id] = name
+        store.set_alias(device_id, name)
+        device_registry.touch(device_id)
         return jsonify({'message': 'Device name updated successfully', 'name': name})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -595,23 +629,17 @@ def get_all_device_names():
     """Get all device names"""
     try:
         # Get all connected devices and ensure they have names
-        result = run_adb_command("devices")
-        if not result['success']:
-            return jsonify({'error': result['error']}), 500
+        connected = get_connected_devices()
         
-        lines = result['output'].split('\n')[1:]  # Skip header
-        device_ids = []
-        for line in lines:
-            if line.strip() and '\t' in line:
-                device_ids.append(line.split('\t')[0])
+        device_ids = [device_id for device_id, _ in connected]
         
         # Ensure all devices have names
         for i, device_id in enumerate(device_ids):
-            if device_id not in device_names:
-                device_names[device_id] = f"Device {i + 1}"
+            if store.alias(device_id) is None:
+                store.set_alias(device_id, f"Device {i + 1}")
         
         # Return only names for connected devices
-        connected_names = {device_id: device_names[device_id] for device_id in device_ids if device_id in device_names}
+        connected_names = {device_id: store.alias(device_id) for device_id in device_ids}
         
         return jsonify({'names': connected_names})
     except Exception as e:
@@ -628,8 +656,9 @@ def update_multiple_device_names():
         for device_id, name in names.items():
             name = name.strip()
             if name and len(name) <= 50:
-                device_names[device_id] = name
+                store.set_alias(device_id, name)
                 updated_names[device_id] = name
+                device_registry.touch(device_id)
         
         return jsonify({'message': 'Device names updated successfully', 'names': updated_names})
     except Exception as e:
@@ -639,128 +668,107 @@ def update_multiple_device_names():
 import threading
 import time
 import base64
-# Live view streaming
-live_streams = {}
-stream_threads = {}
+# Live view streaming: one capture worker per device, shared by all viewers
+LIVE_STREAM_KEEPALIVE = 15  # seconds between SSE comments when no frame arrives
+LIVE_VIDEO_KEEPALIVE = 5  # seconds between keepalive NAL units on an idle video stream
 
-def generate_device_stream(device_id):
-    """Generate continuous screenshot stream for device"""
-    error_count = 0
-    max_errors = 5
+def generate_device_stream(device_id, subscriber, binary=False):
+    """Generate continuous screenshot stream for one subscriber of a device
+    
+    Yields SSE messages, or binary records (see src/adb/stream.py) when binary is set.
+    """
+    if binary:
+        message = lambda data: binary_message(device_id, data)
+        keepalive = BINARY_KEEPALIVE
+    else:
+        message = lambda data: f"data: {json.dumps(data)}\n\n"
+        keepalive = ": keepalive\n\n"
     
     # Send initial connection message
-    yield f"data: {json.dumps({'type': 'connected', 'device_id': device_id, 'message': 'Live stream connected'})}\n\n"
+    yield message({'type': 'connected', 'device_id': device_id, 'subscriber_id': subscriber.id, 'message': 'Live stream connected'})
     
-    while device_id in live_streams and live_streams[device_id]:
-        try:
-            # Check if ADB is available
-            adb_check = run_adb_command("version")
-            if not adb_check['success']:
-                yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': 'ADB not available. Please install ADB and ensure it is in your PATH.'})}\n\n"
-                break
-            
-            # Check if device is still connected
-            device_check = run_adb_command("get-state", device_id)
-            if not device_check['success'] or device_check['output'] != 'device':
-                yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': 'Device disconnected or not available'})}\n\n"
-                break
-            
-            # Take screenshot
-            screenshot_result = run_adb_command("shell screencap -p /sdcard/live_screenshot.png", device_id)
-            if screenshot_result['success']:
-                # Pull screenshot
-                pull_result = run_adb_command(f"pull /sdcard/live_screenshot.png /tmp/live_{device_id}.png", device_id)
-                if pull_result['success']:
-                    screenshot_path = f"/tmp/live_{device_id}.png"
-                    if os.path.exists(screenshot_path):
-                        try:
-                            with open(screenshot_path, 'rb') as f:
-                                screenshot_data = base64.b64encode(f.read()).decode('utf-8')
-                            
-                            # Clean up
-                            os.remove(screenshot_path)
-                            run_adb_command("shell rm /sdcard/live_screenshot.png", device_id)
-                            
-                            # Reset error count on success
-                            error_count = 0
-                            
-                            # Yield screenshot data as Server-Sent Event
-                            data = {
-                                'type': 'screenshot',
-                                'device_id': device_id,
-                                'data': f'data:image/png;base64,{screenshot_data}',
-                                'timestamp': int(time.time() * 1000)
-                            }
-                            yield f"data: {json.dumps(data)}\n\n"
-                        except Exception as file_error:
-                            error_count += 1
-                            yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': f'File processing error: {str(file_error)}'})}\n\n"
-                    else:
-                        error_count += 1
-                        yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': 'Screenshot file not found'})}\n\n"
-                else:
-                    error_count += 1
-                    error_msg = pull_result.get('error', 'Unknown error')
-                    yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': f'Failed to pull screenshot: {error_msg}'})}\n\n"
-            else:
-                error_count += 1
-                error_msg = screenshot_result.get('error', 'Unknown error')
-                yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': f'Failed to take screenshot: {error_msg}'})}\n\n"
-            
-            # Stop streaming if too many errors
-            if error_count >= max_errors:
-                yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': 'Too many errors, stopping stream'})}\n\n"
-                break
-            
-            # Wait 2 seconds between screenshots for better performance
-            time.sleep(2)
-            
-        except Exception as e:
-            error_count += 1
-            error_msg = str(e)
-            yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': f'Stream error: {error_msg}'})}\n\n"
-            if error_count >= max_errors:
-                break
-            time.sleep(1)  # Wait before retry
+    while True:
+        event = subscriber.next_event(timeout=LIVE_STREAM_KEEPALIVE)
+        if event is None:
+            # Keeps proxies from timing out and notices clients that went away
+            yield keepalive
+        elif isinstance(event, (Frame, TileFrame)):
+            options = subscriber.options
+            payload = event.binary_payload(options) if binary else event.sse_payload(options)
+            encode_ms = event.encoded(options).encode_ms if isinstance(event, Frame) else event.encode_ms
+            started = time.time()
+            yield payload
+            # Resumed once the frame was written out: that is the client's drain time
+            governor = subscriber.governor
+            governor.record_send(encode_ms, time.time() - started, subscriber.hub.governor.interval)
+            if governor.report_due(subscriber.hub.governor):
+                stats = governor.stats(subscriber.hub.governor)
+                yield message({'type': 'stream_stats', 'device_id': device_id, **stats})
+        elif event['type'] == 'stopped':
+            break
+        else:
+            yield message(event)
     
     # Send disconnection message
-    yield f"data: {json.dumps({'type': 'disconnected', 'device_id': device_id, 'message': 'Live stream disconnected'})}\n\n"
-    
-    # Cleanup when stream ends
-    if device_id in live_streams:
-        del live_streams[device_id]
-    if device_id in stream_threads:
-        del stream_threads[device_id]
+    yield message({'type': 'disconnected', 'device_id': device_id, 'message': 'Live stream disconnected'})
+
+def check_live_device(device_id):
+    """Return an error response if the device cannot be streamed, else None"""
+    registry = get_live_registry()
+    device = registry.get(device_id) if registry is not None else None
+    if device is None:
+        device_check = run_adb_command("get-state", device_id)
+        if 'ADB not found' in device_check['error']:
+            return jsonify({'error': 'ADB is not available. Please install ADB and ensure it is in your PATH.'}), 500
+        status = device_check['output'] if device_check['success'] else None
+    else:
+        status = device['status']
+    if status != 'device':
+        return jsonify({'error': f'Device {device_id} is not connected or available'}), 404
+    return None
 
 @devices_bp.route('/devices/<device_id>/live-stream', methods=['GET'])
 def start_live_stream(device_id):
-    """Start live screenshot stream for device"""
+    """Start live screenshot stream for device
+    
+    Unchanged screens are not sent. With ?tiles=1, frames after the first
+    are sent as 'tiles' messages holding only the regions that changed.
+    preset, max_width, format and quality resize and re-encode the frames
+    (tiles are only sent for full-size PNG). ?transport=binary sends
+    length-prefixed binary records with the raw image bytes instead of
+    SSE; SSE stays the default.
+    """
     try:
-        # Check if device exists and is connected
-        device_check = run_adb_command("get-state", device_id)
-        if not device_check['success'] or device_check['output'] != 'device':
-            return jsonify({'error': f'Device {device_id} is not connected or available'}), 404
+        error = check_live_device(device_id)
+        if error is not None:
+            return error
         
-        # Check if ADB is available
-        adb_check = run_adb_command("version")
-        if not adb_check['success']:
-            return jsonify({'error': 'ADB is not available. Please install ADB and ensure it is in your PATH.'}), 500
+        try:
+            options = parse_image_options(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Mark stream as active
-        live_streams[device_id] = True
+        transport = request.args.get('transport', 'sse')
+        if transport not in ('sse', 'binary'):
+            return jsonify({'error': "transport must be 'sse' or 'binary'"}), 400
+        binary = transport == 'binary'
+        
+        # ?tiles=1: after the first full frame, send only the changed regions
+        tiles = request.args.get('tiles', '0').lower() in ('1', 'true', 'yes')
+        subscriber = stream_manager.subscribe(device_id, tiles, options)
         
         def event_stream():
             try:
-                for data in generate_device_stream(device_id):
+                for data in generate_device_stream(device_id, subscriber, binary):
                     yield data
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'device_id': device_id, 'error': f'Stream generation error: {str(e)}'})}\n\n"
+                error = {'type': 'error', 'device_id': device_id, 'error': f'Stream generation error: {str(e)}'}
+                yield binary_message(device_id, error) if binary else f"data: {json.dumps(error)}\n\n"
             finally:
-                # Cleanup
-                if device_id in live_streams:
-                    del live_streams[device_id]
+                # Last viewer leaving stops the capture worker
+                stream_manager.unsubscribe(subscriber)
         
-        response = Response(event_stream(), mimetype='text/event-stream')
+        response = Response(event_stream(), mimetype='application/octet-stream' if binary else 'text/event-stream')
         response.headers['Cache-Control'] = 'no-cache'
         response.headers['Connection'] = 'keep-alive'
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -773,25 +781,193 @@ def start_live_stream(device_id):
 
 @devices_bp.route('/devices/<device_id>/live-stream', methods=['DELETE'])
 def stop_live_stream(device_id):
-    """Stop live screenshot stream for device"""
+    """Stop live screenshot stream for device
+    
+    With ?subscriber=<id> only that viewer is disconnected; without it the
+    device's stream is stopped for everyone.
+    """
     try:
-        if device_id in live_streams:
-            live_streams[device_id] = False
-            del live_streams[device_id]
+        subscriber_id = request.args.get('subscriber', type=int)
+        if subscriber_id is not None:
+            stream_manager.stop_subscriber(device_id, subscriber_id)
+        else:
+            stream_manager.stop_device(device_id)
         
         return jsonify({'message': 'Live stream stopped'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@devices_bp.route('/devices/<device_id>/live-video', methods=['GET'])
+def start_live_video(device_id):
+    """Stream the device screen as raw H.264 (Annex B) over chunked HTTP
+    
+    Optional query parameters: bit_rate (bits per second) and max_size
+    (WIDTHxHEIGHT) are passed to screenrecord. Viewers asking for the same
+    settings share one recording.
+    """
+    try:
+        bit_rate = request.args.get('bit_rate', LIVE_VIDEO_BIT_RATE, type=int)
+        if not 100000 <= bit_rate <= 50000000:
+            return jsonify({'error': 'bit_rate must be between 100000 and 50000000'}), 400
+        size = request.args.get('max_size') or None
+        if size and not re.fullmatch(r'\d{2,5}x\d{2,5}', size):
+            return jsonify({'error': 'max_size must look like 720x1600'}), 400
+        
+        error = check_live_device(device_id)
+        if error is not None:
+            return error
+        
+        # A recording holds the screen recorder until it is stopped
+        holders = lock_manager.holders(device_id, 'screen')
+        if any(holder['owner'] == 'recording' for holder in holders):
+            return jsonify({'error': f'Screen of {device_id} is being recorded', 'holders': holders}), 409
+        
+        # Only the static screen size: no battery or screen probe before the first frame
+        resolution = device_info_cache.resolution(device_id)
+        subscriber = video_manager.subscribe(device_id, bit_rate, size)
+        
+        def video_stream():
+            try:
+                while True:
+                    data = subscriber.next_chunk(timeout=LIVE_VIDEO_KEEPALIVE)
+                    if data is None:
+                        break
+                    # An access unit delimiter keeps idle connections alive
+                    yield data or ACCESS_UNIT_DELIMITER
+            finally:
+                video_manager.unsubscribe(subscriber)
+        
+        response = Response(video_stream(), mimetype='video/h264')
+        response.headers['Cache-Control'] = 'no-cache, no-store'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        if resolution:
+            # Touch coordinates must be in device pixels, not video pixels
+            response.headers['X-Device-Resolution'] = resolution
+        return response
+    
+    except Exception as e:
+        return jsonify({'error': f'Failed to start live video: {str(e)}'}), 500
+
+@devices_bp.route('/devices/mosaic', methods=['GET'])
+def start_mosaic_stream():
+    """Stream thumbnails of many devices over one SSE connection
+    
+    ?ids=a,b limits the mosaic to some devices (default: all connected).
+    Devices are captured round-robin within a global frame budget shared
+    by all mosaic viewers. Image options default to the thumbnail preset.
+    """
+    try:
+        try:
+            options = parse_image_options(request.args, default_preset='thumbnail')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        ids = [device_id.strip() for device_id in request.args.get('ids', '').split(',') if device_id.strip()]
+        
+        viewer = MosaicViewer(ids or None, options)
+        fleet_mosaic.add_viewer(viewer)
+        
+        def mosaic_stream():
+            try:
+                yield f"data: {json.dumps({'type': 'connected', 'viewer_id': viewer.id, 'devices': ids or None, 'fps_budget': fleet_mosaic.fps})}\n\n"
+                while True:
+                    frames = viewer.next_frames(timeout=LIVE_STREAM_KEEPALIVE)
+                    if frames is None:
+                        break
+                    if not frames:
+                        yield ": keepalive\n\n"
+                    for frame in frames:
+                        yield frame.sse_payload(viewer.options)
+            finally:
+                fleet_mosaic.remove_viewer(viewer)
+        
+        response = Response(mosaic_stream(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Connection'] = 'keep-alive'
+        return response
+    
+    except Exception as e:
+        return jsonify({'error': f'Failed to start mosaic stream: {str(e)}'}), 500
+
 @devices_bp.route('/devices/live-streams', methods=['GET'])
 def get_all_live_streams():
     """Get status of all live streams"""
     try:
-        return jsonify({'active_streams': list(live_streams.keys())})
+        streams = stream_manager.status()
+        return jsonify({
+            'active_streams': list(streams.keys()),
+            'streams': streams,
+            'video_streams': video_manager.status(),
+            'mosaic': fleet_mosaic.status()
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Interactive device controls
+INPUT_WAIT_TIMEOUT = 30  # seconds a control request waits for its event to be sent
+
+def queue_input(device_id, kind, args, message, drag_id=None, extra=None, build=None):
+    """Queue an input event and build the response
+    
+    Waits until the event was sent to the device, unless ?wait=0 in which
+    case it answers 202 right away. Either way the response carries the
+    event's seq (see GET /devices/<id>/control/queue) and the extra fields.
+    
+    If the device leads a mirror, or ?group=<name> is given, the event goes
+    to those devices too (see queue_mirrored).
+    """
+    targets = mirror_manager.targets(device_id)
+    group = request.args.get('group')
+    if group:
+        members = mirror_manager.group(group)
+        if not members:
+            return jsonify({'error': f'Unknown or empty group: {group}'}), 404
+        targets = list(dict.fromkeys(targets + members))
+    targets = [target for target in targets if target != device_id]
+    if targets:
+        return queue_mirrored(device_id, targets, kind, args, message, drag_id, extra, build)
+    
+    seq, event = input_manager.submit(device_id, kind, args, drag_id)
+    extra = dict(extra or {}, seq=seq)
+    if request.args.get('wait', '1').lower() in ('0', 'false', 'no'):
+        return jsonify({'message': f'{message} (queued)', **extra}), 202
+    if not event.wait(INPUT_WAIT_TIMEOUT):
+        return jsonify({'error': 'Timed out waiting for the device', **extra}), 504
+    if not event.success:
+        return jsonify({'error': event.error, **extra}), 500
+    return jsonify({'message': message, 'latency_ms': event.latency_ms, **extra})
+
+def queue_mirrored(device_id, targets, kind, args, message, drag_id=None, extra=None, build=None):
+    """Send an input event to device_id and targets in parallel
+    
+    build(target, screen_size) -> (kind, args) prepares a target's own event, see
+    MirrorManager.dispatch. The response has the leader's seq plus a
+    "mirror" object with every device's state and the dispatch skew. It is
+    an error only if the leader's event failed; targets that failed are
+    counted in mirror.failed.
+    """
+    dispatch = mirror_manager.dispatch(device_id, targets, kind, args, drag_id, build)
+    extra = dict(extra or {}, seq=dispatch.events[0][1])
+    if request.args.get('wait', '1').lower() in ('0', 'false', 'no'):
+        threading.Thread(target=mirror_manager.finish, args=(dispatch, INPUT_WAIT_TIMEOUT), daemon=True).start()
+        return jsonify({'message': f'{message} (queued on {len(dispatch.events)} devices)',
+                        'mirror': {'devices': dispatch.results()}, **extra}), 202
+    
+    finished, dispatch_skew, completion_skew = mirror_manager.finish(dispatch, INPUT_WAIT_TIMEOUT)
+    devices = dispatch.results()
+    mirror = {
+        'devices': devices,
+        'failed': sum(1 for result in devices.values() if result['state'] != 'delivered'),
+        'dispatch_skew_ms': dispatch_skew,
+        'completion_skew_ms': completion_skew
+    }
+    leader = dispatch.events[0][2]
+    if not finished and leader.success is None:
+        return jsonify({'error': 'Timed out waiting for the device', 'mirror': mirror, **extra}), 504
+    if not leader.success:
+        return jsonify({'error': leader.error, 'mirror': mirror, **extra}), 500
+    return jsonify({'message': f'{message} on {len(devices)} devices', 'latency_ms': leader.latency_ms,
+                    'mirror': mirror, **extra})
+
 @devices_bp.route('/devices/<device_id>/control/tap', methods=['POST'])
 def tap_device(device_id):
     """Tap on device screen at coordinates"""
@@ -803,19 +979,18 @@ def tap_device(device_id):
         if x is None or y is None:
             return jsonify({'error': 'x and y coordinates are required'}), 400
         
-        tap_result = run_adb_command(f"shell input tap {x} {y}", device_id)
-        
-        if tap_result['success']:
-            return jsonify({'message': f'Tapped at ({x}, {y})'})
-        else:
-            return jsonify({'error': tap_result['error']}), 500
+        return queue_input(device_id, 'tap', [int(x), int(y)], f'Tapped at ({x}, {y})')
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @devices_bp.route('/devices/<device_id>/control/swipe', methods=['POST'])
 def swipe_device(device_id):
-    """Swipe on device screen"""
+    """Swipe on device screen
+    
+    Swipes sharing a drag_id are steps of one drag: a step that is still
+    waiting to be sent is replaced by the next one.
+    """
     try:
         data = request.get_json()
         x1 = data.get('x1')
@@ -827,12 +1002,8 @@ def swipe_device(device_id):
         if None in [x1, y1, x2, y2]:
             return jsonify({'error': 'x1, y1, x2, y2 coordinates are required'}), 400
         
-        swipe_result = run_adb_command(f"shell input swipe {x1} {y1} {x2} {y2} {duration}", device_id)
-        
-        if swipe_result['success']:
-            return jsonify({'message': f'Swiped from ({x1}, {y1}) to ({x2}, {y2})'})
-        else:
-            return jsonify({'error': swipe_result['error']}), 500
+        return queue_input(device_id, 'swipe', [int(x1), int(y1), int(x2), int(y2), int(duration)],
+                           f'Swiped from ({x1}, {y1}) to ({x2}, {y2})', data.get('drag_id'))
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -847,12 +1018,7 @@ def send_key(device_id):
         if not keycode:
             return jsonify({'error': 'keycode is required'}), 400
         
-        key_result = run_adb_command(f"shell input keyevent {keycode}", device_id)
-        
-        if key_result['success']:
-            return jsonify({'message': f'Key {keycode} sent'})
-        else:
-            return jsonify({'error': key_result['error']}), 500
+        return queue_input(device_id, 'key', [keycode], f'Key {keycode} sent')
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -867,114 +1033,166 @@ def send_text(device_id):
         if not text:
             return jsonify({'error': 'text is required'}), 400
         
-        # Escape special characters
-        escaped_text = text.replace(' ', '%s').replace('&', '\\&')
-        
-        text_result = run_adb_command(f"shell input text '{escaped_text}'", device_id)
-        
-        if text_result['success']:
-            return jsonify({'message': f'Text sent: {text}'})
-        else:
-            return jsonify({'error': text_result['error']}), 500
+        return queue_input(device_id, 'text', [text], f'Text sent: {text}')
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@devices_bp.route('/devices/<device_id>/control/home', methods=['POST'])
-def press_home(device_id):
-    """Press home button"""
+@devices_bp.route('/devices/<device_id>/control/gesture', methods=['POST'])
+def play_gesture(device_id):
+    """Play a touch gesture: any path, one or more fingers, timed per point
+    
+    Body: {"points": [{"x", "y", "t"}, ...]} or {"pointers": [[...], ...]},
+    t in ms. Played through the touchscreen with sendevent where possible,
+    see src/adb/gesture.py.
+    """
     try:
-        home_result = run_adb_command("shell input keyevent KEYCODE_HOME", device_id)
+        try:
+            paths = parse_gesture(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if home_result['success']:
-            return jsonify({'message': 'Home button pressed'})
-        else:
-            return jsonify({'error': home_result['error']}), 500
-            
+        size = screen_size(device_id)
+        try:
+            script, method = gesture_script(device_id, paths, size)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        def build(target, target_size):
+            # Mirrored gestures follow the same path on the target's own screen and touchscreen
+            target_paths = [[scale_point(x, y, size, target_size) + (t,) for x, y, t in path] for path in paths]
+            return 'script', [gesture_script(target, target_paths, target_size)[0]]
+        
+        return queue_input(device_id, 'script', [script], f'Gesture with {len(paths)} pointer(s) played',
+                           extra={'method': method}, build=build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@devices_bp.route('/devices/<device_id>/control/back', methods=['POST'])
-def press_back(device_id):
-    """Press back button"""
+# Hardware buttons: route name -> (keycode, message)
+CONTROL_BUTTONS = {
+    'home': ('KEYCODE_HOME', 'Home button pressed'),
+    'back': ('KEYCODE_BACK', 'Back button pressed'),
+    'menu': ('KEYCODE_MENU', 'Menu button pressed'),
+    'power': ('KEYCODE_POWER', 'Power button pressed'),
+    'volume-up': ('KEYCODE_VOLUME_UP', 'Volume up pressed'),
+    'volume-down': ('KEYCODE_VOLUME_DOWN', 'Volume down pressed'),
+    'recent-apps': ('KEYCODE_APP_SWITCH', 'Recent apps button pressed'),
+}
+
+@devices_bp.route('/devices/<device_id>/control/<any(home, back, menu, power, "volume-up", "volume-down", "recent-apps"):button>', methods=['POST'])
+def press_button(device_id, button):
+    """Press a hardware button (home, back, menu, power, volume, recent apps)"""
     try:
-        back_result = run_adb_command("shell input keyevent KEYCODE_BACK", device_id)
-        
-        if back_result['success']:
-            return jsonify({'message': 'Back button pressed'})
-        else:
-            return jsonify({'error': back_result['error']}), 500
-            
+        keycode, message = CONTROL_BUTTONS[button]
+        return queue_input(device_id, 'key', [keycode], message)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@devices_bp.route('/devices/<device_id>/control/menu', methods=['POST'])
-def press_menu(device_id):
-    """Press menu button"""
+@devices_bp.route('/devices/<device_id>/control/queue', methods=['GET'])
+def get_input_queue(device_id):
+    """Input queue depth, latency and delivery progress for a device
+    
+    With ?seq=N, also reports whether that event was delivered.
+    """
     try:
-        menu_result = run_adb_command("shell input keyevent KEYCODE_MENU", device_id)
-        
-        if menu_result['success']:
-            return jsonify({'message': 'Menu button pressed'})
-        else:
-            return jsonify({'error': menu_result['error']}), 500
-            
+        queue = input_manager.get(device_id)
+        status = queue.status()
+        seq = request.args.get('seq', type=int)
+        if seq is not None:
+            event = queue.result(seq)
+            status['event'] = {
+                'seq': seq,
+                'state': event.state if event is not None else 'unknown',
+                'error': event.error if event is not None else '',
+                'latency_ms': event.latency_ms if event is not None else None
+            }
+        return jsonify(status)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@devices_bp.route('/devices/<device_id>/control/power', methods=['POST'])
-def press_power(device_id):
-    """Press power button"""
+# Input mirroring across devices (see src/adb/mirror.py)
+@devices_bp.route('/devices/mirror', methods=['GET'])
+def get_mirrors():
+    """Device groups, active mirrors and dispatch skew statistics"""
     try:
-        power_result = run_adb_command("shell input keyevent KEYCODE_POWER", device_id)
-        
-        if power_result['success']:
-            return jsonify({'message': 'Power button pressed'})
-        else:
-            return jsonify({'error': power_result['error']}), 500
-            
+        return jsonify(mirror_manager.status())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@devices_bp.route('/devices/<device_id>/control/volume-up', methods=['POST'])
-def press_volume_up(device_id):
-    """Press volume up button"""
+@devices_bp.route('/devices/<device_id>/mirror', methods=['POST'])
+def start_mirror(device_id):
+    """Mirror every input sent to this device onto targets
+    
+    Body: {"targets": [device ids]} and/or {"group": name}.
+    """
     try:
-        volume_result = run_adb_command("shell input keyevent KEYCODE_VOLUME_UP", device_id)
-        
-        if volume_result['success']:
-            return jsonify({'message': 'Volume up pressed'})
-        else:
-            return jsonify({'error': volume_result['error']}), 500
-            
+        data = request.get_json(silent=True) or {}
+        targets = list(data.get('targets') or [])
+        if data.get('group'):
+            members = mirror_manager.group(data['group'])
+            if not members:
+                return jsonify({'error': f"Unknown or empty group: {data['group']}"}), 404
+            targets += members
+        try:
+            targets = mirror_manager.start(device_id, targets)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'message': f'Mirroring {device_id} onto {len(targets)} devices', 'leader': device_id,
+                        'targets': targets})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@devices_bp.route('/devices/<device_id>/control/volume-down', methods=['POST'])
-def press_volume_down(device_id):
-    """Press volume down button"""
+@devices_bp.route('/devices/<device_id>/mirror', methods=['DELETE'])
+def stop_mirror(device_id):
+    """Stop mirroring this device's input"""
     try:
-        volume_result = run_adb_command("shell input keyevent KEYCODE_VOLUME_DOWN", device_id)
-        
-        if volume_result['success']:
-            return jsonify({'message': 'Volume down pressed'})
-        else:
-            return jsonify({'error': volume_result['error']}), 500
-            
+        if not mirror_manager.stop(device_id):
+            return jsonify({'error': 'Device is not mirrored'}), 404
+        return jsonify({'message': f'Stopped mirroring {device_id}'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@devices_bp.route('/devices/<device_id>/control/recent-apps', methods=['POST'])
-def press_recent_apps(device_id):
-    """Press recent apps button"""
+@devices_bp.route('/devices/groups', methods=['GET'])
+def get_device_groups():
+    """Named device groups for mirrored input"""
     try:
-        recent_result = run_adb_command("shell input keyevent KEYCODE_APP_SWITCH", device_id)
-        
-        if recent_result['success']:
-            return jsonify({'message': 'Recent apps button pressed'})
-        else:
-            return jsonify({'error': recent_result['error']}), 500
-            
+        return jsonify(mirror_manager.status()['groups'])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@devices_bp.route('/devices/groups/<name>', methods=['PUT'])
+def set_device_group(name):
+    """Create or replace a device group. Body: {"devices": [device ids]}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        devices = data.get('devices')
+        if not devices or not isinstance(devices, list):
+            return jsonify({'error': 'devices is required'}), 400
+        try:
+            devices = mirror_manager.set_group(name, devices)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        mirror_manager.warm_up(devices)
+        return jsonify({'message': f'Group {name} has {len(devices)} devices', 'name': name, 'devices': devices})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@devices_bp.route('/devices/groups/<name>', methods=['DELETE'])
+def delete_device_group(name):
+    """Delete a device group"""
+    try:
+        if not mirror_manager.delete_group(name):
+            return jsonify({'error': 'Group not found'}), 404
+        return jsonify({'message': f'Group {name} deleted'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Device resource leases (see src/adb/locks.py)
+@devices_bp.route('/devices/locks', methods=['GET'])
+def get_device_locks():
+    """Lease holders, waiters and contention statistics, optionally for one ?device="""
+    try:
+        return jsonify(lock_manager.stats(request.args.get('device') or None))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -988,11 +1206,20 @@ def start_recording(device_id):
         if device_id in recording_processes:
             return jsonify({'error': 'Recording already in progress'}), 400
         
+        # Hold the screen recorder for as long as the recording runs
+        try:
+            lease = lock_manager.acquire(device_id, 'screen', 'exclusive', owner='recording', wait=0, lease=None)
+        except LockTimeout as e:
+            return jsonify({'error': str(e), 'holders': e.holders}), 409
+        
         # Start recording in background
         record_file = f"/sdcard/recording_{int(time.time())}.mp4"
         
         def record_screen():
-            record_result = run_adb_command(f"shell screenrecord {record_file}", device_id)
+            try:
+                record_result = run_adb_command(f"shell screenrecord {record_file}", device_id)
+            finally:
+                lock_manager.release(lease)
             if device_id in recording_processes:
                 del recording_processes[device_id]
         
@@ -1018,24 +1245,27 @@ def stop_recording(device_id):
         if device_id not in recording_processes:
             return jsonify({'error': 'No recording in progress'}), 400
         
-        # Stop recording by sending interrupt
-        run_adb_command("shell pkill -SIGINT screenrecord", device_id)
-        
         record_info = recording_processes[device_id]
         record_file = record_info['file']
         
+        # Stop recording by sending interrupt; only this recording's screenrecord,
+        # not the one behind a live video stream of the same device
+        run_adb_command(f"shell pkill -SIGINT -f {record_file}", device_id)
+        
         # Wait a moment for file to be written
         time.sleep(2)
         
         # Pull the recording file
         local_file = f"/tmp/recording_{device_id}_{int(time.time())}.mp4"
-        pull_result = run_adb_command(f"pull {record_file} {local_file}", device_id)
+        with lock_manager.lease(device_id, 'filesystem', 'shared', owner='recording'):
+            pull_result = run_adb_command(f"pull {record_file} {local_file}", device_id)
+            
+            if pull_result['success']:
+                # Clean up device file
+                run_adb_command(f"shell rm {record_file}", device_id)
         
         if pull_result['success']:
-            # Clean up device file
-            run_adb_command(f"shell rm {record_file}", device_id)
-            
-            del recording_processes[device_id]
+            recording_processes.pop(device_id, None)
             
             return jsonify({
                 'message': 'Recording stopped and saved',
@@ -3,21 +3,33 @@ import subprocess
 import json
 import time
 import random
-import threading
 import re
+import uuid
 import requests
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.adb.client import ADB_COMMAND_TIMEOUT, run_adb_command
+from src.adb.deploy import DEPLOY_CONCURRENCY, Apk, ApkError, deployments, remove_files, start_deployment
+from src.adb.jobs import JOB_PRIORITIES, job_manager
+from src.models.store import store
 
 scripts_bp = Blueprint('scripts', __name__)
 
-# Global variables for script execution
-script_threads = {}
-script_status = {}
-uploaded_files = {}
+# Uploaded script inputs are remembered in the store's 'uploaded_files' setting
+# (file type -> path); script runs are jobs, see src/adb/jobs.py
 
 UPLOAD_FOLDER = '/tmp/adb_uploads'
+APPS_FOLDER = os.path.join(os.getcwd(), 'apps')  # APKs that can be deployed by name
+DEPLOY_UPLOAD_MAX = int(os.environ.get('DEPLOY_UPLOAD_MAX', str(1024 * 1024 * 1024)))  # bytes per /deploy upload
+
+# Worker pool for custom commands; bounds how many devices run one at the same time
+CUSTOM_COMMAND_WORKERS = int(os.environ.get('CUSTOM_COMMAND_WORKERS', '8'))
+CUSTOM_COMMAND_MAX_TIMEOUT = 600
+command_executor = ThreadPoolExecutor(max_workers=CUSTOM_COMMAND_WORKERS, thread_name_prefix='custom-command')
+STATUS_LONG_POLL_MAX = 60  # seconds a status long-poll may wait for a change
+STATUS_KEEPALIVE = 15  # seconds between keepalive comments on the status event stream
 ALLOWED_EXTENSIONS = {'txt', 'csv', 'json'}
 
 # YouTube API configuration
@@ -118,58 +130,6 @@ def set_youtube_api_key(api_key):
     YOUTUBE_API_KEY = api_key
     print(f"[DEBUG] YouTube API key set successfully")
 
-def run_adb_command(command, device_id=None):
-    """Execute ADB command and return result"""
-    print(f"[DEBUG] run_adb_command called with: command=\"{command}\", device_id={device_id}")
-    try:
-        if device_id:
-            cmd = f"adb -s {device_id} {command}"
-        else:
-            cmd = f"adb {command}"
-        
-        print(f"[DEBUG] Full ADB command to execute: {cmd}")
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=30)
-        print(f"[DEBUG] ADB command execution finished. Return code: {result.returncode}")
-        print(f"[DEBUG] ADB stdout: {result.stdout.strip()}")
-        print(f"[DEBUG] ADB stderr: {result.stderr.strip()}")
-        return {
-            'success': result.returncode == 0,
-            'output': result.stdout.strip(),
-            'error': result.stderr.strip()
-        }
-    except subprocess.TimeoutExpired:
-        print(f"[DEBUG] ADB command timed out: {cmd}")
-        return {
-            'success': False,
-            'output': '',
-            'error': 'Command timed out'
-        }
-    except Exception as e:
-        print(f"[DEBUG] Exception in run_adb_command: {e}")
-        import traceback
-        traceback.print_exc()
-        return {
-            'success': False,
-            'output': '',
-            'error': str(e)
-        }
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 def extract_channel_videos(channel_url, content_filter='videos'):
     """Extract video URLs from a YouTube channel with improved error handling and content filtering"""
     try:
@@ -319,12 +279,12 @@ def extract_single_content_type(channel_url, content_filter):
         traceback.print_exc()
         return []
 
-def youtube_automation_thread(devices, videos, options, script_id, channel_url=None, custom_durations=None, content_filter='all'):
+def youtube_automation_job(job, devices, videos, options, channel_url=None, custom_durations=None, content_filter='all'):
     """Simplified YouTube automation with reliable video playback and detailed logging"""
-    print(f"[DEBUG] youtube_automation_thread started for script {script_id}")
+    print(f"[DEBUG] youtube_automation_job started for job {job.id}")
     try:
-        script_status[script_id] = {"status": "running", "progress": 0, "message": "Starting YouTube automation"}
-        print(f"[DEBUG] Starting YouTube automation for script {script_id}")
+        job.update(status="running", progress=0, message="Starting YouTube automation")
+        print(f"[DEBUG] Starting YouTube automation for job {job.id}")
         print(f"[DEBUG] Devices: {devices}")
         print(f"[DEBUG] Videos: {videos}")
         print(f"[DEBUG] Options: {options}")
@@ -333,27 +293,25 @@ def youtube_automation_thread(devices, videos, options, script_id, channel_url=N
         
         # If channel URL is provided, extract videos from channel
         if channel_url:
-            script_status[script_id]["message"] = f"Extracting {content_filter} from YouTube channel..."
+            job.update(message=f"Extracting {content_filter} from YouTube channel...")
             print(f"[DEBUG] Extracting {content_filter} from channel: {channel_url}")
             channel_videos = extract_channel_videos(channel_url, content_filter)
             if channel_videos:
                 videos = channel_videos
-                script_status[script_id]["message"] = f"Found {len(videos)} {content_filter} from channel"
+                job.update(message=f"Found {len(videos)} {content_filter} from channel")
                 print(f"[DEBUG] Found {len(videos)} {content_filter} from channel")
             else:
-                script_status[script_id]["status"] = "error"
-                script_status[script_id]["message"] = f"Failed to extract {content_filter} from channel"
+                job.update(status="error", message=f"Failed to extract {content_filter} from channel")
                 print(f"[DEBUG] Failed to extract {content_filter} from channel")
                 return
         
         if not videos:
-            script_status[script_id]["status"] = "error"
-            script_status[script_id]["message"] = "No videos to play"
+            job.update(status="error", message="No videos to play")
             print(f"[DEBUG] No videos to play")
             return
         
         # Simplified logic: Always play all videos on all devices sequentially
-        script_status[script_id]["message"] = "Playing videos on all selected devices"
+        job.update(message="Playing videos on all selected devices")
         print(f"[DEBUG] Starting video playback on {len(devices)} devices")
         
         # Use videos as-is without shuffling
@@ -363,17 +321,17 @@ def youtube_automation_thread(devices, videos, options, script_id, channel_url=N
         print(f"[DEBUG] Total videos to play: {total_videos}")
         
         for video_index, video_url in enumerate(video_list):
-            if script_status[script_id]["status"] == "stopped":
+            if job.cancelled:
                 print(f"[DEBUG] Script stopped by user")
                 break
             
-            script_status[script_id]["progress"] = int((video_index / total_videos) * 100)
-            script_status[script_id]["message"] = f"Playing video {video_index + 1}/{total_videos} on all devices"
+            job.update(progress=int((video_index / total_videos) * 100),
+                       message=f"Playing video {video_index + 1}/{total_videos} on all devices")
             print(f"[DEBUG] Playing video {video_index + 1}/{total_videos}: {video_url}")
             
             # Play video on all devices simultaneously
             for device_id in devices:
-                if script_status[script_id]["status"] == "stopped":
+                if job.cancelled:
                     break
                 
                 print(f"[DEBUG] Attempting to play video on device {device_id}")
@@ -381,30 +339,32 @@ def youtube_automation_thread(devices, videos, options, script_id, channel_url=N
                 # Use the most reliable method: direct intent with YouTube app
                 # Using -n com.google.android.youtube/.WatchActivity to directly target YouTube\"s watch activity
                 # Adding --user 0 to specify the user to run the command as (default user)
-                adb_command = f"shell am start -a android.intent.action.VIEW -d \'{video_url}\' com.google.android.youtube"
-                print(f"[DEBUG] Executing ADB command: adb -s {device_id} {adb_command}")
+                with job.step(device_id, f'play video {video_index + 1}', lock=('input', 'shared')) as step:
+                    adb_command = f"shell am start -a android.intent.action.VIEW -d \'{video_url}\' com.google.android.youtube"
+                    print(f"[DEBUG] Executing ADB command: adb -s {device_id} {adb_command}")
                 
-                result = run_adb_command(adb_command, device_id)
-                print(f"[DEBUG] ADB result for device {device_id}: {result}")
+                    result = run_adb_command(adb_command, device_id)
+                    print(f"[DEBUG] ADB result for device {device_id}: {result}")
                 
-                if result.get("success", False):
-                    print(f"[DEBUG] Successfully started video on device {device_id}")
-                    # Add a small delay to allow the video to start playing
-                    print(f"[DEBUG] Waiting 5 seconds for video to start on device {device_id}")
-                    time.sleep(5) 
-                    # Attempt to tap the center of the screen to ensure playback starts
-                    print(f"[DEBUG] Tapping center of screen on device {device_id} to ensure playback")
-                    tap_result = run_adb_command("shell input tap 500 500", device_id)
-                    print(f"[DEBUG] Tap result for device {device_id}: {tap_result}")
-                else:
-                    print(f"[DEBUG] Failed to start video on device {device_id}: {result.get('error', 'Unknown error')}")
+                    if result.get("success", False):
+                        print(f"[DEBUG] Successfully started video on device {device_id}")
+                        # Add a small delay to allow the video to start playing
+                        print(f"[DEBUG] Waiting 5 seconds for video to start on device {device_id}")
+                        job.sleep(5) 
+                        # Attempt to tap the center of the screen to ensure playback starts
+                        print(f"[DEBUG] Tapping center of screen on device {device_id} to ensure playback")
+                        tap_result = run_adb_command("shell input tap 500 500", device_id)
+                        print(f"[DEBUG] Tap result for device {device_id}: {tap_result}")
+                    else:
+                        step['success'] = False
+                        print(f"[DEBUG] Failed to start video on device {device_id}: {result.get('error', 'Unknown error')}")
                 
                 print(f"[DEBUG] Delaying 2 seconds before next device for synchronization")
-                time.sleep(2)  # Delay between devices for better synchronization
+                job.sleep(2)  # Delay between devices for better synchronization
             
             # Wait for video to complete (hybrid approach with intelligent duration detection)
             # Always wait for video completion, regardless of whether it's the last video
-            script_status[script_id]["message"] = f"Getting duration for video {video_index + 1}..."
+            job.update(message=f"Getting duration for video {video_index + 1}...")
             print(f"[DEBUG] Getting duration for video {video_index + 1}")
             
             # Get video duration - use custom duration if provided, otherwise fetch from API
@@ -417,7 +377,7 @@ def youtube_automation_thread(devices, videos, options, script_id, channel_url=N
             # Add 30 seconds buffer for loading and ads
             wait_time = video_duration + 30
             
-            script_status[script_id]["message"] = f"Waiting for video {video_index + 1} to complete... (Duration: {video_duration}s)"
+            job.update(message=f"Waiting for video {video_index + 1} to complete... (Duration: {video_duration}s)")
             print(f"[DEBUG] Video duration: {video_duration}s, waiting {wait_time}s total")
             
             # Progressive timeout with completion detection
@@ -426,7 +386,7 @@ def youtube_automation_thread(devices, videos, options, script_id, channel_url=N
             max_checks = wait_time // check_interval
             
             for i in range(wait_time):
-                if script_status[script_id]["status"] == "stopped":
+                if job.cancelled:
                     print(f"[DEBUG] Script stopped during wait by user")
                     break
                 
@@ -449,22 +409,20 @@ def youtube_automation_thread(devices, videos, options, script_id, channel_url=N
                         print(f"[DEBUG] Video completion detected early at {i}s")
                         break
                 
-                time.sleep(1)
+                job.sleep(1)
                 
                 # Update progress during wait
                 if i % 30 == 0:  # Update every 30 seconds
                     remaining_time = wait_time - i
-                    script_status[script_id]["message"] = f"Video {video_index + 1} playing... ({remaining_time}s remaining, duration: {video_duration}s)"
+                    job.update(message=f"Video {video_index + 1} playing... ({remaining_time}s remaining, duration: {video_duration}s)")
                     print(f"[DEBUG] Video {video_index + 1} playing... ({remaining_time}s remaining)")
         
-        script_status[script_id]["status"] = "completed"
-        script_status[script_id]["progress"] = 100
-        script_status[script_id]["message"] = f"YouTube automation completed. Played {len(video_list)} videos on {len(devices)} devices."
+        job.update(status="completed", progress=100,
+                   message=f"YouTube automation completed. Played {len(video_list)} videos on {len(devices)} devices.")
         print(f"[DEBUG] YouTube automation completed successfully")
         
     except Exception as e:
-        script_status[script_id]["status"] = "error"
-        script_status[script_id]["message"] = f"Error: {str(e)}"
+        job.update(status="error", message=f"Error: {str(e)}")
         print(f"[DEBUG] YouTube automation error: {e}")
         import traceback
         traceback.print_exc()
@@ -475,23 +433,22 @@ def youtube_automation_thread(devices, videos, options, script_id, channel_url=N
 
 
 
-def google_signin_thread(devices, accounts_file, script_id):
-    """Google sign-in thread function with enhanced error handling"""
+def google_signin_job(job, devices, accounts_file):
+    """Google sign-in job with enhanced error handling"""
     try:
-        script_status[script_id] = {
-            'status': 'running', 
-            'progress': 0, 
-            'message': 'Starting Google sign-in automation',
-            'devices_processed': 0,
-            'total_devices': len(devices),
-            'successful_devices': 0,
-            'failed_devices': 0
-        }
+        job.update(
+            status='running',
+            progress=0,
+            message='Starting Google sign-in automation',
+            devices_processed=0,
+            total_devices=len(devices),
+            successful_devices=0,
+            failed_devices=0
+        )
         
         # Validate accounts file exists
         if not os.path.exists(accounts_file):
-            script_status[script_id]['status'] = 'error'
-            script_status[script_id]['message'] = f'Accounts file not found: {accounts_file}'
+            job.update(status='error', message=f'Accounts file not found: {accounts_file}')
             return
         
         # Read and validate accounts file
@@ -499,13 +456,11 @@ def google_signin_thread(devices, accounts_file, script_id):
             with open(accounts_file, 'r', encoding='utf-8') as f:
                 accounts = [line.strip() for line in f.readlines() if line.strip() and not line.startswith('#')]
         except Exception as e:
-            script_status[script_id]['status'] = 'error'
-            script_status[script_id]['message'] = f'Error reading accounts file: {str(e)}'
+            job.update(status='error', message=f'Error reading accounts file: {str(e)}')
             return
         
         if not accounts:
-            script_status[script_id]['status'] = 'error'
-            script_status[script_id]['message'] = 'No accounts found in file'
+            job.update(status='error', message='No accounts found in file')
             return
         
         # Validate account formats
@@ -523,8 +478,7 @@ def google_signin_thread(devices, accounts_file, script_id):
                 print(f"[DEBUG] Invalid account format (missing password): {account}")
         
         if not valid_accounts:
-            script_status[script_id]['status'] = 'error'
-            script_status[script_id]['message'] = 'No valid accounts found after validation'
+            job.update(status='error', message='No valid accounts found after validation')
             return
         
         print(f"[DEBUG] Found {len(valid_accounts)} valid accounts for {len(devices)} devices")
@@ -533,7 +487,7 @@ def google_signin_thread(devices, accounts_file, script_id):
         failed_count = 0
         
         for i, device_id in enumerate(devices):
-            if script_status[script_id]['status'] == 'stopped':
+            if job.cancelled:
                 break
             
             # Check if device is connected
@@ -546,151 +500,148 @@ def google_signin_thread(devices, accounts_file, script_id):
             # Use round-robin to assign accounts
             email, password = valid_accounts[i % len(valid_accounts)]
             
-            script_status[script_id]['message'] = f'Signing in on device {device_id} with {email}'
+            job.update(message=f'Signing in on device {device_id} with {email}')
             device_success = True
             
-            try:
-                print(f"[DEBUG] Starting Google sign-in on device {device_id} with email: {email}")
+            with job.step(device_id, 'sign in', lock=('input', 'exclusive')) as step:
+                try:
+                    print(f"[DEBUG] Starting Google sign-in on device {device_id} with email: {email}")
                 
-                # Check if browser is available
-                browser_check = run_adb_command('shell pm list packages', device_id)
-                has_browser = browser_check['success'] and any(browser in browser_check['output'].lower() for browser in ['chrome', 'firefox', 'browser'])
-                if not has_browser:
-                    print(f"[DEBUG] No browser found on device {device_id}")
-                    failed_count += 1
-                    device_success = False
-                    continue
+                    # Check if browser is available
+                    browser_check = run_adb_command('shell pm list packages', device_id)
+                    has_browser = browser_check['success'] and any(browser in browser_check['output'].lower() for browser in ['chrome', 'firefox', 'browser'])
+                    if not has_browser:
+                        print(f"[DEBUG] No browser found on device {device_id}")
+                        failed_count += 1
+                        device_success = step['success'] = False
+                        continue
                 
-                # Open Android Settings -> Accounts
-                settings_result = run_adb_command('shell am start -a android.settings.SYNC_SETTINGS', device_id)
-                if not settings_result['success']:
-                    print(f"[DEBUG] Failed to open account settings on device {device_id}")
-                    failed_count += 1
-                    device_success = False
-                    continue
+                    # Open Android Settings -> Accounts
+                    settings_result = run_adb_command('shell am start -a android.settings.SYNC_SETTINGS', device_id)
+                    if not settings_result['success']:
+                        print(f"[DEBUG] Failed to open account settings on device {device_id}")
+                        failed_count += 1
+                        device_success = step['success'] = False
+                        continue
                 
-                time.sleep(3)  # Wait for settings to load
+                    job.sleep(3)  # Wait for settings to load
                 
-                # Try to find and tap "Add account" button with multiple strategies
-                # Strategy 1: Look for menu button (3 dots) first
-                # run_adb_command('shell input tap 700 200', device_id)  # Top right menu
-                # time.sleep(1)
-                run_adb_command('shell input tap 600 300', device_id)  # Add account in menu
-                time.sleep(2)
+                    # Try to find and tap "Add account" button with multiple strategies
+                    # Strategy 1: Look for menu button (3 dots) first
+                    # run_adb_command('shell input tap 700 200', device_id)  # Top right menu
+                    # job.sleep(1)
+                    run_adb_command('shell input tap 600 300', device_id)  # Add account in menu
+                    job.sleep(2)
                 
                 
-                # Tap on Google option using precise coordinates
-                run_adb_command('shell input tap 422 882', device_id)  # Google option
-                time.sleep(5)  # Wait for Google sign-in page to load
+                    # Tap on Google option using precise coordinates
+                    run_adb_command('shell input tap 422 882', device_id)  # Google option
+                    job.sleep(5)  # Wait for Google sign-in page to load
                 
-                # Input email using precise coordinates
-                run_adb_command('shell input tap 511 873', device_id)  # Tap email field
-                time.sleep(1)
+                    # Input email using precise coordinates
+                    run_adb_command('shell input tap 511 873', device_id)  # Tap email field
+                    job.sleep(1)
                 
-                # Clear any existing text and input email
-                run_adb_command('shell input keyevent 123', device_id)  # Ctrl+A
-                time.sleep(0.5)
-                run_adb_command('shell input keyevent 67', device_id)   # Delete
-                time.sleep(0.5)
+                    # Clear any existing text and input email
+                    run_adb_command('shell input keyevent 123', device_id)  # Ctrl+A
+                    job.sleep(0.5)
+                    run_adb_command('shell input keyevent 67', device_id)   # Delete
+                    job.sleep(0.5)
                 
-                email_result = run_adb_command(f'shell input text "{email}"', device_id)
-                if not email_result['success']:
-                    print(f"[DEBUG] Failed to input email on device {device_id}")
-                    failed_count += 1
-                    device_success = False
-                    continue
+                    email_result = run_adb_command(f'shell input text "{email}"', device_id)
+                    if not email_result['success']:
+                        print(f"[DEBUG] Failed to input email on device {device_id}")
+                        failed_count += 1
+                        device_success = step['success'] = False
+                        continue
                 
-                time.sleep(1)
+                    job.sleep(1)
                 
-                # Tap Next button using precise coordinates
-                run_adb_command('shell input tap 931 967', device_id)  # Next button
-                time.sleep(2)  # Wait for password field
+                    # Tap Next button using precise coordinates
+                    run_adb_command('shell input tap 931 967', device_id)  # Next button
+                    job.sleep(2)  # Wait for password field
                 
-                # Input password using precise coordinates
-                run_adb_command('shell input tap 579 738', device_id)  # Tap password field
-                time.sleep(1)
+                    # Input password using precise coordinates
+                    run_adb_command('shell input tap 579 738', device_id)  # Tap password field
+                    job.sleep(1)
                 
-                # Clear any existing text and input password
-                run_adb_command('shell input keyevent 123', device_id)  # Ctrl+A
-                time.sleep(0.5)
-                run_adb_command('shell input keyevent 67', device_id)   # Delete
-                time.sleep(0.5)
+                    # Clear any existing text and input password
+                    run_adb_command('shell input keyevent 123', device_id)  # Ctrl+A
+                    job.sleep(0.5)
+                    run_adb_command('shell input keyevent 67', device_id)   # Delete
+                    job.sleep(0.5)
                 
-                password_result = run_adb_command(f'shell input text "{password}"', device_id)
-                if not password_result['success']:
-                    print(f"[DEBUG] Failed to input password on device {device_id}")
-                    failed_count += 1
-                    device_success = False
-                    continue
+                    password_result = run_adb_command(f'shell input text "{password}"', device_id)
+                    if not password_result['success']:
+                        print(f"[DEBUG] Failed to input password on device {device_id}")
+                        failed_count += 1
+                        device_success = step['success'] = False
+                        continue
                 
-                time.sleep(1)
+                    job.sleep(1)
                 
-                # Tap Next button for password
-                run_adb_command('shell input tap 931 967', device_id)  # Next button after password
-                time.sleep(5)  # Wait for sign-in to complete
+                    # Tap Next button for password
+                    run_adb_command('shell input tap 931 967', device_id)  # Next button after password
+                    job.sleep(5)  # Wait for sign-in to complete
                 
-                # Complete Google account setup process
-                # Step 1: Scroll to bottom and click Skip
-                run_adb_command('shell input swipe 540 1500 540 500', device_id)  # Scroll to bottom
-                time.sleep(1)
-                run_adb_command('shell input tap 98 1789', device_id)  # Skip button
-                time.sleep(3)
+                    # Complete Google account setup process
+                    # Step 1: Scroll to bottom and click Skip
+                    run_adb_command('shell input swipe 540 1500 540 500', device_id)  # Scroll to bottom
+                    job.sleep(1)
+                    run_adb_command('shell input tap 98 1789', device_id)  # Skip button
+                    job.sleep(3)
                 
-                # Step 2: Click I Agree
-                run_adb_command('shell input tap 868 1442', device_id)  # I Agree button
-                time.sleep(3)
+                    # Step 2: Click I Agree
+                    run_adb_command('shell input tap 868 1442', device_id)  # I Agree button
+                    job.sleep(3)
                 
-                # Step 3: Handle backup prompt - Don't turn on
-                run_adb_command('shell input tap 98 1789', device_id)  # Don't turn on backup
-                time.sleep(3)
+                    # Step 3: Handle backup prompt - Don't turn on
+                    run_adb_command('shell input tap 98 1789', device_id)  # Don't turn on backup
+                    job.sleep(3)
                 
-                # Step 4: Handle home address prompt - Skip
-                run_adb_command('shell input tap 156 980', device_id)  # Skip with keyboard
-                time.sleep(1)
-                run_adb_command('shell input tap 98 1789', device_id)  # Skip alternative
-                time.sleep(3)
+                    # Step 4: Handle home address prompt - Skip
+                    run_adb_command('shell input tap 156 980', device_id)  # Skip with keyboard
+                    job.sleep(1)
+                    run_adb_command('shell input tap 98 1789', device_id)  # Skip alternative
+                    job.sleep(3)
                 
-                # Step 5: Click More and Accept
-                run_adb_command('shell input tap 891 1804', device_id)  # More button
-                time.sleep(1)
-                run_adb_command('shell input tap 891 1804', device_id)  # Accept button
-                time.sleep(3)
+                    # Step 5: Click More and Accept
+                    run_adb_command('shell input tap 891 1804', device_id)  # More button
+                    job.sleep(1)
+                    run_adb_command('shell input tap 891 1804', device_id)  # Accept button
+                    job.sleep(3)
                 
-                # Step 6: Go back to home
-                run_adb_command('shell input keyevent 3', device_id)  # Home button
-                time.sleep(2)
+                    # Step 6: Go back to home
+                    run_adb_command('shell input keyevent 3', device_id)  # Home button
+                    job.sleep(2)
                 
-                # Verify account was added by checking account list
-                verification_result = run_adb_command('shell dumpsys account', device_id)
-                if verification_result['success'] and 'google' in verification_result['output'].lower():
-                    print(f"[DEBUG] Google account successfully added to device {device_id}")
-                else:
-                    print(f"[DEBUG] Could not verify Google account addition on device {device_id}")
+                    # Verify account was added by checking account list
+                    verification_result = run_adb_command('shell dumpsys account', device_id)
+                    if verification_result['success'] and 'google' in verification_result['output'].lower():
+                        print(f"[DEBUG] Google account successfully added to device {device_id}")
+                    else:
+                        print(f"[DEBUG] Could not verify Google account addition on device {device_id}")
                 
-                if device_success:
-                    successful_count += 1
-                    print(f"[DEBUG] Google sign-in completed on device {device_id}")
+                    if device_success:
+                        successful_count += 1
+                        print(f"[DEBUG] Google sign-in completed on device {device_id}")
                 
-            except Exception as e:
-                print(f"[DEBUG] Error during Google sign-in on device {device_id}: {e}")
-                failed_count += 1
-                device_success = False
+                except Exception as e:
+                    print(f"[DEBUG] Error during Google sign-in on device {device_id}: {e}")
+                    failed_count += 1
+                    device_success = step['success'] = False
             
             # Update progress
-            script_status[script_id]['devices_processed'] = i + 1
-            script_status[script_id]['successful_devices'] = successful_count
-            script_status[script_id]['failed_devices'] = failed_count
-            script_status[script_id]['progress'] = int(((i + 1) / total_devices) * 100)
+            job.update(devices_processed=i + 1, successful_devices=successful_count, failed_devices=failed_count,
+                       progress=int(((i + 1) / total_devices) * 100))
             
-            time.sleep(2)  # Small delay between devices
+            job.sleep(2)  # Small delay between devices
         
-        if script_status[script_id]['status'] != 'stopped':
-            script_status[script_id]['status'] = 'completed'
-            script_status[script_id]['message'] = f'Google sign-in completed: {successful_count} successful, {failed_count} failed out of {total_devices} devices'
+        if not job.cancelled:
+            job.update(status='completed', message=f'Google sign-in completed: {successful_count} successful, {failed_count} failed out of {total_devices} devices')
         
     except Exception as e:
-        script_status[script_id]['status'] = 'error'
-        script_status[script_id]['message'] = f'Error during Google sign-in: {str(e)}'
+        job.update(status='error', message=f'Error during Google sign-in: {str(e)}')
         print(f"[DEBUG] Google sign-in error: {e}")
         import traceback
         traceback.print_exc()
@@ -713,7 +664,9 @@ def upload_file():
             file_path = os.path.join(UPLOAD_FOLDER, f"{file_type}_{filename}")
             file.save(file_path)
             
+            uploaded_files = dict(store.setting('uploaded_files', {}))
             uploaded_files[file_type] = file_path
+            store.set_setting('uploaded_files', uploaded_files)
             
             return jsonify({
                 'message': 'File uploaded successfully',
@@ -736,48 +689,44 @@ def google_signin():
         if not devices:
             return jsonify({'error': 'No devices selected'}), 400
         
-        if 'accounts' not in uploaded_files:
+        accounts_file = store.setting('uploaded_files', {}).get('accounts')
+        if not accounts_file or not os.path.exists(accounts_file):
             return jsonify({'error': 'No accounts file uploaded'}), 400
         
-        script_id = str(uuid.uuid4())
+        if data.get('priority', 'normal') not in JOB_PRIORITIES:
+            return jsonify({'error': f"priority must be one of {', '.join(JOB_PRIORITIES)}"}), 400
         
-        # Start Google Sign-in thread
-        thread = threading.Thread(
-            target=google_signin_thread,
-            args=(devices, uploaded_files['accounts'], script_id)
-        )
-        thread.daemon = True
-        thread.start()
-        
-        script_threads[script_id] = thread
+        # Queue the Google Sign-in job
+        job = job_manager.submit('Google sign-in', google_signin_job, (devices, accounts_file),
+                                 devices, data.get('priority', 'normal'))
         
         return jsonify({
             'message': 'Google Sign-in started',
-            'script_id': script_id
+            'script_id': job.id
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def google_signout_thread(devices, script_id):
-    """Google sign-out thread function"""
+def google_signout_job(job, devices):
+    """Google sign-out job"""
     try:
-        script_status[script_id] = {
-            'status': 'running', 
-            'progress': 0, 
-            'message': 'Starting Google sign-out automation',
-            'devices_processed': 0,
-            'total_devices': len(devices),
-            'successful_devices': 0,
-            'failed_devices': 0
-        }
+        job.update(
+            status='running',
+            progress=0,
+            message='Starting Google sign-out automation',
+            devices_processed=0,
+            total_devices=len(devices),
+            successful_devices=0,
+            failed_devices=0
+        )
         
         total_devices = len(devices)
         successful_count = 0
         failed_count = 0
         
         for i, device_id in enumerate(devices):
-            if script_status[script_id]['status'] == 'stopped':
+            if job.cancelled:
                 break
             
             # Check if device is connected
@@ -787,90 +736,87 @@ def google_signout_thread(devices, script_id):
                 failed_count += 1
                 continue
                 
-            script_status[script_id]['message'] = f'Signing out Google account on device {device_id}'
+            job.update(message=f'Signing out Google account on device {device_id}')
             device_success = True
             
-            try:
-                print(f"[DEBUG] Starting Google sign-out on device {device_id}")
+            with job.step(device_id, 'sign out', lock=('input', 'exclusive')) as step:
+                try:
+                    print(f"[DEBUG] Starting Google sign-out on device {device_id}")
                 
-                # Open Android Settings -> Accounts
-                settings_result = run_adb_command('shell am start -a android.settings.SYNC_SETTINGS', device_id)
-                if not settings_result['success']:
-                    print(f"[DEBUG] Failed to open account settings on device {device_id}")
-                    failed_count += 1
-                    device_success = False
-                    continue
+                    # Open Android Settings -> Accounts
+                    settings_result = run_adb_command('shell am start -a android.settings.SYNC_SETTINGS', device_id)
+                    if not settings_result['success']:
+                        print(f"[DEBUG] Failed to open account settings on device {device_id}")
+                        failed_count += 1
+                        device_success = step['success'] = False
+                        continue
                 
-                time.sleep(3)  # Wait for settings to load
+                    job.sleep(3)  # Wait for settings to load
                 
-                # Look for Google account in the list and tap on it
-                # Try multiple common positions for Google account
-                run_adb_command('shell input tap 540 400', device_id)  # First Google account position
-                time.sleep(2)
+                    # Look for Google account in the list and tap on it
+                    # Try multiple common positions for Google account
+                    run_adb_command('shell input tap 540 400', device_id)  # First Google account position
+                    job.sleep(2)
                 
-                # Try alternative position if first didn't work
-                run_adb_command('shell input tap 540 500', device_id)  # Second Google account position
-                time.sleep(2)
+                    # Try alternative position if first didn't work
+                    run_adb_command('shell input tap 540 500', device_id)  # Second Google account position
+                    job.sleep(2)
                 
-                # Look for "Remove account" or "More" menu
-                # Tap on menu button (3 dots) in top right
-                run_adb_command('shell input tap 950 200', device_id)
-                time.sleep(1)
+                    # Look for "Remove account" or "More" menu
+                    # Tap on menu button (3 dots) in top right
+                    run_adb_command('shell input tap 950 200', device_id)
+                    job.sleep(1)
                 
-                # Tap on "Remove account" option
-                run_adb_command('shell input tap 540 300', device_id)
-                time.sleep(2)
+                    # Tap on "Remove account" option
+                    run_adb_command('shell input tap 540 300', device_id)
+                    job.sleep(2)
                 
-                # Confirm removal by tapping "Remove account" button
-                run_adb_command('shell input tap 700 600', device_id)
-                time.sleep(2)
+                    # Confirm removal by tapping "Remove account" button
+                    run_adb_command('shell input tap 700 600', device_id)
+                    job.sleep(2)
                 
-                # Alternative method: Try scrolling down to find remove option
-                run_adb_command('shell input swipe 540 800 540 400', device_id)  # Scroll down
-                time.sleep(1)
+                    # Alternative method: Try scrolling down to find remove option
+                    run_adb_command('shell input swipe 540 800 540 400', device_id)  # Scroll down
+                    job.sleep(1)
                 
-                # Look for "Remove account" text and tap
-                run_adb_command('shell input tap 540 700', device_id)
-                time.sleep(2)
+                    # Look for "Remove account" text and tap
+                    run_adb_command('shell input tap 540 700', device_id)
+                    job.sleep(2)
                 
-                # Confirm the removal
-                run_adb_command('shell input tap 700 600', device_id)
-                time.sleep(2)
+                    # Confirm the removal
+                    run_adb_command('shell input tap 700 600', device_id)
+                    job.sleep(2)
                 
-                # Go back to home
-                run_adb_command('shell input keyevent 3', device_id)  # Home button
-                time.sleep(2)
+                    # Go back to home
+                    run_adb_command('shell input keyevent 3', device_id)  # Home button
+                    job.sleep(2)
                 
-                # Verify account was removed by checking account list
-                verification_result = run_adb_command('shell dumpsys account', device_id)
-                if verification_result['success']:
-                    google_accounts = verification_result['output'].lower().count('google')
-                    print(f"[DEBUG] Google accounts remaining on device {device_id}: {google_accounts}")
+                    # Verify account was removed by checking account list
+                    verification_result = run_adb_command('shell dumpsys account', device_id)
+                    if verification_result['success']:
+                        google_accounts = verification_result['output'].lower().count('google')
+                        print(f"[DEBUG] Google accounts remaining on device {device_id}: {google_accounts}")
                 
-                if device_success:
-                    successful_count += 1
-                    print(f"[DEBUG] Google sign-out completed on device {device_id}")
+                    if device_success:
+                        successful_count += 1
+                        print(f"[DEBUG] Google sign-out completed on device {device_id}")
                 
-            except Exception as e:
-                print(f"[DEBUG] Error during Google sign-out on device {device_id}: {e}")
-                failed_count += 1
-                device_success = False
+                except Exception as e:
+                    print(f"[DEBUG] Error during Google sign-out on device {device_id}: {e}")
+                    failed_count += 1
+                    device_success = step['success'] = False
             
             # Update progress
-            script_status[script_id]['devices_processed'] = i + 1
-            script_status[script_id]['successful_devices'] = successful_count
-            script_status[script_id]['failed_devices'] = failed_count
-            script_status[script_id]['progress'] = int(((i + 1) / total_devices) * 100)
+            job.update(devices_processed=i + 1, successful_devices=successful_count, failed_devices=failed_count,
+                       progress=int(((i + 1) / total_devices) * 100))
             
-            time.sleep(2)  # Small delay between devices
+            job.sleep(2)  # Small delay between devices
         
-        if script_status[script_id]['status'] != 'stopped':
-            script_status[script_id]['status'] = 'completed'
-            script_status[script_id]['message'] = f'Google sign-out completed: {successful_count} successful, {failed_count} failed out of {total_devices} devices'
+        if not job.cancelled:
+            job.update(status='completed', message=f'Google sign-out completed: {successful_count} successful, {failed_count} failed out of {total_devices} devices')
         
     except Exception as e:
-        script_status[script_id]['status'] = 'error'
-        script_status[script_id]['message'] = f'Error during Google sign-out: {str(e)}'
+        job.update(status='error', message=f'Error during Google sign-out: {str(e)}')
         print(f"[DEBUG] Google sign-out error: {e}")
         import traceback
         traceback.print_exc()
@@ -885,21 +831,16 @@ def google_signout():
         if not devices:
             return jsonify({'error': 'No devices selected'}), 400
         
-        script_id = str(uuid.uuid4())
-        
-        # Start Google Sign-out thread
-        thread = threading.Thread(
-            target=google_signout_thread,
-            args=(devices, script_id)
-        )
-        thread.daemon = True
-        thread.start()
+        if data.get('priority', 'normal') not in JOB_PRIORITIES:
+            return jsonify({'error': f"priority must be one of {', '.join(JOB_PRIORITIES)}"}), 400
         
-        script_threads[script_id] = thread
+        # Queue the Google Sign-out job
+        job = job_manager.submit('Google sign-out', google_signout_job, (devices,), devices,
+                                 data.get('priority', 'normal'))
         
         return jsonify({
             'message': 'Google Sign-out started',
-            'script_id': script_id
+            'script_id': job.id
         })
         
     except Exception as e:
@@ -907,34 +848,165 @@ def google_signout():
 
 @scripts_bp.route('/status/<script_id>', methods=['GET'])
 def get_script_status(script_id):
-    """Get script execution status"""
+    """Get script execution status (add ?steps=1 for per-step timings, ?log=1 for its log lines)
+    
+    With ?since=<version> this is a long-poll: it waits up to ?wait seconds
+    (default 25) for the job to change and returns only the deltas after
+    that version, or a fresh snapshot if they are no longer kept. Scripts
+    evicted from the in-memory history are answered from the database.
+    """
     try:
-        if script_id in script_status:
-            return jsonify(script_status[script_id])
-        else:
+        steps = request.args.get('steps') in ('1', 'true')
+        log = request.args.get('log') in ('1', 'true')
+        job = job_manager.get(script_id)
+        if job is None:
+            stored = store.job(script_id, steps, log)
+            if stored is None:
+                return jsonify({'error': 'Script not found'}), 404
+            return jsonify(stored)
+        if request.args.get('since') is None:
+            return jsonify(job.snapshot(steps, log))
+        
+        try:
+            since = int(request.args['since'])
+            wait = min(float(request.args.get('wait', 25)), STATUS_LONG_POLL_MAX)
+        except ValueError:
+            return jsonify({'error': 'since must be a version number and wait a number of seconds'}), 400
+        deltas = job.changes(since, max(0, wait))
+        if deltas is None:
+            snapshot = job.snapshot()
+            return jsonify({'version': snapshot['version'], 'snapshot': snapshot, 'finished': job.finished})
+        return jsonify({
+            'version': deltas[-1][0] if deltas else since,
+            'deltas': [dict(delta, version=version) for version, delta in deltas],
+            'finished': job.finished
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@scripts_bp.route('/status/<script_id>/events', methods=['GET'])
+def script_status_events(script_id):
+    """Server-Sent Events with a script's status changes
+    
+    Starts with a `snapshot` event, then sends a `delta` event (only the
+    changed fields) whenever the job changes, and `end` once it has
+    finished. Every event carries the job version as its id, so a client
+    reconnecting with Last-Event-ID (or ?since=) only gets what it missed.
+    A script evicted from the in-memory history has finished: it gets its
+    stored snapshot and `end` straight away.
+    """
+    try:
+        job = job_manager.get(script_id)
+        stored = store.job(script_id) if job is None else None
+        if job is None and stored is None:
             return jsonify({'error': 'Script not found'}), 404
+        since = request.headers.get('Last-Event-ID') or request.args.get('since')
+        try:
+            since = int(since) if since else None
+        except ValueError:
+            return jsonify({'error': 'Last-Event-ID must be a version number'}), 400
+        
+        def event(name, version, data):
+            return f"id: {version}\nevent: {name}\ndata: {json.dumps(data)}\n\n"
+        
+        def replay():
+            yield 'retry: 2000\n\n'
+            yield event('snapshot', stored['version'], stored)
+            yield event('end', stored['version'], {'status': stored['status']})
+        
+        def generate():
+            version = since
+            yield 'retry: 2000\n\n'
+            while True:
+                deltas = job.changes(version, STATUS_KEEPALIVE) if version is not None else None
+                if deltas is None:
+                    # New watcher, or it missed more than is kept: start from a snapshot
+                    snapshot = job.snapshot()
+                    version = snapshot['version']
+                    yield event('snapshot', version, snapshot)
+                    continue
+                if deltas:
+                    for delta_version, delta in deltas:
+                        yield event('delta', delta_version, delta)
+                    version = deltas[-1][0]
+                elif job.finished:
+                    yield event('end', version, {'status': job.status})
+                    return
+                else:
+                    yield ': keepalive\n\n'
+        
+        response = Response(generate() if job is not None else replay(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @scripts_bp.route('/stop/<script_id>', methods=['POST'])
 def stop_script(script_id):
-    """Stop script execution"""
+    """Stop script execution: a queued script never starts, a running one stops after its current step"""
     try:
-        if script_id in script_status:
-            script_status[script_id]['status'] = 'stopped'
-            return jsonify({'message': 'Script stopped'})
+        job = job_manager.cancel(script_id)
+        if job is not None:
+            return jsonify({'message': 'Script stopped', 'status': job.status})
         else:
             return jsonify({'error': 'Script not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@scripts_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Queued, running and recently finished scripts, newest first, plus worker pool stats"""
+    try:
+        return jsonify({
+            'jobs': [job.snapshot() for job in reversed(job_manager.list())],
+            'stats': job_manager.stats(),
+            'persistence': store.status()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@scripts_bp.route('/jobs/export', methods=['GET'])
+def export_jobs():
+    """Stored scripts as NDJSON, oldest first: one {"job": ..., "events": [...]} per line
+    
+    Filters: ?status=, ?since= and ?until= (creation time, epoch seconds);
+    ?events=0 leaves out the status deltas.
+    """
+    try:
+        status = request.args.get('status') or None
+        try:
+            since = float(request.args['since']) if request.args.get('since') else None
+            until = float(request.args['until']) if request.args.get('until') else None
+        except ValueError:
+            return jsonify({'error': 'since and until must be epoch seconds'}), 400
+        events = request.args.get('events', '1') not in ('0', 'false')
+        
+        def generate():
+            for row in store.export(status, since, until, events):
+                yield json.dumps(row) + '\n'
+        
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.headers['Content-Disposition'] = f'attachment; filename=jobs-{int(time.time())}.jsonl'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @scripts_bp.route('/custom-command', methods=['POST'])
 def custom_command():
-    """Execute custom ADB commands on multiple devices"""
+    """Execute custom ADB commands on multiple devices
+    
+    Devices run in parallel (up to CUSTOM_COMMAND_WORKERS at a time), each
+    with its own timeout (seconds, default ADB_COMMAND_TIMEOUT). With
+    "stream": "ndjson" or "sse" every device's result is sent as soon as it
+    completes, followed by a summary; otherwise all results and the summary
+    come in one response.
+    """
     try:
         data = request.get_json()
-        devices = data.get('devices', [])
+        devices = list(dict.fromkeys(data.get('devices', [])))
         command = data.get('command', '')
+        stream_format = data.get('stream') or request.args.get('stream')
         
         if not devices:
             return jsonify({'error': 'No devices selected'}), 400
@@ -942,13 +1014,80 @@ def custom_command():
         if not command:
             return jsonify({'error': 'No command provided'}), 400
         
-        results = {}
+        if stream_format not in (None, 'ndjson', 'sse'):
+            return jsonify({'error': 'Invalid stream. Use ndjson or sse'}), 400
         
-        for device_id in devices:
-            result = run_adb_command(command, device_id)
-            results[device_id] = result
+        try:
+            timeout = float(data.get('timeout', ADB_COMMAND_TIMEOUT))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'timeout must be a number'}), 400
+        if not 0 < timeout <= CUSTOM_COMMAND_MAX_TIMEOUT:
+            return jsonify({'error': f'timeout must be between 0 and {CUSTOM_COMMAND_MAX_TIMEOUT} seconds'}), 400
+        
+        def timed_command(device_id):
+            start = time.time()
+            result = run_adb_command(command, device_id, timeout)
+            return dict(result, duration_ms=int((time.time() - start) * 1000))
+        
+        def run_all():
+            """Yield (device_id, result) as devices finish, then the summary"""
+            started = time.time()
+            futures = {command_executor.submit(timed_command, device_id): device_id for device_id in devices}
+            failed = []
+            slowest = None
+            try:
+                for future in as_completed(futures):
+                    device_id = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'success': False, 'output': '', 'error': str(e), 'duration_ms': None}
+                    if not result['success']:
+                        failed.append(device_id)
+                    if result['duration_ms'] is not None and (slowest is None or result['duration_ms'] > slowest[1]):
+                        slowest = (device_id, result['duration_ms'])
+                    yield device_id, result
+                
+                yield None, {
+                    'total': len(devices),
+                    'succeeded': len(devices) - len(failed),
+                    'failed': len(failed),
+                    'failed_devices': failed,
+                    'slowest_device': slowest[0] if slowest else None,
+                    'max_duration_ms': slowest[1] if slowest else None,
+                    'workers': CUSTOM_COMMAND_WORKERS,
+                    'timeout': timeout,
+                    'duration_ms': int((time.time() - started) * 1000)
+                }
+            finally:
+                # Client went away: don't start devices nobody is waiting for
+                for future in futures:
+                    future.cancel()
+        
+        if stream_format is None:
+            results = {}
+            for device_id, result in run_all():
+                if device_id is None:
+                    return jsonify({'results': results, 'summary': result})
+                results[device_id] = result
+        
+        def encode(record):
+            if stream_format == 'sse':
+                return f"data: {json.dumps(record)}\n\n"
+            return json.dumps(record) + '\n'
+        
+        def generate():
+            for device_id, result in run_all():
+                if device_id is None:
+                    yield encode(dict(result, type='summary'))
+                else:
+                    yield encode(dict(result, type='result', device_id=device_id))
         
-        return jsonify({'results': results})
+        mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+        response = Response(generate(), mimetype=mimetype)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -988,32 +1127,19 @@ def youtube_automation():
             print(f"[DEBUG] No videos or channel URL provided, returning error")
             return jsonify({"success": False, "message": "No videos or channel URL provided"})
         
-        # Generate unique script ID
-        script_id = str(uuid.uuid4())
-        print(f"[DEBUG] Generated script ID: {script_id}")
+        if data.get("priority", "normal") not in JOB_PRIORITIES:
+            return jsonify({"success": False, "message": f"priority must be one of {', '.join(JOB_PRIORITIES)}"})
         
-        # Initialize script status immediately
-        script_status[script_id] = {"status": "starting", "progress": 0, "message": "Initializing YouTube automation"}
-        print(f"[DEBUG] Initialized script status for {script_id}")
-        
-        # Start automation in background thread
-        print(f"[DEBUG] Creating thread for youtube_automation_thread with args: devices={devices}, videos={videos}, options={options}, script_id={script_id}, channel_url={channel_url}, custom_durations={custom_durations}, content_filter={content_filter}")
-        thread = threading.Thread(
-            target=youtube_automation_thread,
-            args=(devices, videos, options, script_id, channel_url, custom_durations, content_filter)
-        )
-        thread.daemon = True
-        print(f"[DEBUG] Starting thread...")
-        thread.start()
-        print(f"[DEBUG] Thread started successfully")
-        
-        # Store thread reference
-        script_threads[script_id] = thread
+        # Queue the automation job
+        job = job_manager.submit('YouTube automation', youtube_automation_job,
+                                 (devices, videos, options, channel_url, custom_durations, content_filter),
+                                 devices, data.get('priority', 'normal'))
+        print(f"[DEBUG] Queued YouTube automation as job {job.id}")
         
         return jsonify({
             "success": True,
             "message": "YouTube automation started",
-            "script_id": script_id
+            "script_id": job.id
         })
         
     except Exception as e:
@@ -1402,7 +1528,7 @@ def vpn_automation():
 
 @scripts_bp.route('/install-vpn-app', methods=['POST'])
 def install_vpn_app():
-    """Install VPN app on selected devices"""
+    """Install VPN app on selected devices (a deployment of apps/vpn.apk, see /deploy)"""
     try:
         data = request.get_json()
         devices = data.get('devices', [])
@@ -1411,51 +1537,126 @@ def install_vpn_app():
             return jsonify({'error': 'No devices selected'}), 400
         
         # Path to the VPN APK file
-        apk_path = os.path.join(os.getcwd(), 'apps', 'vpn.apk')
+        apk_path = os.path.join(APPS_FOLDER, 'vpn.apk')
         
         # Check if APK file exists
         if not os.path.exists(apk_path):
             return jsonify({'error': 'VPN APK file not found at /apps/vpn.apk'}), 400
         
+        deployment = start_deployment([Apk.from_file(apk_path)], devices, wait=True)
+        
         results = []
-        for device_id in devices:
-            try:
-                # Install the APK using adb install command
-                result = run_adb_command(f'install "{apk_path}"', device_id)
-                
-                if result['success']:
-                    # Check if installation was successful by looking for success message
-                    if 'Success' in result.get('output', '') or result.get('output', '').strip() == '':
-                        results.append({
-                            'device': device_id,
-                            'success': True,
-                            'message': 'VPN app installed successfully'
-                        })
-                    else:
-                        results.append({
-                            'device': device_id,
-                            'success': False,
-                            'message': f'Installation failed: {result.get("output", "Unknown error")}'
-                        })
-                else:
-                    results.append({
-                        'device': device_id,
-                        'success': False,
-                        'message': f'ADB command failed: {result.get("error", "Unknown error")}'
-                    })
-                    
-            except Exception as e:
-                results.append({
-                    'device': device_id,
-                    'success': False,
-                    'message': f'Error: {str(e)}'
-                })
+        for device_id, device in deployment.to_dict()['devices'].items():
+            if device['state'] == 'installed':
+                message = 'VPN app installed successfully'
+            elif device['state'] == 'skipped':
+                message = 'VPN app already installed'
+            else:
+                message = f"Installation failed: {device['error'] or 'Unknown error'}"
+            results.append({
+                'device': device_id,
+                'success': device['state'] in ('installed', 'skipped'),
+                'message': message
+            })
         
         return jsonify({
             'message': 'VPN app installation completed',
+            'deployment_id': deployment.id,
             'results': results
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _form_list(value):
+    """A list from a form field holding a JSON list or comma separated values"""
+    if not value:
+        return []
+    try:
+        parsed = json.loads(value)
+        if isinstance(parsed, list):
+            return parsed
+    except ValueError:
+        pass
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+@scripts_bp.route('/deploy', methods=['POST'])
+def deploy_apk():
+    """Install an app (one APK, or a base APK plus splits) on many devices
+    
+    Multipart: one or more "apk" files and the fields below; or JSON with
+    "apks": names of files in the apps folder. Fields: devices, concurrency
+    (devices worked on at once), force (install even if the same build is
+    installed), downgrade. Runs in the background unless ?wait=1; follow it
+    with GET /deploy/<deployment_id>.
+    """
+    uploaded = []  # saved uploads, until the deployment takes them over
+    try:
+        # APKs are far larger than the app-wide MAX_CONTENT_LENGTH; uploads are spooled to disk
+        request.max_content_length = DEPLOY_UPLOAD_MAX
+        try:
+            has_files = bool(request.files)
+        except RequestEntityTooLarge:
+            return jsonify({'error': f'Upload larger than {DEPLOY_UPLOAD_MAX // (1024 * 1024)} MB; '
+                                     f'copy the APKs to {APPS_FOLDER} and deploy them by name '
+                                     'with {"apks": [...]} instead'}), 413
+        if has_files:
+            data = request.form
+            devices = _form_list(data.get('devices'))
+            apks = []
+            for file in request.files.getlist('apk'):
+                if not file.filename.lower().endswith('.apk'):
+                    return jsonify({'error': f'Not an APK: {file.filename}'}), 400
+                # A path of its own, so concurrent deployments of same-named APKs never share a file
+                file_path = os.path.join(UPLOAD_FOLDER, f"apk_{uuid.uuid4().hex}_{secure_filename(file.filename)}")
+                file.save(file_path)
+                uploaded.append(file_path)
+                apks.append(Apk.from_file(file_path, file.filename))
+        else:
+            data = request.get_json(silent=True) or {}
+            devices = data.get('devices') or []
+            apks = []
+            for name in data.get('apks') or []:
+                apk_path = os.path.join(APPS_FOLDER, secure_filename(name))
+                if not os.path.exists(apk_path):
+                    return jsonify({'error': f'APK not found in apps folder: {name}'}), 400
+                apks.append(Apk.from_file(apk_path))
+        
+        if not devices:
+            return jsonify({'error': 'No devices selected'}), 400
+        
+        if not apks:
+            return jsonify({'error': 'No APK provided'}), 400
+        
+        try:
+            concurrency = int(data.get('concurrency', DEPLOY_CONCURRENCY))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'concurrency must be a number'}), 400
+        flag = lambda value: str(value).lower() in ('1', 'true', 'yes')
+        wait = flag(request.args.get('wait', '0'))
+        
+        try:
+            deployment = start_deployment(apks, devices, concurrency, flag(data.get('force', False)),
+                                          flag(data.get('downgrade', False)), wait, uploaded)
+        except ApkError as e:
+            return jsonify({'error': str(e)}), 400
+        uploaded = []  # deleted by the deployment when it finishes
+        
+        return jsonify(deployment.to_dict()), 200 if wait else 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        remove_files(uploaded)
+
+@scripts_bp.route('/deploy/<deployment_id>', methods=['GET'])
+def get_deployment(deployment_id):
+    """Progress of a deployment: every device's state, bytes pushed and throughput"""
+    try:
+        deployment = deployments.get(deployment_id)
+        if deployment is None:
+            return jsonify({'error': 'Deployment not found'}), 404
+        return jsonify(deployment.to_dict())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
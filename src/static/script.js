@@ -1,7 +1,8 @@
 // Global variables
 let devices = [];
+let devicesVersion = null;  // device registry version the list was last brought up to
 let currentScriptId = null;
-let scriptStatusInterval = null;
+let scriptStatusSource = null;
 
 // DOM elements - will be initialized after DOM loads
 let sidebarToggle, sidebar, menuItems, contentSections, pageTitle, refreshDevicesBtn, deviceCount, dashboardDeviceCount;
@@ -548,7 +549,7 @@ function initializeApp() {
 function setupEventListeners() {
     // Refresh devices
     if (refreshDevicesBtn) {
-        refreshDevicesBtn.addEventListener('click', loadDevices);
+        refreshDevicesBtn.addEventListener('click', () => loadDevices(true));
     }
     
     // File uploads
@@ -1023,16 +1024,26 @@ function showSection(sectionId) {
     }
 }
 
-async function loadDevices() {
+async function loadDevices(full = false) {
     try {
-        const response = await fetch('/api/devices');
+        // After the first load only ask for what changed; 304 means nothing did
+        const known = !full && devicesVersion !== null;
+        const response = await fetch(known ? `/api/devices?since=${devicesVersion}` : '/api/devices', {
+            headers: known ? {'If-None-Match': `"devices-${devicesVersion}"`} : {}
+        });
+        if (response.status === 304) return;
         const data = await response.json();
         
         if (response.ok) {
-            devices = data.devices || [];
+            devicesVersion = data.version ?? null;
+            if (data.devices) {
+                devices = data.devices;
+                updateDevicesGrid();
+                updateDeviceSelectionLists();
+            } else {
+                applyDeviceChanges(data.changed || [], data.removed || []);
+            }
             updateDeviceCount();
-            updateDevicesGrid();
-            updateDeviceSelectionLists();
             updateDashboard();
             
             // Update device VPN status if we're on the VPN automation section
@@ -1087,8 +1098,12 @@ function updateDevicesGrid() {
         return;
     }
     
-    grid.innerHTML = devices.map(device => `
-        <div class="device-card">
+    grid.innerHTML = devices.map(renderDeviceCard).join('');
+}
+
+function renderDeviceCard(device) {
+    return `
+        <div class="device-card" data-device-id="${device.id}">
             <div class="device-header">
                 <div class="device-name-container">
                     <span class="device-name" data-device-id="${device.id}">${device.name || device.id}</span>
@@ -1115,48 +1130,107 @@ function updateDevicesGrid() {
 
             </div>
         </div>
-    `).join('');
+    `;
 }
 
-function updateDeviceSelectionLists() {
-    const lists = [
-        'youtubeDeviceList', 
-        'urlDeviceList', 'signinDeviceList', 'vpnDeviceList', 'appDeviceList', 
-        'wifiDeviceList', 'customDeviceList'
-    ];
+// Apply a device list delta in place, leaving untouched cards and checkboxes alone
+function applyDeviceChanges(changed, removed) {
+    if (changed.length === 0 && removed.length === 0) return;
     
-    lists.forEach(listId => {
+    devices = devices.filter(device => !removed.includes(device.id));
+    changed.forEach(device => {
+        const index = devices.findIndex(d => d.id === device.id);
+        if (index >= 0) {
+            devices[index] = device;
+        } else {
+            devices.push(device);
+        }
+    });
+    
+    const grid = document.getElementById('devicesGrid');
+    if (grid && (devices.length === 0 || !grid.querySelector('.device-card'))) {
+        updateDevicesGrid();
+    } else if (grid) {
+        removed.forEach(deviceId => grid.querySelector(`.device-card[data-device-id="${deviceId}"]`)?.remove());
+        changed.forEach(device => replaceOrAppend(grid, `.device-card[data-device-id="${device.id}"]`, renderDeviceCard(device)));
+    }
+    
+    deviceSelectionListIds.forEach(listId => {
         const list = document.getElementById(listId);
         if (!list) return;
-        
-        if (devices.length === 0) {
-            list.innerHTML = '<p class="no-devices">No devices available</p>';
+        if (devices.length === 0 || !list.querySelector('.device-checkbox')) {
+            updateDeviceSelectionList(list, listId);
             return;
         }
-        
-        list.innerHTML = devices.map(device => `
-            <div class="device-checkbox">
-                <input type="checkbox" id="${listId}_${device.id}" value="${device.id}" onchange="updateButtonStates()">
-                <label for="${listId}_${device.id}" class="device-checkbox-label-enhanced">
-                    <div class="device-name-container">
-                        <span class="device-name" data-device-id="${device.id}">${device.name || device.id}</span>
-                        <button class="edit-name-btn" data-device-id="${device.id}" title="Edit name" onclick="editDeviceName('${device.id}'); event.preventDefault(); event.stopPropagation();">
-                            <i class="fas fa-edit"></i>
-                        </button>
-                    </div>
-                    <div class="device-details">
-                        <span class="device-model">${device.brand} ${device.model}</span>
-                        <span class="device-android">Android ${device.android_version}</span>
-                    </div>
+        removed.forEach(deviceId => list.querySelector(`.device-checkbox[data-device-id="${deviceId}"]`)?.remove());
+        changed.forEach(device => {
+            const selector = `.device-checkbox[data-device-id="${device.id}"]`;
+            const checked = list.querySelector(`${selector} input`)?.checked;
+            const item = replaceOrAppend(list, selector, renderDeviceCheckbox(listId, device));
+            item.querySelector('input').checked = !!checked;
+        });
+    });
+    updateButtonStates();
+}
 
-                </label>
-            </div>
-        `).join('');
+function replaceOrAppend(container, selector, html) {
+    const template = document.createElement('template');
+    template.innerHTML = html.trim();
+    const element = template.content.firstElementChild;
+    const existing = container.querySelector(selector);
+    if (existing) {
+        existing.replaceWith(element);
+    } else {
+        container.appendChild(element);
+    }
+    return element;
+}
+
+const deviceSelectionListIds = [
+    'youtubeDeviceList', 
+    'urlDeviceList', 'signinDeviceList', 'vpnDeviceList', 'appDeviceList', 
+    'wifiDeviceList', 'customDeviceList'
+];
+
+function updateDeviceSelectionLists() {
+    deviceSelectionListIds.forEach(listId => {
+        const list = document.getElementById(listId);
+        if (list) updateDeviceSelectionList(list, listId);
     });
     
     updateButtonStates();
 }
 
+function updateDeviceSelectionList(list, listId) {
+    if (devices.length === 0) {
+        list.innerHTML = '<p class="no-devices">No devices available</p>';
+        return;
+    }
+    
+    list.innerHTML = devices.map(device => renderDeviceCheckbox(listId, device)).join('');
+}
+
+function renderDeviceCheckbox(listId, device) {
+    return `
+        <div class="device-checkbox" data-device-id="${device.id}">
+            <input type="checkbox" id="${listId}_${device.id}" value="${device.id}" onchange="updateButtonStates()">
+            <label for="${listId}_${device.id}" class="device-checkbox-label-enhanced">
+                <div class="device-name-container">
+                    <span class="device-name" data-device-id="${device.id}">${device.name || device.id}</span>
+                    <button class="edit-name-btn" data-device-id="${device.id}" title="Edit name" onclick="editDeviceName('${device.id}'); event.preventDefault(); event.stopPropagation();">
+                        <i class="fas fa-edit"></i>
+                    </button>
+                </div>
+                <div class="device-details">
+                    <span class="device-model">${device.brand} ${device.model}</span>
+                    <span class="device-android">Android ${device.android_version}</span>
+                </div>
+
+            </label>
+        </div>
+    `;
+}
+
 function updateButtonStates() {
     // Update button states based on selections and requirements
     
@@ -2058,6 +2132,17 @@ async function launchApp() {
 
 
 
+function renderCommandResult(deviceId, result) {
+    return `
+        <div class="result-card ${result.success ? 'result-success' : 'result-error'}">
+            <h4>${deviceId}</h4>
+            <p><strong>Status:</strong> ${result.success ? 'Success' : 'Failed'}${result.duration_ms != null ? ` (${result.duration_ms} ms)` : ''}</p>
+            ${result.output ? `<p><strong>Output:</strong> ${result.output}</p>` : ''}
+            ${result.error ? `<p><strong>Error:</strong> ${result.error}</p>` : ''}
+        </div>
+    `;
+}
+
 async function executeCustomCommand() {
     const selectedDevices = getSelectedDevices('customDeviceList');
     const command = document.getElementById('customCommand').value.trim();
@@ -2065,32 +2150,50 @@ async function executeCustomCommand() {
     const resultsGrid = document.getElementById('resultsGrid');
     
     resultsContainer.style.display = 'block';
-    resultsGrid.innerHTML = '<div class="loading">Executing command...</div>';
+    resultsGrid.innerHTML = `<div class="loading">Executing command on ${selectedDevices.length} device(s)...</div>`;
     
     try {
+        // Results arrive one NDJSON line per device as each finishes
         const response = await fetch('/api/scripts/custom-command', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ devices: selectedDevices, command: command })
+            body: JSON.stringify({ devices: selectedDevices, command: command, stream: 'ndjson' })
         });
         
-        const data = await response.json();
-        
-        if (response.ok) {
-            const results = data.results;
-            resultsGrid.innerHTML = Object.entries(results).map(([deviceId, result]) => `
-                <div class="result-card ${result.success ? 'result-success' : 'result-error'}">
-                    <h4>${deviceId}</h4>
-                    <p><strong>Status:</strong> ${result.success ? 'Success' : 'Failed'}</p>
-                    ${result.output ? `<p><strong>Output:</strong> ${result.output}</p>` : ''}
-                    ${result.error ? `<p><strong>Error:</strong> ${result.error}</p>` : ''}
-                </div>
-            `).join('');
-            
-            showToast('Command executed', 'success');
-        } else {
+        if (!response.ok) {
+            const data = await response.json();
             resultsGrid.innerHTML = '<p class="error">Failed to execute command</p>';
             showToast(data.error || 'Failed to execute command', 'error');
+            return;
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const loading = resultsGrid.querySelector('.loading');
+        let buffer = '';
+        let summary = null;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const record = JSON.parse(line);
+                if (record.type === 'summary') {
+                    summary = record;
+                } else {
+                    loading.insertAdjacentHTML('beforebegin', renderCommandResult(record.device_id, record));
+                }
+            }
+        }
+        loading.remove();
+        
+        if (summary && summary.failed) {
+            showToast(`Command failed on ${summary.failed} of ${summary.total} device(s) (${summary.duration_ms} ms)`, 'warning');
+        } else {
+            showToast(summary ? `Command executed on ${summary.total} device(s) in ${summary.duration_ms} ms` : 'Command executed', 'success');
         }
     } catch (error) {
         resultsGrid.innerHTML = '<p class="error">Failed to execute command</p>';
@@ -2141,16 +2244,11 @@ async function checkWifiStatus() {
     }
     
     try {
-        const promises = selectedDevices.map(deviceId => 
-            fetch(`/api/devices/${deviceId}/info`)
-        );
-        
-        const responses = await Promise.all(promises);
-        const results = await Promise.all(responses.map(r => r.json()));
-        
-        results.forEach((result, i) => {
-            if (responses[i].ok) {
-                showToast(`${selectedDevices[i]}: ${result.wifi_status || 'Unknown'}`, 'info');
+        // One request for all devices; results arrive as each device answers
+        const ids = selectedDevices.map(encodeURIComponent).join(',');
+        await streamNdjson(`/api/devices/info?ids=${ids}`, record => {
+            if (record.type === 'device') {
+                showToast(`${record.device_id}: ${record.info.wifi_status || 'Unknown'}`, 'info');
             }
         });
     } catch (error) {
@@ -2158,15 +2256,43 @@ async function checkWifiStatus() {
     }
 }
 
+// Read a newline-delimited JSON response, calling onRecord for each line as it arrives
+async function streamNdjson(url, onRecord, options = {}) {
+    const response = await fetch(url, options);
+    if (!response.ok) {
+        const result = await response.json().catch(() => ({}));
+        throw new Error(result.error || `HTTP ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (line) onRecord(JSON.parse(line));
+        }
+    }
+    if (buffer.trim()) onRecord(JSON.parse(buffer));
+}
+
 // Device actions
 async function takeScreenshot(deviceId) {
     try {
-        const response = await fetch(`/api/devices/${deviceId}/screenshot`);
-        const result = await response.json();
+        const response = await fetch(`/api/devices/${encodeURIComponent(deviceId)}/screenshot.png`);
         
         if (response.ok) {
-            showScreenshotModal(result.screenshot, deviceId);
+            const image = await response.blob();
+            showScreenshotModal(URL.createObjectURL(image), deviceId);
         } else {
+            const result = await response.json();
             showToast(result.error || 'Failed to take screenshot', 'error');
         }
     } catch (error) {
@@ -2198,39 +2324,54 @@ async function takeAllScreenshots() {
 
 
 
-// Progress monitoring
+// Progress monitoring: the server pushes status changes as they happen
 function startScriptStatusMonitoring() {
-    if (scriptStatusInterval) {
-        clearInterval(scriptStatusInterval);
-    }
+    stopScriptStatusMonitoring();
+    if (!currentScriptId) return;
     
-    scriptStatusInterval = setInterval(async () => {
-        if (!currentScriptId) return;
+    // EventSource reconnects by itself, sending the last version it saw as Last-Event-ID
+    const source = new EventSource(`/api/scripts/status/${currentScriptId}/events`);
+    let status = {};
+    scriptStatusSource = source;
+    
+    source.addEventListener('snapshot', (event) => {
+        status = JSON.parse(event.data);
+        updateProgressModal(status);
+    });
+    
+    source.addEventListener('delta', (event) => {
+        const delta = JSON.parse(event.data);
+        // Step records and timings are not shown in the progress modal
+        delete delta.step;
+        delete delta.device_timing;
+        Object.assign(status, delta);
+        updateProgressModal(status);
+    });
+    
+    source.addEventListener('end', () => {
+        stopScriptStatusMonitoring();
         
-        try {
-            const response = await fetch(`/api/scripts/status/${currentScriptId}`);
-            const status = await response.json();
-            
-            if (response.ok) {
-                updateProgressModal(status);
-                
-                if (status.status === 'completed' || status.status === 'error' || status.status === 'stopped') {
-                    clearInterval(scriptStatusInterval);
-                    scriptStatusInterval = null;
-                    
-                    // Re-enable start button
-                    document.getElementById('startYouTubeAutomation').disabled = false;
-                    
-                    setTimeout(() => {
-                        closeProgressModal();
-                        updateDashboard();
-                    }, 2000);
-                }
-            }
-        } catch (error) {
-            console.error('Failed to get script status:', error);
+        // Re-enable start button
+        document.getElementById('startYouTubeAutomation').disabled = false;
+        
+        setTimeout(() => {
+            closeProgressModal();
+            updateDashboard();
+        }, 2000);
+    });
+    
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+            console.error('Script status stream closed');
         }
-    }, 1000);
+    };
+}
+
+function stopScriptStatusMonitoring() {
+    if (scriptStatusSource) {
+        scriptStatusSource.close();
+        scriptStatusSource = null;
+    }
 }
 
 async function stopCurrentScript() {
@@ -2265,15 +2406,16 @@ function updateProgressModal(status) {
 function closeProgressModal() {
     document.getElementById('progressModal').classList.remove('active');
     currentScriptId = null;
-    if (scriptStatusInterval) {
-        clearInterval(scriptStatusInterval);
-        scriptStatusInterval = null;
-    }
+    stopScriptStatusMonitoring();
 }
 
 function showScreenshotModal(screenshot, deviceId) {
     document.getElementById('screenshotTitle').textContent = `Screenshot - ${deviceId}`;
-    document.getElementById('screenshotImage').src = screenshot;
+    const image = document.getElementById('screenshotImage');
+    if (image.src.startsWith('blob:')) {
+        URL.revokeObjectURL(image.src);
+    }
+    image.src = screenshot;
     document.getElementById('screenshotModal').classList.add('active');
 }
 
@@ -2889,8 +3031,14 @@ async function editDeviceName(deviceId) {
 
 // Live View functionality
 let liveStreams = {};
+let liveStreamSubscribers = {};  // deviceId -> subscriber id sent by the server
 let currentLiveDevice = null;
+let liveVideoPlayers = {};  // deviceId -> H.264 player state
+let liveScreens = {};  // deviceId -> current screen contents, see getLiveScreen()
+let mosaicStream = null;  // thumbnails of all devices over one connection
 let isRecording = false;
+let liveDrag = null;  // pointer path being drawn on the live screen
+let suppressTapUntil = 0;  // the click that ends a drag is not a tap
 
 // Initialize live view when DOM is loaded
 document.addEventListener('DOMContentLoaded', function() {
@@ -2922,6 +3070,10 @@ document.addEventListener('DOMContentLoaded', function() {
     if (liveViewScreenshot) {
         liveViewScreenshot.addEventListener('click', takeLiveScreenshot);
     }
+    const liveViewVideo = document.getElementById('liveViewVideo');
+    if (liveViewVideo) {
+        liveViewVideo.addEventListener('click', toggleLiveVideo);
+    }
     if (liveViewRecord) {
         liveViewRecord.addEventListener('click', toggleRecording);
     }
@@ -2930,6 +3082,10 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     if (liveScreenOverlay) {
         liveScreenOverlay.addEventListener('click', handleScreenTap);
+        liveScreenOverlay.addEventListener('pointerdown', startScreenDrag);
+        liveScreenOverlay.addEventListener('pointermove', moveScreenDrag);
+        liveScreenOverlay.addEventListener('pointerup', endScreenDrag);
+        liveScreenOverlay.addEventListener('pointercancel', () => { liveDrag = null; });
     }
     
     // Control buttons
@@ -2991,26 +3147,6 @@ function updateLiveViewGrid() {
     `).join('');
 }
 
-function updateLivePreview(deviceId, imageData) {
-    const preview = document.getElementById(`preview-${deviceId}`);
-    if (preview) {
-        preview.innerHTML = `<img src="${imageData}" alt="Live Preview" style="max-width: 100%; max-height: 100%; object-fit: contain;">`;
-    }
-    
-    // Update modal if this device is currently being viewed
-    if (currentLiveDevice === deviceId) {
-        const liveScreenImage = document.getElementById("liveScreenImage");
-        const connectionStatus = document.getElementById("connectionStatus");
-        
-        if (liveScreenImage) {
-            liveScreenImage.src = imageData;
-        }
-        if (connectionStatus) {
-            connectionStatus.classList.add("hidden");
-        }
-    }
-}
-
 async function startLiveStream(deviceId) {
     try {
         if (liveStreams[deviceId]) {
@@ -3028,10 +3164,7 @@ async function startLiveStream(deviceId) {
             `;
         }
         
-        // Create EventSource for live stream
-        const eventSource = new EventSource(`/api/devices/${deviceId}/live-stream`);
-        
-        eventSource.onopen = function(event) {
+        const onOpen = function(event) {
             console.log("Live stream connection opened:", event);
             showToast(`Live stream connected for ${deviceId}`, "success");
             const connectionStatus = document.getElementById("connectionStatus");
@@ -3040,29 +3173,26 @@ async function startLiveStream(deviceId) {
             }
         };
 
-        eventSource.onmessage = function(event) {
-            try {
-                const data = JSON.parse(event.data);
-                
-                if (data.type === "screenshot") {
-                    updateLivePreview(deviceId, data.data);
-                } else if (data.type === "error") {
-                    console.error("Live stream error:", data.error);
-                    stopLiveStream(deviceId);
-                    showToast(`Live stream error for ${deviceId}: ${data.error}`, "error");
-                } else if (data.type === "connected") {
-                    console.log("Live stream connected message:", data.message);
-                } else if (data.type === "disconnected") {
-                    console.log("Live stream disconnected message:", data.message);
-                    stopLiveStream(deviceId);
-                    showToast(`Live stream disconnected for ${deviceId}: ${data.message}`, "info");
-                }
-            } catch (e) {
-                console.error("Error parsing live stream data:", e);
+        const onMessage = function(data) {
+            if (data.type === "screenshot" || data.type === "tiles") {
+                applyLiveFrame(deviceId, data);
+            } else if (data.type === "error") {
+                console.error("Live stream error:", data.error);
+                stopLiveStream(deviceId);
+                showToast(`Live stream error for ${deviceId}: ${data.error}`, "error");
+            } else if (data.type === "stream_stats") {
+                updateLiveStreamStats(deviceId, data);
+            } else if (data.type === "connected") {
+                console.log("Live stream connected message:", data.message);
+                liveStreamSubscribers[deviceId] = data.subscriber_id;
+            } else if (data.type === "disconnected") {
+                console.log("Live stream disconnected message:", data.message);
+                stopLiveStream(deviceId);
+                showToast(`Live stream disconnected for ${deviceId}: ${data.message}`, "info");
             }
         };
-        
-        eventSource.onerror = function(event) {
+
+        const onError = function(event) {
             console.error("Live stream connection error:", event);
             stopLiveStream(deviceId);
             showToast(`Live stream connection lost for ${deviceId}`, "error");
@@ -3073,8 +3203,28 @@ async function startLiveStream(deviceId) {
                     `<i class="fas fa-exclamation-triangle"></i> Connection Lost`;
             }
         };
+
+        // Only changed regions are sent after the first frame
+        const url = `/api/devices/${deviceId}/live-stream?tiles=1`;
+        let stream;
+        if (window.ReadableStream && window.createImageBitmap) {
+            // Raw image bytes, no base64 or JSON per frame
+            stream = openBinaryLiveStream(`${url}&transport=binary`, onOpen, onMessage, onError);
+        } else {
+            // Fallback: Server-Sent Events with base64 images
+            stream = new EventSource(url);
+            stream.onopen = onOpen;
+            stream.onmessage = function(event) {
+                try {
+                    onMessage(JSON.parse(event.data));
+                } catch (e) {
+                    console.error("Error parsing live stream data:", e);
+                }
+            };
+            stream.onerror = onError;
+        }
         
-        liveStreams[deviceId] = eventSource;
+        liveStreams[deviceId] = stream;
         
     } catch (error) {
         console.error("Error starting live stream:", error);
@@ -3088,21 +3238,17 @@ async function stopLiveStream(deviceId) {
             liveStreams[deviceId].close();
             delete liveStreams[deviceId];
             
-            // Stop backend stream
-            await fetch(`/api/devices/${deviceId}/live-stream`, {
-                method: 'DELETE'
-            });
-            
-            const preview = document.getElementById(`preview-${deviceId}`);
-            if (preview) {
-                preview.innerHTML = `
-                    <div class="live-screen-loading">
-                        <i class="fas fa-mobile-alt"></i>
-                        <span>Click to start live view</span>
-                    </div>
-                `;
+            // Detach only this viewer; others may still be watching the device
+            const subscriberId = liveStreamSubscribers[deviceId];
+            delete liveStreamSubscribers[deviceId];
+            if (subscriberId !== undefined) {
+                await fetch(`/api/devices/${deviceId}/live-stream?subscriber=${subscriberId}`, {
+                    method: 'DELETE'
+                });
             }
             
+            resetLivePreview(deviceId);
+            
             showToast('Live stream stopped', 'info');
         }
     } catch (error) {
@@ -3111,19 +3257,167 @@ async function stopLiveStream(deviceId) {
     }
 }
 
-function updateLivePreview(deviceId, imageData) {
+const LIVE_BINARY_KINDS = { 1: 'screenshot', 2: 'tiles', 3: 'message' };
+const LIVE_BINARY_MIME = { 1: 'image/png', 2: 'image/jpeg', 3: 'image/webp' };
+
+function parseLiveRecord(bytes) {
+    // One binary live-stream record without its length prefix, see src/adb/stream.py
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    const kind = LIVE_BINARY_KINDS[view.getUint8(0)];
+    const mime = LIVE_BINARY_MIME[view.getUint8(1)];
+    const idLength = view.getUint16(2);
+    let offset = 24 + idLength;
+    if (kind === 'message') {
+        return JSON.parse(new TextDecoder().decode(bytes.subarray(offset)));
+    }
+    const data = {
+        type: kind,
+        device_id: new TextDecoder().decode(bytes.subarray(24, offset)),
+        seq: view.getUint32(4),
+        base_seq: view.getUint32(8),
+        timestamp: Number(view.getBigUint64(12)),
+        width: view.getUint16(20),
+        height: view.getUint16(22)
+    };
+    if (kind === 'screenshot') {
+        data.data = new Blob([bytes.subarray(offset)], { type: mime });
+        return data;
+    }
+    data.tiles = [];
+    const count = view.getUint16(offset);
+    offset += 2;
+    for (let i = 0; i < count; i++) {
+        const size = view.getUint32(offset + 8);
+        data.tiles.push({
+            x: view.getUint16(offset),
+            y: view.getUint16(offset + 2),
+            w: view.getUint16(offset + 4),
+            h: view.getUint16(offset + 6),
+            data: new Blob([bytes.subarray(offset + 12, offset + 12 + size)], { type: mime })
+        });
+        offset += 12 + size;
+    }
+    return data;
+}
+
+function openBinaryLiveStream(url, onOpen, onMessage, onError) {
+    // Reads length-prefixed records from a streamed response; close() like an EventSource
+    const controller = new AbortController();
+    (async () => {
+        const response = await fetch(url, { signal: controller.signal });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        onOpen(response);
+        const reader = response.body.getReader();
+        let buffer = new Uint8Array(0);
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            const joined = new Uint8Array(buffer.length + value.length);
+            joined.set(buffer);
+            joined.set(value, buffer.length);
+            let offset = 0;
+            while (joined.length - offset >= 4) {
+                const length = new DataView(joined.buffer, offset, 4).getUint32(0);
+                if (joined.length - offset - 4 < length) break;
+                if (length > 0) {  // zero length: keepalive
+                    onMessage(parseLiveRecord(joined.subarray(offset + 4, offset + 4 + length)));
+                }
+                offset += 4 + length;
+            }
+            buffer = joined.slice(offset);
+        }
+    })().catch(error => {
+        if (!controller.signal.aborted) {
+            onError(error);
+        }
+    });
+    return { close: () => controller.abort() };
+}
+
+function getLiveScreen(deviceId) {
+    // Offscreen copy of the device screen that full frames and tiles are drawn into
+    if (!liveScreens[deviceId]) {
+        liveScreens[deviceId] = { canvas: document.createElement('canvas'), seq: 0, queue: Promise.resolve() };
+    }
+    return liveScreens[deviceId];
+}
+
+function loadImage(src) {
+    const img = new Image();
+    img.src = src;
+    return img.decode().then(() => img);
+}
+
+function decodeLiveImage(source) {
+    // Blobs come from the binary transport, data URLs from SSE
+    return source instanceof Blob ? createImageBitmap(source) : loadImage(source);
+}
+
+function applyLiveFrame(deviceId, data) {
+    // Images decode asynchronously; the queue keeps frames in order
+    const screen = getLiveScreen(deviceId);
+    screen.queue = screen.queue.then(async () => {
+        const context = screen.canvas.getContext('2d');
+        if (data.type === 'screenshot') {
+            const img = await decodeLiveImage(data.data);
+            screen.canvas.width = img.naturalWidth || img.width;
+            screen.canvas.height = img.naturalHeight || img.height;
+            context.drawImage(img, 0, 0);
+        } else {
+            if (data.base_seq !== screen.seq) {
+                console.warn(`Live tiles for ${deviceId} do not match the current frame`);
+                return;
+            }
+            const images = await Promise.all(data.tiles.map(tile => decodeLiveImage(
+                tile.data instanceof Blob ? tile.data : `data:image/png;base64,${tile.data}`)));
+            data.tiles.forEach((tile, index) => context.drawImage(images[index], tile.x, tile.y));
+        }
+        screen.seq = data.seq;
+        updateLivePreview(deviceId);
+    }).catch(error => console.error('Error applying live frame:', error));
+}
+
+function updateLiveStreamStats(deviceId, stats) {
+    // Frame rate chosen by the server's governor, and why
+    const element = document.getElementById('liveViewStats');
+    if (!element || currentLiveDevice !== deviceId) return;
+    element.textContent = `${stats.effective_fps} fps`;
+    element.title = `Interval ${stats.interval}s: ${stats.interval_reason}` +
+        (stats.quality ? `\nQuality ${stats.quality}: ${stats.quality_reason}` : '') +
+        `\nDropped frames: ${stats.frames_dropped}`;
+}
+
+function copyCanvas(source, target) {
+    if (target.width !== source.width || target.height !== source.height) {
+        target.width = source.width;
+        target.height = source.height;
+    }
+    target.getContext('2d').drawImage(source, 0, 0);
+}
+
+function updateLivePreview(deviceId) {
+    const screen = liveScreens[deviceId];
+    if (!screen || !screen.canvas.width) return;
+    
     const preview = document.getElementById(`preview-${deviceId}`);
     if (preview) {
-        preview.innerHTML = `<img src="${imageData}" alt="Live Preview" style="max-width: 100%; max-height: 100%; object-fit: contain;">`;
+        let canvas = preview.querySelector('canvas');
+        if (!canvas) {
+            preview.innerHTML = '<canvas class="live-preview-canvas"></canvas>';
+            canvas = preview.querySelector('canvas');
+        }
+        copyCanvas(screen.canvas, canvas);
     }
     
     // Update modal if this device is currently being viewed
     if (currentLiveDevice === deviceId) {
-        const liveScreenImage = document.getElementById('liveScreenImage');
+        const liveScreenCanvas = document.getElementById('liveScreenCanvas');
         const connectionStatus = document.getElementById('connectionStatus');
         
-        if (liveScreenImage) {
-            liveScreenImage.src = imageData;
+        if (liveScreenCanvas) {
+            copyCanvas(screen.canvas, liveScreenCanvas);
         }
         if (connectionStatus) {
             connectionStatus.classList.add('hidden');
@@ -3131,17 +3425,55 @@ function updateLivePreview(deviceId, imageData) {
     }
 }
 
+function resetLivePreview(deviceId) {
+    delete liveScreens[deviceId];
+    const preview = document.getElementById(`preview-${deviceId}`);
+    if (preview) {
+        preview.innerHTML = `
+            <div class="live-screen-loading">
+                <i class="fas fa-mobile-alt"></i>
+                <span>Click to start live view</span>
+            </div>
+        `;
+    }
+}
+
 async function startAllLiveStreams() {
-    for (const device of devices) {
-        if (device.status === 'device') {
-            await startLiveStream(device.id);
-            // Small delay between starting streams
-            await new Promise(resolve => setTimeout(resolve, 500));
-        }
+    // One mosaic connection carries every device's thumbnail
+    if (mosaicStream) {
+        showToast("Live view already active for all devices", "warning");
+        return;
     }
+    
+    mosaicStream = new EventSource('/api/devices/mosaic');
+    mosaicStream.onmessage = function(event) {
+        try {
+            const data = JSON.parse(event.data);
+            // Devices with their own full-size stream are not overwritten by thumbnails
+            if (data.type === 'screenshot' && !liveStreams[data.device_id]) {
+                applyLiveFrame(data.device_id, data);
+            }
+        } catch (e) {
+            console.error("Error parsing mosaic data:", e);
+        }
+    };
+    mosaicStream.onerror = function(event) {
+        console.error("Mosaic connection error:", event);
+        stopAllLiveStreams();
+        showToast("Live view connection lost", "error");
+    };
 }
 
 async function stopAllLiveStreams() {
+    if (mosaicStream) {
+        mosaicStream.close();
+        mosaicStream = null;
+        for (const device of devices) {
+            if (!liveStreams[device.id]) {
+                resetLivePreview(device.id);
+            }
+        }
+    }
     for (const deviceId of Object.keys(liveStreams)) {
         await stopLiveStream(deviceId);
     }
@@ -3155,15 +3487,20 @@ function openLiveViewModal(deviceId) {
     
     const modal = document.getElementById('liveViewModal');
     const modalTitle = document.getElementById('liveViewModalTitle');
-    const liveScreenImage = document.getElementById('liveScreenImage');
+    const liveScreenCanvas = document.getElementById('liveScreenCanvas');
     const connectionStatus = document.getElementById('connectionStatus');
     
     if (modalTitle) {
         modalTitle.textContent = `${device.name || device.id} - Live View`;
     }
+    const liveViewStats = document.getElementById('liveViewStats');
+    if (liveViewStats) {
+        liveViewStats.textContent = '';
+    }
     
-    if (liveScreenImage) {
-        liveScreenImage.src = '';
+    if (liveScreenCanvas) {
+        liveScreenCanvas.width = 0;
+        liveScreenCanvas.height = 0;
     }
     
     if (connectionStatus) {
@@ -3176,12 +3513,17 @@ function openLiveViewModal(deviceId) {
     // Start live stream for this device if not already started
     if (!liveStreams[deviceId]) {
         startLiveStream(deviceId);
+    } else {
+        updateLivePreview(deviceId);
     }
 }
 
 function closeLiveViewModalHandler() {
     const modal = document.getElementById('liveViewModal');
     modal.style.display = 'none';
+    if (currentLiveDevice && liveVideoPlayers[currentLiveDevice]) {
+        stopLiveVideo(currentLiveDevice);
+    }
     currentLiveDevice = null;
     
     // Stop recording if active
@@ -3190,6 +3532,191 @@ function closeLiveViewModalHandler() {
     }
 }
 
+// H.264 live view: raw NAL units streamed by /live-video, decoded with WebCodecs
+
+function getLiveScreenSize() {
+    // Device pixels for touch input; the video may be scaled down
+    const player = liveVideoPlayers[currentLiveDevice];
+    if (player) {
+        const canvas = document.getElementById('liveScreenVideo');
+        return {
+            width: player.deviceWidth || canvas.width,
+            height: player.deviceHeight || canvas.height
+        };
+    }
+    const canvas = document.getElementById('liveScreenCanvas');
+    return { width: canvas ? canvas.width : 0, height: canvas ? canvas.height : 0 };
+}
+
+function splitNalUnits(bytes) {
+    // Returns the complete NAL units and the unfinished rest (from its start code)
+    const starts = [];
+    for (let i = 0; i + 2 < bytes.length; i++) {
+        if (bytes[i] === 0 && bytes[i + 1] === 0 && bytes[i + 2] === 1) {
+            starts.push(i + 3);
+            i += 2;
+        }
+    }
+    if (starts.length === 0) {
+        return [[], bytes];
+    }
+    const units = [];
+    for (let k = 0; k + 1 < starts.length; k++) {
+        let end = starts[k + 1] - 3;
+        while (end > starts[k] && bytes[end - 1] === 0) end--;
+        units.push(bytes.subarray(starts[k], end));
+    }
+    return [units, bytes.subarray(starts[starts.length - 1] - 3)];
+}
+
+function annexB(...units) {
+    const size = units.reduce((total, unit) => total + unit.length + 4, 0);
+    const data = new Uint8Array(size);
+    let offset = 0;
+    for (const unit of units) {
+        data.set([0, 0, 0, 1], offset);
+        data.set(unit, offset + 4);
+        offset += unit.length + 4;
+    }
+    return data;
+}
+
+function setLiveVideoMode(enabled) {
+    const button = document.getElementById('liveViewVideo');
+    const screenCanvas = document.getElementById('liveScreenCanvas');
+    const canvas = document.getElementById('liveScreenVideo');
+    if (button) {
+        button.dataset.video = enabled ? 'true' : 'false';
+        button.innerHTML = enabled ? '<i class="fas fa-image"></i> Screenshots' : '<i class="fas fa-film"></i> Video';
+    }
+    if (screenCanvas) screenCanvas.classList.toggle('hidden', enabled);
+    if (canvas) canvas.classList.toggle('hidden', !enabled);
+}
+
+async function toggleLiveVideo() {
+    if (!currentLiveDevice) return;
+    if (liveVideoPlayers[currentLiveDevice]) {
+        stopLiveVideo(currentLiveDevice);
+    } else {
+        startLiveVideo(currentLiveDevice);
+    }
+}
+
+async function startLiveVideo(deviceId) {
+    if (!('VideoDecoder' in window)) {
+        showToast('This browser cannot decode H.264 video, staying on screenshots', 'warning');
+        return;
+    }
+    
+    const canvas = document.getElementById('liveScreenVideo');
+    const context = canvas.getContext('2d');
+    const player = {
+        controller: new AbortController(),
+        decoder: null,
+        sps: null,
+        pps: null,
+        configuredSps: null,
+        waitingForKeyframe: true,
+        deviceWidth: 0,
+        deviceHeight: 0
+    };
+    liveVideoPlayers[deviceId] = player;
+    setLiveVideoMode(true);
+    
+    try {
+        const response = await fetch(`/api/devices/${deviceId}/live-video`, { signal: player.controller.signal });
+        if (!response.ok) {
+            const result = await response.json();
+            throw new Error(result.error || 'Failed to start live video');
+        }
+        const resolution = response.headers.get('X-Device-Resolution');
+        if (resolution) {
+            [player.deviceWidth, player.deviceHeight] = resolution.split('x').map(Number);
+        }
+        
+        player.decoder = new VideoDecoder({
+            output: frame => {
+                if (canvas.width !== frame.displayWidth || canvas.height !== frame.displayHeight) {
+                    canvas.width = frame.displayWidth;
+                    canvas.height = frame.displayHeight;
+                }
+                context.drawImage(frame, 0, 0);
+                frame.close();
+                const connectionStatus = document.getElementById('connectionStatus');
+                if (connectionStatus && currentLiveDevice === deviceId) {
+                    connectionStatus.classList.add('hidden');
+                }
+            },
+            error: error => console.error('Live video decode error:', error)
+        });
+        
+        const reader = response.body.getReader();
+        let pending = new Uint8Array(0);
+        let timestamp = 0;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            const bytes = new Uint8Array(pending.length + value.length);
+            bytes.set(pending);
+            bytes.set(value, pending.length);
+            const [units, rest] = splitNalUnits(bytes);
+            pending = rest;
+            
+            for (const nal of units) {
+                const type = nal[0] & 0x1f;
+                if (type === 7) {
+                    player.sps = nal.slice();
+                } else if (type === 8) {
+                    player.pps = nal.slice();
+                } else if (type === 1 || type === 5) {
+                    const keyframe = type === 5;
+                    if (keyframe && player.sps && player.pps && player.sps !== player.configuredSps) {
+                        // New parameter sets arrive with every screenrecord restart
+                        const profile = Array.from(player.sps.subarray(1, 4), b => b.toString(16).padStart(2, '0')).join('');
+                        player.decoder.configure({ codec: `avc1.${profile}`, optimizeForLatency: true });
+                        player.configuredSps = player.sps;
+                    }
+                    if (player.decoder.state !== 'configured') continue;
+                    if (!keyframe && player.decoder.decodeQueueSize > 10) {
+                        // Decoder is falling behind: skip ahead to the next keyframe
+                        player.waitingForKeyframe = true;
+                    }
+                    if (player.waitingForKeyframe && !keyframe) continue;
+                    player.waitingForKeyframe = false;
+                    player.decoder.decode(new EncodedVideoChunk({
+                        type: keyframe ? 'key' : 'delta',
+                        timestamp: timestamp,
+                        data: keyframe ? annexB(player.sps, player.pps, nal) : annexB(nal)
+                    }));
+                    timestamp += 33333;
+                }
+            }
+        }
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Live video error:', error);
+            showToast(`Live video error for ${deviceId}: ${error.message}`, 'error');
+        }
+    } finally {
+        if (liveVideoPlayers[deviceId] === player) {
+            stopLiveVideo(deviceId);
+        }
+    }
+}
+
+function stopLiveVideo(deviceId) {
+    const player = liveVideoPlayers[deviceId];
+    if (!player) return;
+    delete liveVideoPlayers[deviceId];
+    player.controller.abort();
+    if (player.decoder && player.decoder.state !== 'closed') {
+        player.decoder.close();
+    }
+    if (currentLiveDevice === deviceId) {
+        setLiveVideoMode(false);
+    }
+}
+
 async function takeLiveScreenshot() {
     if (!currentLiveDevice) return;
     
@@ -3362,17 +3889,73 @@ async function sendTextToDevice() {
     }
 }
 
+function toScreenPoint(event, element) {
+    // Device pixel coordinates of a pointer event on the live screen
+    const rect = element.getBoundingClientRect();
+    const screen = getLiveScreenSize();
+    if (!screen.width || !screen.height) return null;
+    return {
+        x: Math.round(((event.clientX - rect.left) / rect.width) * screen.width),
+        y: Math.round(((event.clientY - rect.top) / rect.height) * screen.height)
+    };
+}
+
+function startScreenDrag(event) {
+    if (!currentLiveDevice || event.button !== 0) return;
+    const point = toScreenPoint(event, event.currentTarget);
+    if (!point) return;
+    liveDrag = { start: performance.now(), clientX: event.clientX, clientY: event.clientY, points: [{ ...point, t: 0 }] };
+    event.currentTarget.setPointerCapture(event.pointerId);
+}
+
+function moveScreenDrag(event) {
+    if (!liveDrag) return;
+    const t = Math.round(performance.now() - liveDrag.start);
+    const last = liveDrag.points[liveDrag.points.length - 1];
+    if (t - last.t < 8) return;  // about one point per frame is plenty
+    const point = toScreenPoint(event, event.currentTarget);
+    if (point) liveDrag.points.push({ ...point, t });
+}
+
+async function endScreenDrag(event) {
+    const drag = liveDrag;
+    liveDrag = null;
+    if (!drag || !currentLiveDevice) return;
+    // Short movements stay taps
+    if (Math.hypot(event.clientX - drag.clientX, event.clientY - drag.clientY) < 10) return;
+    const point = toScreenPoint(event, event.currentTarget);
+    if (point) drag.points.push({ ...point, t: Math.round(performance.now() - drag.start) });
+    suppressTapUntil = performance.now() + 300;
+    
+    try {
+        const response = await fetch(`/api/devices/${currentLiveDevice}/control/gesture`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ points: drag.points })
+        });
+        const result = await response.json();
+        if (response.ok) {
+            console.log(`Gesture #${result.seq} (${result.method}) delivered in ${result.latency_ms} ms`);
+        } else {
+            showToast(result.error || 'Gesture failed', 'error');
+        }
+    } catch (error) {
+        showToast('Gesture error: ' + error.message, 'error');
+    }
+}
+
 async function handleScreenTap(event) {
     if (!currentLiveDevice) return;
+    if (performance.now() < suppressTapUntil) return;
     
     const rect = event.currentTarget.getBoundingClientRect();
-    const img = document.getElementById('liveScreenImage');
+    const screen = getLiveScreenSize();
     
-    if (!img || !img.naturalWidth || !img.naturalHeight) return;
+    if (!screen.width || !screen.height) return;
     
     // Calculate relative coordinates
-    const x = ((event.clientX - rect.left) / rect.width) * img.naturalWidth;
-    const y = ((event.clientY - rect.top) / rect.height) * img.naturalHeight;
+    const x = ((event.clientX - rect.left) / rect.width) * screen.width;
+    const y = ((event.clientY - rect.top) / rect.height) * screen.height;
     
     // Create tap effect
     const tapEffect = document.createElement('div');
@@ -3397,7 +3980,7 @@ async function handleScreenTap(event) {
         
         if (response.ok) {
             // Don't show toast for taps to avoid spam
-            console.log('Tap successful:', result.message);
+            console.log(`Tap #${result.seq} delivered in ${result.latency_ms} ms:`, result.message);
         } else {
             showToast(result.error || 'Tap failed', 'error');
         }
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.adb import client as adb_module
+from src.adb.client import AdbClient
+from src.adb.fake_server import FakeAdbServer, FakeDevice
+
+
+@pytest.fixture
+def fake_server():
+    server = FakeAdbServer([FakeDevice('FAKE0001'), FakeDevice('LEGACY01', features=[])]).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(fake_server):
+    return AdbClient(fake_server.host, fake_server.port, pool_size=0)
+
+
+@pytest.fixture
+def native(client, monkeypatch):
+    """run_adb_command served by a client connected to the fake server"""
+    monkeypatch.setattr(adb_module, 'adb_client', client)
+    monkeypatch.setattr(adb_module, 'ADB_NATIVE_CLIENT', True)
+    return client
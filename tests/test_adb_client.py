@@ -0,0 +1,144 @@
+import os
+import stat
+import struct
+
+import pytest
+
+from src.adb.client import AdbError, parse_device_list, run_adb_command
+from src.adb.fake_server import FakeDevice
+
+
+# Host services
+
+def test_host_version_and_devices(client):
+    assert client.version() == 41
+    assert client.devices() == [('FAKE0001', 'device'), ('LEGACY01', 'device')]
+
+
+def test_host_serial_requests(client):
+    assert client.get_state('FAKE0001').strip() == 'device'
+    assert client.get_serialno('FAKE0001').strip() == 'FAKE0001'
+    assert 'shell_v2' in client.features('FAKE0001')
+    assert 'shell_v2' not in client.features('LEGACY01')
+
+
+def test_unknown_device_fails(client):
+    with pytest.raises(AdbError):
+        client.get_state('MISSING')
+
+
+def test_track_devices_follows_changes(fake_server, client):
+    updates = client.track_devices()
+    assert next(updates) == [('FAKE0001', 'device'), ('LEGACY01', 'device')]
+    fake_server.add_device(FakeDevice('FAKE0002', state='unauthorized'))
+    assert ('FAKE0002', 'unauthorized') in next(updates)
+    updates.close()
+
+
+def test_parse_device_list():
+    assert parse_device_list('A\tdevice\nB\toffline\n') == [('A', 'device'), ('B', 'offline')]
+
+
+# Transport and shell
+
+def test_transport_to_offline_device_fails(fake_server, client):
+    fake_server.set_state('FAKE0001', 'offline')
+    with pytest.raises(AdbError):
+        client.shell('FAKE0001', 'true')
+
+
+def test_shell_v2_separates_streams_and_exit_code(client):
+    returncode, stdout, stderr = client.shell('FAKE0001', 'echo out; echo err >&2; false')
+    assert returncode == 1
+    assert stdout == b'out\n'
+    assert stderr == b'err\n'
+
+
+def test_shell_v2_reports_missing_command(client):
+    returncode, _, stderr = client.shell('FAKE0001', 'nosuchcommand')
+    assert returncode == 127
+    assert b'not found' in stderr
+
+
+def test_legacy_shell_recovers_exit_code(fake_server, client):
+    returncode, stdout, _ = client.shell('LEGACY01', 'echo hello; false')
+    assert returncode == 1
+    assert stdout == b'hello'
+    assert not any(request.startswith('shell,v2') for request in fake_server.requests)
+
+
+def test_getprop_through_shell(client):
+    _, stdout, _ = client.shell('FAKE0001', 'getprop ro.product.model')
+    assert stdout.strip() == b'Fake FAKE0001'
+
+
+# exec
+
+def test_exec_out_is_binary_safe(client):
+    png = client.exec_out('FAKE0001', 'screencap -p')
+    assert png.startswith(b'\x89PNG\r\n\x1a\n')
+    assert struct.unpack('>II', png[16:24]) == (1080 // 20, 2400 // 20)
+
+
+def test_exec_out_command_reports_failure(native):
+    result = run_adb_command('exec-out false', 'FAKE0001')
+    assert not result['success']
+    assert result['returncode'] == 1
+    assert run_adb_command('exec-out echo hi', 'FAKE0001')['output'] == 'hi'
+
+
+# sync
+
+def test_sync_push_stat_pull_roundtrip(fake_server, client):
+    data = os.urandom(200 * 1024)  # several DATA packets
+    client.push_bytes('FAKE0001', data, '/data/local/tmp/blob')
+    mode, size, _ = client.stat('FAKE0001', '/data/local/tmp/blob')
+    assert stat.S_ISREG(mode) and size == len(data)
+    assert client.pull_bytes('FAKE0001', '/data/local/tmp/blob') == data
+    assert fake_server.devices['FAKE0001'].files['/data/local/tmp/blob'] == data
+
+
+def test_sync_stat_missing_and_directory(fake_server, client):
+    fake_server.devices['FAKE0001'].files['/sdcard/dir/file'] = b'x'
+    assert client.stat('FAKE0001', '/sdcard/missing')[0] == 0
+    assert stat.S_ISDIR(client.stat('FAKE0001', '/sdcard/dir')[0])
+
+
+def test_sync_pull_missing_file_fails(client):
+    with pytest.raises(AdbError, match='does not exist'):
+        client.pull_bytes('FAKE0001', '/sdcard/missing')
+
+
+def test_pull_and_push_commands(native, fake_server, tmp_path):
+    device = fake_server.devices['FAKE0001']
+    device.files['/sdcard/a.txt'] = b'hello'
+    result = run_adb_command(f'pull /sdcard/a.txt {tmp_path}', 'FAKE0001')
+    assert result['success'], result
+    assert (tmp_path / 'a.txt').read_bytes() == b'hello'
+
+    local = tmp_path / 'b.txt'
+    local.write_bytes(b'world')
+    assert run_adb_command(f'push {local} /sdcard/', 'FAKE0001')['success']
+    assert device.files['/sdcard/b.txt'] == b'world'
+
+
+def test_pull_and_push_leave_directories_to_adb_binary(native, fake_server, tmp_path):
+    from src.adb.client import _run_native
+    device = fake_server.devices['FAKE0001']
+    device.files['/sdcard/dir/file'] = b'x'
+    local = tmp_path / 'c.txt'
+    local.write_bytes(b'c')
+    # Remote directory, local directory, existing remote directory without a trailing slash
+    assert _run_native(['pull', '/sdcard/dir', str(tmp_path)], 'FAKE0001', 5) is None
+    assert _run_native(['push', str(tmp_path), '/sdcard/'], 'FAKE0001', 5) is None
+    assert _run_native(['push', str(local), '/sdcard/dir'], 'FAKE0001', 5) is None
+    assert '/sdcard/dir' not in device.files
+
+
+def test_fake_pm_installs_with_injected_apk_reader(fake_server, client):
+    device = fake_server.devices['FAKE0001']
+    client.push_bytes('FAKE0001', b'apk', '/data/local/tmp/app.apk')
+    assert client.shell('FAKE0001', 'pm install /data/local/tmp/app.apk')[0] == 1  # no reader, not an APK
+    device.apk_reader = lambda data: {'package': 'com.example', 'versionCode': '3'}
+    assert client.shell('FAKE0001', 'pm install /data/local/tmp/app.apk')[0] == 0
+    assert client.shell('FAKE0001', 'pm path com.example')[1] == b'package:/data/app/com.example/0.apk\n'
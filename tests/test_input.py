@@ -0,0 +1,84 @@
+import time
+
+from src.adb.input import INPUT_STATUS_MARKER, InputQueue
+from src.adb.locks import lock_manager
+
+
+def input_lines(device):
+    """The `input ...` commands of each batch the device was sent"""
+    return [[part for part in command.split('; ') if part.startswith('input ')]
+            for command in device.commands if INPUT_STATUS_MARKER in command]
+
+
+def held_queue(device_id):
+    """An InputQueue whose worker has taken its first event and waits for the device's input"""
+    script = lock_manager.acquire(device_id, 'input', 'exclusive', owner='script', wait=0)
+    queue = InputQueue(device_id)
+    queue.submit('tap', [1, 1])
+    deadline = time.time() + 5
+    while queue.status()['depth']:
+        assert time.time() < deadline, 'worker did not take the event'
+        time.sleep(0.01)
+    return queue, script
+
+
+def test_events_sent_in_order_with_their_results(native, fake_server):
+    queue = InputQueue('FAKE0001')
+    events = [queue.submit('tap', [index, index])[1] for index in range(3)]
+    assert all(event.wait(5) and event.state == 'delivered' for event in events)
+    sent = [line for batch in input_lines(fake_server.devices['FAKE0001']) for line in batch]
+    assert sent == ['input tap 0 0', 'input tap 1 1', 'input tap 2 2']
+    status = queue.status()
+    assert status['last_seq'] == status['delivered_seq'] == 3 and status['failed'] == 0
+
+
+def test_pending_events_are_coalesced(native, fake_server):
+    queue, script = held_queue('FAKE0001')
+    submitted = [
+        queue.submit('key', ['3']),
+        queue.submit('key', ['4']),
+        queue.submit('text', ['hello ']),
+        queue.submit('text', ['world']),
+        queue.submit('swipe', [0, 0, 10, 10, 50], drag_id='d1'),
+        queue.submit('swipe', [10, 10, 20, 20, 50], drag_id='d1'),
+        queue.submit('swipe', [20, 20, 30, 30, 50], drag_id='d2'),
+        queue.submit('tap', [5, 5]),
+    ]
+    seqs = [seq for seq, _ in submitted]
+    events = [event for _, event in submitted]
+    assert seqs == list(range(2, 10))
+    assert events[0] is events[1] and events[2] is events[3] and events[4] is events[5]
+    assert events[5] is not events[6]
+    assert [event.seq for event in (events[1], events[3], events[5])] == [3, 5, 7]
+    assert queue.status()['depth'] == 5 and queue.status()['coalesced'] == 3
+    assert queue.result(2) is queue.result(3)
+
+    lock_manager.release(script)
+    assert events[-1].wait(5)
+    assert input_lines(fake_server.devices['FAKE0001']) == [
+        ['input tap 1 1'],
+        ['input keyevent 3 4', 'input text hello%sworld', 'input swipe 10 10 20 20 50',
+         'input swipe 20 20 30 30 50', 'input tap 5 5']]
+    status = queue.status()
+    assert status['batches'] == 2 and status['delivered_seq'] == 9 and status['events'] == 9
+
+
+def test_failed_event_reported_on_its_own(native, fake_server):
+    fake_server.devices['FAKE0001'].handlers['input'] = lambda args: (1 if args[0] == 'swipe' else 0, b'', b'')
+    queue, script = held_queue('FAKE0001')
+    _, swipe = queue.submit('swipe', [0, 0, 1, 1])
+    _, tap = queue.submit('tap', [2, 2])
+    lock_manager.release(script)
+    assert tap.wait(5)
+    assert swipe.state == 'failed' and 'exited with 1' in swipe.error
+    assert tap.state == 'delivered'
+    assert queue.status()['failed'] == 1
+
+
+def test_fail_pending(native):
+    queue, script = held_queue('FAKE0001')
+    _, event = queue.submit('key', ['26'])
+    queue.fail_pending('Device disconnected or not available')
+    assert event.state == 'failed' and event.error == 'Device disconnected or not available'
+    assert queue.status()['depth'] == 0
+    lock_manager.release(script)
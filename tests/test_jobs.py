@@ -0,0 +1,201 @@
+import threading
+import time
+
+from src.adb.jobs import Job, JobManager
+from src.adb.locks import lock_manager
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def blocked(manager):
+    """Submit a job that keeps the only worker busy until the returned event is set"""
+    release = threading.Event()
+    job = manager.submit('blocker', lambda job: release.wait(5))
+    wait_until(lambda: job.status == 'running')
+    return job, release
+
+
+# Queue
+
+def test_priority_order():
+    manager = JobManager(workers=1)
+    blocker, release = blocked(manager)
+    ran = []
+    jobs = [manager.submit(priority, lambda job, name: ran.append(name), (priority,), priority=priority)
+            for priority in ('low', 'normal', 'high', 'normal')]
+    release.set()
+    wait_until(lambda: all(job.finished for job in jobs))
+    assert ran == ['high', 'normal', 'normal', 'low']
+
+
+def test_cancel_queued_job_stops_it_without_running():
+    manager = JobManager(workers=1)
+    blocker, release = blocked(manager)
+    ran = []
+    job = manager.submit('queued', lambda job: ran.append(job.id))
+    assert manager.cancel(job.id, 'Not needed') is job
+    assert job.status == 'stopped' and job.snapshot()['message'] == 'Not needed'
+    assert job.finished_at is not None and job.fn is None
+    assert manager.stats()['queued'] == 0
+    release.set()
+    wait_until(lambda: blocker.finished)
+    time.sleep(0.05)
+    assert ran == [] and job.status == 'stopped'
+    assert manager.cancel('unknown') is None
+
+
+def test_cancel_running_job_stops_after_its_step():
+    manager = JobManager(workers=1)
+    started = threading.Event()
+    steps = []
+
+    def script(job):
+        while not job.cancelled:
+            with job.step('D1', f'step {len(steps)}'):
+                steps.append(job.version)
+                started.set()
+                job.sleep(0.02)
+
+    job = manager.submit('loop', script)
+    started.wait(5)
+    manager.cancel(job.id)
+    wait_until(lambda: job.finished)
+    assert job.status == 'stopped' and job.snapshot()['message'] == 'Stopped by user'
+    assert len(job.snapshot(steps=True)['steps']) == len(steps)
+
+
+def test_cancel_while_a_worker_takes_the_job():
+    manager = JobManager(workers=1)
+    taken = threading.Event()
+    go = threading.Event()
+    run = manager._run
+
+    def slow_run(job):
+        taken.set()
+        go.wait(5)
+        run(job)
+
+    manager._run = slow_run
+    statuses = []
+    manager.add_listener(lambda job, version, delta: statuses.append(delta.get('status')))
+    job = manager.submit('racing', lambda job: None)
+    taken.wait(5)
+    manager.cancel(job.id)
+    assert job.status == 'queued'  # the worker owns it; it stops it
+    go.set()
+    wait_until(lambda: job.finished)
+    assert job.status == 'stopped'
+    assert [status for status in statuses if status in ('stopped', 'error')] == ['stopped']
+
+
+# Steps
+
+def test_step_records_and_device_timing():
+    manager = JobManager(workers=1)
+
+    def script(job):
+        with job.step('D1', 'ok'):
+            pass
+        with job.step('D1', 'soft failure') as record:
+            record['success'] = False
+        try:
+            with job.step('D2', 'raises'):
+                raise RuntimeError('boom')
+        except RuntimeError:
+            pass
+
+    job = manager.submit('steps', script, devices=['D1', 'D2'])
+    wait_until(lambda: job.finished)
+    snapshot = job.snapshot(steps=True)
+    assert snapshot['status'] == 'completed'
+    assert [(step['device_id'], step['step'], step['success']) for step in snapshot['steps']] == [
+        ('D1', 'ok', True), ('D1', 'soft failure', False), ('D2', 'raises', False)]
+    assert all(step['duration_ms'] >= 0 and 'lock_wait_ms' not in step for step in snapshot['steps'])
+    assert {device: (timing['steps'], timing['failed']) for device, timing in snapshot['device_timing'].items()} == {
+        'D1': (2, 1), 'D2': (1, 1)}
+
+
+def test_step_lease_never_expires_and_is_released():
+    manager = JobManager(workers=1)
+    seen = []
+
+    def script(job):
+        with job.step('JOBLOCK1', 'typing', lock=('input', 'exclusive')) as record:
+            seen.append(lock_manager.holders('JOBLOCK1', 'input'))
+            record['success'] = True
+
+    job = manager.submit('locked', script)
+    wait_until(lambda: job.finished)
+    [holders] = seen
+    assert [(holder['owner'], holder['mode'], holder['expires_in']) for holder in holders] == [
+        ('job:locked', 'exclusive', None)]
+    assert lock_manager.holders('JOBLOCK1', 'input') == []
+    assert 'lock_wait_ms' in job.snapshot(steps=True)['steps'][0]
+
+
+# History
+
+def finished_jobs(manager, count):
+    jobs = [manager.submit(f'job {index}', lambda job: None) for index in range(count)]
+    wait_until(lambda: all(job.finished for job in jobs))
+    return jobs
+
+
+def test_history_trimmed_by_count_oldest_first():
+    manager = JobManager(workers=1, history_limit=2)
+    jobs = finished_jobs(manager, 4)
+    stats = manager.stats()
+    assert [job.id for job in manager.list()] == [job.id for job in jobs[2:]]
+    assert stats['evicted'] == 2 and stats['jobs'] == {'completed': 2}
+
+
+def test_history_trimmed_by_age_and_size_keeps_unfinished_jobs():
+    manager = JobManager(workers=1, history_max_age=0.05)
+    blocker, release = blocked(manager)
+    queued = manager.submit('queued', lambda job: None)
+    done = manager.submit('done', lambda job: None)
+    manager.cancel(done.id)
+    time.sleep(0.1)
+    assert manager.stats()['evicted'] == 1
+    assert manager.list() == [blocker, queued]
+
+    manager.history_max_age = 3600
+    manager.history_max_bytes = 1
+    release.set()
+    wait_until(lambda: queued.finished)
+    assert manager.list() == [] and manager.stats()['evicted'] == 3
+
+
+# Changes
+
+def test_changes_of_a_live_job():
+    job = Job('watched', None)
+    job.update(status='running')
+    job.update(progress=50)
+    assert [delta.get('progress') for _, delta in job.changes(1, 0)] == [50]
+    assert job.changes(0, 0)[0][1]['status'] == 'running'
+
+    threading.Timer(0.05, job.update, kwargs={'message': 'later'}).start()
+    [(version, delta)] = job.changes(2, 5)
+    assert version == 3 and delta['message'] == 'later'
+    assert job.changes(7, 0) is None
+
+
+def test_changes_of_a_restored_job_start_over_from_a_snapshot():
+    job = Job('restored', None)
+    job.fields['status'] = 'completed'
+    job.version = 12
+    JobManager().restore([job])
+    assert job.changes(12, 0) == []
+    assert job.changes(11, 0) is None
+    assert job.changes(0, 0) is None
+
+    job.update(status='error')  # kept from here on; what came before still is not
+    assert job.changes(13, 0) == []
+    assert job.changes(12, 0)[0][1]['status'] == 'error'
+    assert job.changes(11, 0) is None
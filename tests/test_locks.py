@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from src.adb.locks import LockManager, LockTimeout
+
+
+def in_thread(manager, granted, *args, **kwargs):
+    """acquire() in a thread of its own; appends (owner, claim) to granted once it has the lease"""
+    def run():
+        try:
+            granted.append((kwargs['owner'], manager.acquire(*args, **kwargs)))
+        except LockTimeout:
+            granted.append((kwargs['owner'], None))
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    time.sleep(0.05)  # queued in the order of the calls
+    return thread
+
+
+def test_shared_leases_are_held_together():
+    manager = LockManager()
+    first = manager.acquire('D1', 'input', 'shared', owner='a', wait=0)
+    second = manager.acquire('D1', 'input', 'shared', owner='b', wait=0)
+    assert [holder['owner'] for holder in manager.holders('D1', 'input')] == ['a', 'b']
+    with pytest.raises(LockTimeout) as error:
+        manager.acquire('D1', 'input', 'exclusive', owner='c', wait=0.05)
+    assert [holder['owner'] for holder in error.value.holders] == ['a', 'b']
+    assert manager.release(first) and manager.release(second)
+    assert not manager.release(second)
+    assert manager.acquire('D1', 'input', 'exclusive', owner='c', wait=0).granted
+
+
+def test_waiters_are_granted_first_come_first_served():
+    manager = LockManager()
+    held = manager.acquire('D1', 'package', 'exclusive', owner='holder', wait=0)
+    granted = []
+    threads = [in_thread(manager, granted, 'D1', 'package', 'exclusive', owner=owner, wait=5)
+               for owner in ('first', 'second', 'third')]
+    assert granted == []
+    manager.release(held)
+    for count in range(1, len(threads) + 1):
+        time.sleep(0.05)
+        assert len(granted) == count  # one exclusive holder at a time
+        manager.release(granted[-1][1])
+    for thread in threads:
+        thread.join(5)
+    assert [owner for owner, _ in granted] == ['first', 'second', 'third']
+
+
+def test_shared_request_waits_behind_a_queued_exclusive_one():
+    manager = LockManager()
+    reader = manager.acquire('D1', 'input', 'shared', owner='reader', wait=0)
+    granted = []
+    writer = in_thread(manager, granted, 'D1', 'input', 'exclusive', owner='writer', wait=5)
+    with pytest.raises(LockTimeout):
+        manager.acquire('D1', 'input', 'shared', owner='late reader', wait=0.1)
+    assert granted == []
+    manager.release(reader)
+    writer.join(5)
+    assert [owner for owner, _ in granted] == ['writer']
+    stats = manager.stats('D1')
+    [lock] = stats['locks']
+    assert lock['contended'] == 2 and lock['timeouts'] == 1
+    assert {(pair['waiter'], pair['holder']) for pair in stats['blocked_by']} == {
+        ('writer', 'reader'), ('late reader', 'reader'), ('late reader', 'writer')}
+
+
+def test_timed_out_waiter_lets_the_queue_behind_it_go():
+    manager = LockManager()
+    reader = manager.acquire('D1', 'input', 'shared', owner='reader', wait=0)
+    granted = []
+    in_thread(manager, granted, 'D1', 'input', 'exclusive', owner='impatient', wait=0.1)
+    other = in_thread(manager, granted, 'D1', 'input', 'shared', owner='other reader', wait=5)
+    other.join(5)
+    assert [(owner, claim is not None) for owner, claim in granted] == [('impatient', False), ('other reader', True)]
+    manager.release(reader)
+
+
+def test_lease_expires_when_someone_needs_the_resource():
+    manager = LockManager()
+    crashed = manager.acquire('D1', 'filesystem', 'exclusive', owner='crashed', wait=0, lease=0.1)
+    assert manager.holders('D1', 'filesystem')[0]['expires_in'] is not None
+    started = time.time()
+    claim = manager.acquire('D1', 'filesystem', 'exclusive', owner='next', wait=5)
+    assert claim.granted and time.time() - started < 1
+    assert not manager.release(crashed)
+    assert manager.stats('D1')['locks'][0]['expired'] == 1
+
+
+def test_lease_without_timeout_is_kept_until_released():
+    manager = LockManager()
+    recording = manager.acquire('D1', 'screen', 'exclusive', owner='recording', wait=0, lease=None)
+    assert manager.holders('D1', 'screen')[0]['expires_in'] is None
+    with pytest.raises(LockTimeout, match='recording'):
+        manager.acquire('D1', 'screen', 'exclusive', owner='live-video', wait=0.2)
+    assert manager.release(recording)
+    assert manager.stats('D1')['locks'][0]['expired'] == 0
+
+
+def test_unknown_resource_or_mode():
+    manager = LockManager()
+    with pytest.raises(ValueError):
+        manager.acquire('D1', 'camera')
+    with pytest.raises(ValueError):
+        manager.acquire('D1', 'input', 'read')
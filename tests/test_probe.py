@@ -0,0 +1,22 @@
+from src.adb.probe import parse_probe_output, parse_wifi
+
+
+def test_wifi_off_is_not_enabled():
+    output = 'Wifi is disabled\nWifi scanning is only available when wifi is enabled\n'
+    assert parse_wifi(output) == {'wifi_status': 'disabled'}
+
+
+def test_wifi_on():
+    assert parse_wifi('Wifi is enabled\nWifi is connected to "FakeNet"\n') == {'wifi_status': 'enabled'}
+
+
+def test_wifi_settings_fallback():
+    assert parse_wifi('0\n') == {'wifi_status': 'disabled'}
+    assert parse_wifi('2\n') == {'wifi_status': 'enabled'}
+    assert parse_wifi('') == {}
+
+
+def test_probe_output_split_on_markers():
+    output = (':::adbm-probe:resolution\nPhysical size: 1080x2400\nOverride size: 720x1600\n'
+              ':::adbm-probe:wifi\nWifi is disabled\n')
+    assert parse_probe_output(output, ['resolution', 'wifi']) == {'resolution': '720x1600', 'wifi_status': 'disabled'}
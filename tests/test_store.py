@@ -0,0 +1,126 @@
+import gzip
+import json
+import time
+
+import pytest
+from flask import Flask
+
+from src.adb.jobs import JobManager
+from src.models import store as store_module
+from src.models.job import JobEvent, JobRecord
+from src.models.store import Store
+from src.models.user import db
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A Store on a SQLite file of its own, recording the jobs of a JobManager of its own"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    manager = JobManager(workers=1, history_limit=1)
+    monkeypatch.setattr(store_module, 'job_manager', manager)
+    monkeypatch.setattr(store_module, 'JOB_ARCHIVE_DIR', str(tmp_path / 'archive'))
+    store = Store()
+    store.app = app  # no flusher thread: the tests flush
+    manager.add_listener(store._job_changed)
+    return store
+
+
+def run_jobs(store, count):
+    manager = store_module.job_manager
+    jobs = []
+    for index in range(count):
+        job = manager.submit(f'job {index}', lambda job: job.log('done'))
+        while not job.finished:
+            time.sleep(0.01)
+        jobs.append(job)
+    store.flush()
+    return jobs
+
+
+def stored_ids(store):
+    with store.app.app_context():
+        return [record.id for record in JobRecord.query.order_by(JobRecord.created_at)]
+
+
+# Retention
+
+def test_prune_archives_jobs_beyond_the_count(store, monkeypatch, tmp_path):
+    jobs = run_jobs(store, 3)
+    monkeypatch.setattr(store_module, 'PERSIST_JOB_MAX_COUNT', 1)
+    assert store.prune() == 2
+    assert stored_ids(store) == [jobs[2].id]
+    with store.app.app_context():
+        assert {event.job_id for event in JobEvent.query} == {jobs[2].id}
+
+    [archive] = (tmp_path / 'archive').iterdir()
+    assert archive.name == time.strftime('jobs-%Y-%m.jsonl.gz')
+    rows = [json.loads(line) for line in gzip.open(archive, 'rt')]
+    assert [row['job']['job_id'] for row in rows] == [jobs[0].id, jobs[1].id]
+    assert [event['version'] for event in rows[0]['events']] == list(range(1, jobs[0].version + 1))
+    assert store.stats['archived'] == 2
+
+
+def test_prune_archives_old_jobs_but_not_jobs_in_memory(store, monkeypatch, tmp_path):
+    jobs = run_jobs(store, 2)
+    monkeypatch.setattr(store_module, 'PERSIST_JOB_MAX_AGE', 0)
+    assert store.prune() == 1  # the newest job is still in the in-memory history
+    assert stored_ids(store) == [jobs[1].id]
+    assert store.prune() == 0
+
+    # A second run appends to the month's file
+    store_module.job_manager.history_limit = 0
+    store_module.job_manager.stats()
+    assert store.prune() == 1
+    [archive] = (tmp_path / 'archive').iterdir()
+    assert len(gzip.open(archive, 'rt').read().splitlines()) == 2
+
+
+def test_prune_within_limits_keeps_everything(store, tmp_path):
+    jobs = run_jobs(store, 2)
+    assert store.prune() == 0
+    assert stored_ids(store) == [job.id for job in jobs]
+    assert not (tmp_path / 'archive').exists()
+
+
+# Writing
+
+def test_job_events_written_once(store):
+    [job] = run_jobs(store, 1)
+    with store.app.app_context():
+        count = JobEvent.query.count()
+        assert count == job.version
+        events = [(event.job_id, event.version, event.time, event.delta) for event in JobEvent.query]
+        store._write_events(events + events[-1:])
+        db.session.commit()
+        assert JobEvent.query.count() == count
+
+
+# Restoring
+
+def test_restored_jobs(store, monkeypatch):
+    finished, _ = run_jobs(store, 2)
+    with store.app.app_context():
+        interrupted = JobRecord(id='interrupted', name='cut off', priority='normal', status='running', devices=['D1'],
+                                fields={'status': 'running', 'progress': 40, 'message': 'Step 2'},
+                                device_timing={}, created_at=time.time(), started_at=time.time(), version=7)
+        db.session.add(interrupted)
+        db.session.commit()
+        records = [db.session.get(JobRecord, finished.id), db.session.get(JobRecord, 'interrupted')]
+    manager = JobManager(workers=1, history_limit=5)  # as after a restart
+    monkeypatch.setattr(store_module, 'job_manager', manager)
+    store._restore_jobs(records)
+
+    restored = manager.get(finished.id)
+    assert restored is not finished and restored.snapshot() == finished.snapshot()
+    # Its deltas were not restored: a watcher behind it starts over from a snapshot
+    assert restored.changes(finished.version, 0) == []
+    assert restored.changes(finished.version - 1, 0) is None
+
+    job = manager.get('interrupted')
+    assert job.status == 'error' and job.snapshot()['message'] == 'Interrupted by a server restart'
+    assert job.finished_at is not None and job.version == 8
+    assert job.changes(7, 0)[0][1]['status'] == 'error'